@@ -0,0 +1,266 @@
+from sqlalchemy import Column, DateTime, Index, MetaData, Table, and_, create_engine, delete, insert, select, update
+from sqlalchemy.orm import Session, sessionmaker
+from app.database import DATABASE_URL, USE_SQLITE_PRODUCTION_PROFILE, SessionLocal, add_missing_columns, engine, _create_sqlite_engine
+from app.models import HelmetCheck, Ride, RideParticipant, RideStatus, RideTrailChunk, User, VerificationStatus
+from app.pagination import Keyset, newest_first
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+import os
+import time
+
+# Finished rides move to the archive database (a separate SQLite file by default;
+# point it at DATABASE_URL to keep the archive tables next to the hot ones)
+ARCHIVE_DATABASE_URL = os.getenv("ARCHIVE_DATABASE_URL", "sqlite:///./pillion_archive.db")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+ARCHIVABLE_STATUSES = (RideStatus.COMPLETED, RideStatus.CANCELLED)
+
+archive_metadata = MetaData()
+
+def _archive_table(source: Table, name: str, *extra) -> Table:
+    """Same columns as the hot table, without foreign keys (users stay in the hot database)"""
+    columns = [
+        Column(
+            column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+            server_default=column.server_default.arg if column.server_default is not None else None
+        )
+        for column in source.columns
+    ]
+    return Table(name, archive_metadata, *columns, *extra)
+
+archived_rides = _archive_table(Ride.__table__, "archived_rides", Column("archived_at", DateTime))
+archived_participants = _archive_table(RideParticipant.__table__, "archived_ride_participants")
+archived_helmet_checks = _archive_table(HelmetCheck.__table__, "archived_helmet_checks")
+archived_trail_chunks = _archive_table(RideTrailChunk.__table__, "archived_ride_trail_chunks")
+
+Index("ix_archived_rides_created_at", archived_rides.c.created_at, archived_rides.c.id)
+Index("ix_archived_ride_participants_ride_rider", archived_participants.c.ride_id, archived_participants.c.rider_id)
+Index("ix_archived_helmet_checks_ride_user", archived_helmet_checks.c.ride_id, archived_helmet_checks.c.user_id)
+Index(
+    "ix_archived_ride_trail_chunks_ride_user",
+    archived_trail_chunks.c.ride_id, archived_trail_chunks.c.user_id, archived_trail_chunks.c.started_at
+)
+Index(
+    "ix_archived_helmet_checks_user_created",
+    archived_helmet_checks.c.user_id, archived_helmet_checks.c.created_at, archived_helmet_checks.c.id
+)
+
+# (rides, ride_participants, helmet_checks) in each store, for queries that read both
+HOT_TABLES = (Ride.__table__, RideParticipant.__table__, HelmetCheck.__table__)
+ARCHIVE_TABLES = (archived_rides, archived_participants, archived_helmet_checks)
+
+def _create_archive_engine(url: str):
+    if url == DATABASE_URL:
+        return engine
+    if url.startswith("sqlite"):
+        if USE_SQLITE_PRODUCTION_PROFILE:
+            return _create_sqlite_engine(url, readonly=False)
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(url, pool_pre_ping=True)
+
+archive_engine = _create_archive_engine(ARCHIVE_DATABASE_URL)
+ArchiveSession = sessionmaker(autocommit=False, autoflush=False, bind=archive_engine)
+
+def create_archive_tables():
+    archive_metadata.create_all(bind=archive_engine)
+    add_missing_columns(archive_engine, archive_metadata.sorted_tables)
+    # Checks archived before verification_status existed
+    with archive_engine.begin() as connection:
+        connection.execute(update(archived_helmet_checks).where(
+            archived_helmet_checks.c.verification_status == VerificationStatus.PENDING,
+            archived_helmet_checks.c.is_verified.is_(True)
+        ).values(verification_status=VerificationStatus.VERIFIED))
+
+def _archivable_ride_ids(db: Session, cutoff: datetime, limit: int) -> List[int]:
+    return [ride_id for (ride_id,) in db.query(Ride.id).filter(
+        Ride.status.in_(ARCHIVABLE_STATUSES),
+        Ride.updated_at < cutoff
+    ).limit(limit)]
+
+def count_archivable_rides(older_than_days: float = ARCHIVE_AFTER_DAYS) -> int:
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        return db.query(Ride.id).filter(
+            Ride.status.in_(ARCHIVABLE_STATUSES),
+            Ride.updated_at < cutoff
+        ).count()
+    finally:
+        db.close()
+
+def archive_batch(ride_ids: List[int]) -> dict:
+    """Move a batch of rides with their participants and helmet checks to the archive
+
+    The archive copy is committed first and replaces rows left behind by an
+    interrupted run, then the hot rows are deleted by the ids that were copied.
+    A crash between the two commits only means the batch is repeated, and
+    reads see the ride in the hot tables until then.
+    """
+    hot = SessionLocal()
+    cold = ArchiveSession()
+    try:
+        rides = hot.execute(select(Ride.__table__).where(Ride.id.in_(ride_ids))).mappings().all()
+        participants = hot.execute(
+            select(RideParticipant.__table__).where(RideParticipant.ride_id.in_(ride_ids))
+        ).mappings().all()
+        checks = hot.execute(
+            select(HelmetCheck.__table__).where(HelmetCheck.ride_id.in_(ride_ids))
+        ).mappings().all()
+        trail_chunks = hot.execute(
+            select(RideTrailChunk.__table__).where(RideTrailChunk.ride_id.in_(ride_ids))
+        ).mappings().all()
+        archived_at = datetime.utcnow()
+
+        for table, column, rows in (
+            (archived_trail_chunks, archived_trail_chunks.c.ride_id, [dict(row) for row in trail_chunks]),
+            (archived_helmet_checks, archived_helmet_checks.c.ride_id, [dict(row) for row in checks]),
+            (archived_participants, archived_participants.c.ride_id, [dict(row) for row in participants]),
+            (archived_rides, archived_rides.c.id, [{**row, "archived_at": archived_at} for row in rides]),
+        ):
+            cold.execute(delete(table).where(column.in_(ride_ids)))
+            if rows:
+                cold.execute(insert(table), rows)
+        cold.commit()
+
+        hot.execute(delete(RideTrailChunk.__table__).where(RideTrailChunk.id.in_([row["id"] for row in trail_chunks])))
+        hot.execute(delete(HelmetCheck.__table__).where(HelmetCheck.id.in_([row["id"] for row in checks])))
+        hot.execute(delete(RideParticipant.__table__).where(
+            RideParticipant.id.in_([row["id"] for row in participants])
+        ))
+        hot.execute(delete(Ride.__table__).where(Ride.id.in_([row["id"] for row in rides])))
+        hot.commit()
+        return {
+            "rides": len(rides), "participants": len(participants),
+            "helmet_checks": len(checks), "trail_chunks": len(trail_chunks)
+        }
+    finally:
+        hot.close()
+        cold.close()
+
+def archive_finished_rides(
+    older_than_days: float = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+    pause_seconds: float = 0.0
+) -> dict:
+    """Archive COMPLETED/CANCELLED rides last updated more than older_than_days ago
+
+    Runs in short batches, each its own pair of transactions, so the hot
+    database is never locked for long. The hot tables are the work queue:
+    stopping at any point (or max_batches) and running again resumes where it
+    left off.
+    """
+    create_archive_tables()
+    # The candidate scan relies on ix_rides_status_updated (maybe not built yet if the API never started)
+    for index in Ride.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    totals = {"batches": 0, "rides": 0, "participants": 0, "helmet_checks": 0, "trail_chunks": 0}
+    while max_batches is None or totals["batches"] < max_batches:
+        db = SessionLocal()
+        try:
+            ride_ids = _archivable_ride_ids(db, cutoff, batch_size)
+        finally:
+            db.close()
+        if not ride_ids:
+            break
+
+        moved = archive_batch(ride_ids)
+        totals["batches"] += 1
+        for key, value in moved.items():
+            totals[key] += value
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    totals["cutoff"] = cutoff.isoformat()
+    return totals
+
+def archived_ride(ride_id: int):
+    """Archived ride row (attribute access like a Ride), or None"""
+    db = ArchiveSession()
+    try:
+        return db.execute(select(archived_rides).where(archived_rides.c.id == ride_id)).first()
+    finally:
+        db.close()
+
+def archived_helmet_check(user_id: int, ride_id: int):
+    db = ArchiveSession()
+    try:
+        return db.execute(select(archived_helmet_checks).where(
+            archived_helmet_checks.c.user_id == user_id,
+            archived_helmet_checks.c.ride_id == ride_id
+        )).first()
+    finally:
+        db.close()
+
+def archived_helmet_checks_page(user_id: int, after: Optional[Keyset], limit: int) -> list:
+    db = ArchiveSession()
+    try:
+        query = select(archived_helmet_checks).where(archived_helmet_checks.c.user_id == user_id)
+        return db.execute(newest_first(
+            query, archived_helmet_checks.c.created_at, archived_helmet_checks.c.id, after, limit
+        )).all()
+    finally:
+        db.close()
+
+def archived_ride_helmet_rows(db: Session, ride_id: int) -> List[tuple]:
+    """ride_helmet_rows for an archived ride (rider names come from the hot users table)"""
+    cold = ArchiveSession()
+    try:
+        rows = cold.execute(select(
+            archived_rides.c.host_id,
+            archived_participants.c.rider_id,
+            archived_participants.c.status,
+            archived_helmet_checks.c.id,
+            archived_helmet_checks.c.is_verified,
+            archived_helmet_checks.c.image_url,
+            archived_helmet_checks.c.created_at,
+            archived_helmet_checks.c.has_variants
+        ).select_from(archived_rides).outerjoin(
+            archived_participants,
+            and_(
+                archived_participants.c.ride_id == archived_rides.c.id,
+                archived_participants.c.status != "cancelled"
+            )
+        ).outerjoin(
+            archived_helmet_checks,
+            and_(
+                archived_helmet_checks.c.ride_id == archived_rides.c.id,
+                archived_helmet_checks.c.user_id == archived_participants.c.rider_id
+            )
+        ).where(archived_rides.c.id == ride_id)).all()
+    finally:
+        cold.close()
+
+    rider_ids = {row.rider_id for row in rows if row.rider_id is not None}
+    names = dict(db.query(User.id, User.full_name).filter(User.id.in_(rider_ids)).all()) if rider_ids else {}
+    return [
+        (host_id, rider_id, status, names.get(rider_id), check_id, is_verified, image_url, checked_at, has_variants)
+        for host_id, rider_id, status, check_id, is_verified, image_url, checked_at, has_variants in rows
+    ]
+
+def archived_trail_chunks_of(ride_id: int) -> List[tuple]:
+    """(user_id, points, data) of an archived ride's trail, oldest first"""
+    db = ArchiveSession()
+    try:
+        return db.execute(select(
+            archived_trail_chunks.c.user_id, archived_trail_chunks.c.points, archived_trail_chunks.c.data
+        ).where(archived_trail_chunks.c.ride_id == ride_id).order_by(
+            archived_trail_chunks.c.started_at, archived_trail_chunks.c.id
+        )).all()
+    finally:
+        db.close()
+
+def archived_image_urls(batch_size: int = 5000) -> Iterator[str]:
+    """Image URLs of archived helmet checks (still referenced for garbage collection)"""
+    db = ArchiveSession()
+    try:
+        rows = db.execute(
+            select(archived_helmet_checks.c.image_url),
+            execution_options={"yield_per": batch_size}
+        )
+        for (url,) in rows:
+            yield url
+    finally:
+        db.close()
@@ -1,10 +1,14 @@
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_read_db, read_router
 from app.models import User
+from collections import OrderedDict
+from typing import Optional
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,42 +18,37 @@ security = HTTPBearer()
 SUPABASE_JWT_SECRET = os.getenv("JWT_SECRET")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 
-async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Verify Supabase JWT token"""
-    token = credentials.credentials
-    
+# How long a Supabase id -> user id lookup is reused for WebSocket connects
+WS_AUTH_CACHE_SECONDS = float(os.getenv("WS_AUTH_CACHE_SECONDS", "300"))
+
+def decode_token(token: str) -> Optional[dict]:
+    """Claims of a valid Supabase JWT, or None"""
     try:
-        # Decode JWT token
-        payload = jwt.decode(
+        return jwt.decode(
             token, 
             SUPABASE_JWT_SECRET, 
             algorithms=["HS256"],
             audience="authenticated"
         )
-        
-        # Extract user ID from token
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        return {"supabase_id": user_id, "email": payload.get("email")}
-        
     except JWTError:
+        return None
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Verify Supabase JWT token"""
+    payload = decode_token(credentials.credentials)
+    
+    # Extract user ID from token
+    user_id: Optional[str] = payload.get("sub") if payload else None
+    if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    
+    return {"supabase_id": user_id, "email": payload.get("email")}
 
-async def get_current_user(
-    token_data: dict = Depends(verify_token),
-    db: Session = Depends(get_db)
-):
-    """Get current user from database using token data"""
+def _load_user(db: Session, token_data: dict) -> User:
     user = db.query(User).filter(User.supabase_id == token_data["supabase_id"]).first()
     
     if user is None:
@@ -58,4 +57,74 @@ async def get_current_user(
             detail="User not found"
         )
     
-    return user
\ No newline at end of file
+    return user
+
+async def get_current_user(
+    token_data: dict = Depends(verify_token),
+    db: Session = Depends(get_db)
+):
+    """Get current user from database using token data"""
+    return _load_user(db, token_data)
+
+async def get_current_user_readonly(
+    token_data: dict = Depends(verify_token),
+    db: Session = Depends(get_read_db)
+):
+    """Get current user through the read-only session (for read routes)"""
+    return _load_user(db, token_data)
+
+class UserIdCache:
+    """Supabase id -> user id, so WebSocket connects rarely touch the database
+
+    A miss borrows a read session for a single primary-key-sized query and
+    returns it to the pool straight away. The query runs in the threadpool,
+    so waiting for a pooled connection never blocks the event loop; a hit
+    answers without leaving it. Unknown users are not cached, so a user who
+    registers can connect at once.
+    """
+
+    def __init__(self, ttl_seconds: float = WS_AUTH_CACHE_SECONDS, max_entries: int = 100000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"hits": 0, "lookups": 0}
+
+    def _lookup(self, supabase_id: str) -> Optional[int]:
+        db = read_router.session()
+        try:
+            row = db.query(User.id).filter(User.supabase_id == supabase_id).first()
+        finally:
+            db.close()
+        return row[0] if row else None
+
+    async def get(self, supabase_id: str) -> Optional[int]:
+        entry = self._entries.get(supabase_id)
+        if entry is not None and time.monotonic() - entry[1] <= self.ttl_seconds:
+            self.stats["hits"] += 1
+            return entry[0]
+
+        self.stats["lookups"] += 1
+        now = time.monotonic()
+        user_id = await run_in_threadpool(self._lookup, supabase_id)
+        if user_id is None:
+            self._entries.pop(supabase_id, None)
+            return None
+        self._entries[supabase_id] = (user_id, now)
+        self._entries.move_to_end(supabase_id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return user_id
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "entries": len(self._entries)}
+
+# Global cache for WebSocket authentication
+websocket_user_ids = UserIdCache()
+
+async def user_id_from_token(token: str) -> Optional[int]:
+    """User id for a WebSocket token (no session is held afterwards)"""
+    payload = decode_token(token)
+    supabase_id = payload.get("sub") if payload else None
+    if supabase_id is None:
+        return None
+    return await websocket_user_ids.get(supabase_id)
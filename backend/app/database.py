@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from fastapi import Request
+from app.read_routing import ReplicaRouter, sticky_key_from_headers
 import os
 from dotenv import load_dotenv
 
@@ -9,17 +11,143 @@ load_dotenv()
 # Use SQLite for development, PostgreSQL for production
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./pillion.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+# SQLite tuning: "development" keeps the stock single engine,
+# "production" enables WAL, tuned pragmas and a separate read-only engine
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "development")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "32"))
+# SQLite still commits one writer at a time. Write-route sessions also run their reads and
+# Python work on this engine and hold the connection meanwhile, so a 1-connection pool queues
+# all of that behind each write. A small pool overlaps it; the write lock itself is only held
+# from the first DML to commit, and busy_timeout covers that short wait.
+SQLITE_WRITE_POOL_SIZE = int(os.getenv("SQLITE_WRITE_POOL_SIZE", "8"))
+
+# Read replicas (comma-separated URLs) for read-only routes, e.g. PostgreSQL streaming replicas
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_POLICY = os.getenv("REPLICA_POLICY", "round_robin")
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+USE_SQLITE_PRODUCTION_PROFILE = (
+    IS_SQLITE and SQLITE_PROFILE == "production" and ":memory:" not in DATABASE_URL
 )
+
+def _sqlite_pragmas(readonly: bool) -> list:
+    """Per-connection pragmas for the production SQLite profile"""
+    pragmas = [
+        f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store = MEMORY"
+    ]
+    if readonly:
+        pragmas.append("PRAGMA query_only = ON")
+    else:
+        # WAL lets readers keep going while a writer commits; NORMAL sync is durable in WAL mode
+        pragmas.insert(0, "PRAGMA journal_mode = WAL")
+        pragmas.append("PRAGMA synchronous = NORMAL")
+    return pragmas
+
+def _create_sqlite_engine(url: str, readonly: bool):
+    pool_size = SQLITE_READ_POOL_SIZE if readonly else SQLITE_WRITE_POOL_SIZE
+    sqlite_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        pool_size=pool_size,
+        max_overflow=0
+    )
+    pragmas = _sqlite_pragmas(readonly)
+
+    @event.listens_for(sqlite_engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return sqlite_engine
+
+def _create_replica_engine(url: str):
+    if url.startswith("sqlite"):
+        return _create_sqlite_engine(url, readonly=True)
+    return create_engine(url, pool_pre_ping=True)
+
+if USE_SQLITE_PRODUCTION_PROFILE:
+    # One engine owns all writes; reads get their own pool of query-only connections
+    engine = _create_sqlite_engine(DATABASE_URL, readonly=False)
+    read_engines = [_create_sqlite_engine(DATABASE_URL, readonly=True)]
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    )
+    read_engines = []
+
+if DATABASE_REPLICA_URLS:
+    read_engines = [_create_replica_engine(url) for url in DATABASE_REPLICA_URLS]
+
+read_router = ReplicaRouter(
+    engine,
+    read_engines,
+    policy=REPLICA_POLICY,
+    sticky_seconds=READ_YOUR_WRITES_SECONDS,
+    retry_seconds=REPLICA_RETRY_SECONDS
+)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
+@event.listens_for(SessionLocal, "after_commit")
+def _pin_writer_to_primary(session):
+    """Route the writer's reads to the primary until replicas have caught up"""
+    read_router.mark_write(session.info.get("sticky_key"))
+
+def add_missing_columns(bind, tables):
+    """create_all never alters an existing table: add the columns models gained since
+
+    New columns need a server_default (or to be nullable) so existing rows get a value.
+    """
+    inspector = inspect(bind)
+    existing = set(inspector.get_table_names())
+    with bind.begin() as connection:
+        for table in tables:
+            if table.name not in existing:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    if isinstance(default, str):
+                        default = "'" + default.replace("'", "''") + "'"
+                    else:
+                        default = default.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True})
+                    ddl += f" DEFAULT {default}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                connection.exec_driver_sql(ddl)
+
+def get_db(request: Request = None):
     """Database dependency for FastAPI routes"""
     db = SessionLocal()
+    if request is not None:
+        db.info["sticky_key"] = sticky_key_from_headers(request.headers)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request = None):
+    """Database dependency for read-only FastAPI routes (replica-routed)"""
+    key = sticky_key_from_headers(request.headers) if request is not None else None
+    db = read_router.session(key)
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
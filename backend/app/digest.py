@@ -0,0 +1,125 @@
+from app.timers import TimerWheel
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import os
+import time
+
+# Join requests for a ride that reach its host within this window of the last
+# notification are held and sent together as one digest (0 sends each at once)
+JOIN_DIGEST_SECONDS = float(os.getenv("JOIN_DIGEST_SECONDS", "2"))
+JOIN_DIGEST_TICK_SECONDS = float(os.getenv("JOIN_DIGEST_TICK_SECONDS", "0.25"))
+
+# send_one(ride_id, recipient_id, requester, title) / send_digest(ride_id, recipient_id, requesters, title)
+SendOne = Callable[[int, int, dict, Optional[str]], Awaitable[None]]
+SendDigest = Callable[[int, int, List[dict], Optional[str]], Awaitable[None]]
+
+class DigestWindow:
+    """Requests held for one recipient on one ride until closes_at"""
+    __slots__ = ("ride_id", "recipient_id", "title", "requesters", "closes_at")
+
+    def __init__(self, ride_id: int, recipient_id: int, title: Optional[str], closes_at: float):
+        self.ride_id = ride_id
+        self.recipient_id = recipient_id
+        self.title = title
+        self.requesters: List[dict] = []
+        self.closes_at = closes_at
+
+class JoinRequestDigests:
+    """Per-recipient coalescing of join-request notifications
+
+    The first request for a (recipient, ride) is sent at once and opens a
+    window; requests arriving while it is open are held and sent as a single
+    "N new requests" digest when it closes, and a window that had anything to
+    send re-opens. A lone join is notified as quickly as before, while a burst
+    costs the host one message per window. Windows sit in a TimerWheel driven
+    by run_loop(); flush_ride() sends held requests early so they never trail
+    a later event of the same ride (e.g. the confirmation).
+    """
+
+    def __init__(
+        self,
+        send_one: SendOne,
+        send_digest: SendDigest,
+        window_seconds: float = JOIN_DIGEST_SECONDS,
+        tick_seconds: float = JOIN_DIGEST_TICK_SECONDS
+    ):
+        self.send_one = send_one
+        self.send_digest = send_digest
+        self.window_seconds = window_seconds
+        self.tick_seconds = tick_seconds
+        # Open windows by ride, then recipient
+        self._windows: Dict[int, Dict[int, DigestWindow]] = {}
+        self._wheel = TimerWheel(tick_seconds, time.monotonic())
+        self.stats = {"requests": 0, "messages": 0, "digests": 0}
+
+    async def add(self, ride_id: int, recipient_id: int, requester: dict, title: Optional[str] = None, now: Optional[float] = None):
+        self.stats["requests"] += 1
+        windows = self._windows.get(ride_id)
+        window = windows.get(recipient_id) if windows else None
+        if window is not None:
+            window.requesters.append(requester)
+            return
+
+        if self.window_seconds > 0:
+            now = time.monotonic() if now is None else now
+            window = DigestWindow(ride_id, recipient_id, title, now + self.window_seconds)
+            self._windows.setdefault(ride_id, {})[recipient_id] = window
+            self._wheel.schedule(window, window.closes_at)
+        self.stats["messages"] += 1
+        await self.send_one(ride_id, recipient_id, requester, title)
+
+    async def _send(self, window: DigestWindow):
+        # Swap the list out first: requests may arrive while the digest is being sent
+        requesters, window.requesters = window.requesters, []
+        self.stats["messages"] += 1
+        self.stats["digests"] += 1
+        await self.send_digest(window.ride_id, window.recipient_id, requesters, window.title)
+
+    async def expire(self, now: Optional[float] = None):
+        """Close due windows: send their digests and re-open them, or drop them if empty"""
+        now = time.monotonic() if now is None else now
+        for window in list(self._wheel.advance(now)):
+            windows = self._windows.get(window.ride_id)
+            if windows is None or windows.get(window.recipient_id) is not window:
+                continue  # no longer the current window
+            if window.requesters:
+                window.closes_at = now + self.window_seconds
+                self._wheel.schedule(window, window.closes_at)
+                try:
+                    await self._send(window)
+                except Exception as e:
+                    print(f"⚠️  Join request digest for ride {window.ride_id} failed: {e}")
+            else:
+                del windows[window.recipient_id]
+                if not windows:
+                    del self._windows[window.ride_id]
+
+    async def flush_ride(self, ride_id: int):
+        """Send whatever is held for a ride now (its windows stay open)
+
+        Failures are logged, not raised: the caller is an event bus consumer that
+        still has the ride's lifecycle event to deliver.
+        """
+        windows = self._windows.get(ride_id)
+        if windows:
+            for window in list(windows.values()):
+                if window.requesters:
+                    try:
+                        await self._send(window)
+                    except Exception as e:
+                        print(f"⚠️  Join request digest for ride {ride_id} failed: {e}")
+
+    async def run_loop(self):
+        """Drive expire() for the lifetime of the app"""
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            await self.expire()
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "open_windows": sum(len(windows) for windows in self._windows.values()),
+            "held_requests": sum(
+                len(window.requesters) for windows in self._windows.values() for window in windows.values()
+            )
+        }
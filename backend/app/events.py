@@ -0,0 +1,106 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import os
+
+# Per consumer, rides are spread over this many queues (each drained by one task)
+EVENT_BUS_SHARDS = int(os.getenv("EVENT_BUS_SHARDS", "4"))
+# Events waiting per shard before new ones are dropped (and counted)
+EVENT_BUS_QUEUE_SIZE = int(os.getenv("EVENT_BUS_QUEUE_SIZE", "10000"))
+
+class RideEvent:
+    """Something that happened to a ride, published after its transaction committed"""
+    __slots__ = ("kind", "ride_id", "data")
+
+    def __init__(self, kind: str, ride_id: int, data: dict):
+        self.kind = kind
+        self.ride_id = ride_id
+        self.data = data
+
+Handler = Callable[[RideEvent], Awaitable[None]]
+
+class EventBus:
+    """In-process fan-out of ride events to consumers, off the request path
+
+    publish() only enqueues, so a route returns without waiting for WebSocket
+    or push delivery. Every consumer (WebSocket fan-out, push notifications)
+    gets its own queues, so a slow one never holds up another, and each
+    consumer's queues are sharded by ride id with one task per shard: events
+    of one ride are handled in publish order, while a ride with many slow
+    subscribers only delays the rides sharing its shard. Events published
+    before start() are held (up to queue_size) and handed over when it runs.
+    """
+
+    def __init__(self, shards: int = EVENT_BUS_SHARDS, queue_size: int = EVENT_BUS_QUEUE_SIZE):
+        self.shards = shards
+        self.queue_size = queue_size
+        self._handlers: Dict[str, Handler] = {}
+        self._queues: Dict[str, List[asyncio.Queue]] = {}
+        self._started = False
+        self._held: List[RideEvent] = []
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0, "errors": 0, "held": 0}
+
+    def subscribe(self, name: str, handler: Handler):
+        self._handlers[name] = handler
+
+    def start(self) -> List[asyncio.Task]:
+        tasks = []
+        for name, handler in self._handlers.items():
+            queues = self._queues[name] = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.shards)]
+            tasks.extend(asyncio.create_task(self._consume(name, handler, queue)) for queue in queues)
+        self._started = True
+        held, self._held = self._held, []
+        for event in held:
+            self._enqueue(event)
+        return tasks
+
+    def publish(self, kind: str, ride_id: int, **data):
+        """Hand an event to every consumer (never blocks; call after commit)"""
+        event = RideEvent(kind, ride_id, data)
+        self.stats["published"] += 1
+        if self._started:
+            self._enqueue(event)
+        elif len(self._held) < self.queue_size:
+            self._held.append(event)
+            self.stats["held"] += 1
+        else:
+            self.stats["dropped"] += 1
+            print(f"⚠️  Event bus not started and its buffer is full, dropped {kind} for ride {ride_id}")
+
+    def _enqueue(self, event: RideEvent):
+        kind, ride_id = event.kind, event.ride_id
+        for name, queues in self._queues.items():
+            try:
+                queues[ride_id % self.shards].put_nowait(event)
+            except asyncio.QueueFull:
+                self.stats["dropped"] += 1
+                print(f"⚠️  Event queue for {name} is full, dropped {kind} for ride {ride_id}")
+
+    async def _consume(self, name: str, handler: Handler, queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            try:
+                await handler(event)
+                self.stats["delivered"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️  {name} consumer failed on {event.kind} for ride {event.ride_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def drain(self, timeout: Optional[float] = None):
+        """Wait until everything published so far has been handled"""
+        await asyncio.wait_for(
+            asyncio.gather(*(queue.join() for queues in self._queues.values() for queue in queues)),
+            timeout
+        )
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "shards": self.shards,
+            "held_until_start": len(self._held),
+            "queue_depth": {name: sum(queue.qsize() for queue in queues) for name, queues in self._queues.items()}
+        }
+
+# Global bus for ride lifecycle events
+ride_events = EventBus()
@@ -0,0 +1,147 @@
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+from app.archive import ARCHIVE_TABLES, HOT_TABLES, ArchiveSession
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+import csv
+import heapq
+import io
+import json
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_FORMATS = ("ndjson", "csv")
+
+RIDE_EXPORT_COLUMNS = [
+    "id", "host_id", "title", "status", "start_lat", "start_lng", "end_lat", "end_lng",
+    "start_address", "end_address", "departure_time", "max_passengers", "created_at", "updated_at",
+    "requested_riders", "confirmed_riders", "cancelled_riders", "helmet_checks", "verified_helmets"
+]
+CREATED_AT_COLUMN = RIDE_EXPORT_COLUMNS.index("created_at")
+
+def _ride_export_query(tables: tuple, start: datetime, end: datetime, after: Optional[tuple], limit: int):
+    """One chunk of rides created in [start, end) with per-ride participant and helmet counts
+
+    The counts are correlated subqueries, each an index seek on the
+    (ride_id, ...) indexes, so a chunk costs the same however large the range is.
+    """
+    rides, participants, checks = tables
+
+    def participant_count(participant_status: str):
+        return select(func.count(participants.c.id)).where(
+            participants.c.ride_id == rides.c.id, participants.c.status == participant_status
+        ).correlate(rides).scalar_subquery()
+
+    helmet_checks = select(func.count(checks.c.id)).where(
+        checks.c.ride_id == rides.c.id
+    ).correlate(rides).scalar_subquery()
+    verified_helmets = select(func.count(checks.c.id)).where(
+        checks.c.ride_id == rides.c.id, checks.c.is_verified.is_(True)
+    ).correlate(rides).scalar_subquery()
+
+    query = select(
+        rides.c.id, rides.c.host_id, rides.c.title, rides.c.status, rides.c.start_lat, rides.c.start_lng,
+        rides.c.end_lat, rides.c.end_lng, rides.c.start_address, rides.c.end_address, rides.c.departure_time,
+        rides.c.max_passengers, rides.c.created_at, rides.c.updated_at,
+        participant_count("requested"), participant_count("confirmed"), participant_count("cancelled"),
+        helmet_checks, verified_helmets
+    ).where(rides.c.created_at >= start, rides.c.created_at < end)
+
+    if after is not None:
+        created_at, ride_id = after
+        query = query.where(or_(
+            rides.c.created_at > created_at,
+            and_(rides.c.created_at == created_at, rides.c.id > ride_id)
+        ))
+    return query.order_by(rides.c.created_at, rides.c.id).limit(limit)
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    return value
+
+def iter_ride_rows(
+    session_factory: Callable[[], Session],
+    start: datetime,
+    end: datetime,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    tables: tuple = HOT_TABLES
+) -> Iterator[tuple]:
+    """Rides in the range as rows of RIDE_EXPORT_COLUMNS, ordered by (created_at, id)
+
+    Each chunk is a keyset page read in its own short session and streamed
+    from the cursor with yield_per, so no read transaction (and, on SQLite, no
+    WAL checkpoint blocker) lives longer than one chunk, and memory holds at
+    most one chunk whatever the range.
+    """
+    after = None
+    while True:
+        db = session_factory()
+        try:
+            rows = db.execute(
+                _ride_export_query(tables, start, end, after, chunk_size),
+                execution_options={"yield_per": min(chunk_size, 1000)}
+            )
+            count = 0
+            for row in rows:
+                count += 1
+                after = (row.created_at, row.id)
+                yield tuple(row)
+        finally:
+            db.close()
+        if count < chunk_size:
+            return
+
+def iter_all_ride_rows(
+    session_factory: Callable[[], Session],
+    start: datetime,
+    end: datetime,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[tuple]:
+    """Hot and archived rides merged in (created_at, id) order
+
+    A ride caught mid-archival can be in both; it is exported once.
+    """
+    merged = heapq.merge(
+        iter_ride_rows(session_factory, start, end, chunk_size, HOT_TABLES),
+        iter_ride_rows(ArchiveSession, start, end, chunk_size, ARCHIVE_TABLES),
+        key=lambda row: (row[CREATED_AT_COLUMN], row[0])
+    )
+    last_id = None
+    for row in merged:
+        if row[0] != last_id:
+            last_id = row[0]
+            yield row
+
+def export_rides(
+    session_factory: Callable[[], Session],
+    start: datetime,
+    end: datetime,
+    fmt: str = "ndjson",
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Encode the ride export as NDJSON or CSV, flushed every few hundred rows"""
+    buffer = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(RIDE_EXPORT_COLUMNS)
+
+    pending = 0
+    for row in iter_all_ride_rows(session_factory, start, end, chunk_size):
+        values = [_export_value(value) for value in row]
+        if writer is not None:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(RIDE_EXPORT_COLUMNS, values)), separators=(",", ":")))
+            buffer.write("\n")
+        pending += 1
+        if pending >= 500:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
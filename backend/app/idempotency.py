@@ -0,0 +1,132 @@
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import time
+
+# Responses to requests carrying an Idempotency-Key are replayed for this long ...
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+# ... for at most this many keys (oldest dropped first)
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+
+MAX_KEY_LENGTH = 255
+
+def fingerprint(*parts) -> str:
+    """Digest of what a request asks for, to catch a key reused for a different request"""
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+class IdempotentResult:
+    """Outcome of the first request made with a key (empty while it is still running)"""
+    __slots__ = ("fingerprint", "created_at", "status_code", "body", "media_type", "error", "ready")
+
+    def __init__(self, fingerprint: str, created_at: float):
+        self.fingerprint = fingerprint
+        self.created_at = created_at
+        self.status_code: Optional[int] = None
+        self.body: Optional[bytes] = None
+        self.media_type: Optional[str] = None
+        self.error: Optional[HTTPException] = None
+        self.ready = asyncio.Event()
+
+    @property
+    def pending(self) -> bool:
+        return self.status_code is None and self.error is None
+
+    def replay(self) -> Response:
+        if self.error is not None:
+            raise HTTPException(self.error.status_code, self.error.detail, self.error.headers)
+        return Response(
+            self.body, status_code=self.status_code, media_type=self.media_type,
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+class IdempotencyStore:
+    """Bounded TTL store of responses by (user, route, Idempotency-Key)
+
+    The first request with a key runs normally and its response (or its 4xx
+    HTTPException) is kept; a retry with the same key gets that response back
+    without running the handler again, and a duplicate that arrives while the
+    first is still running waits for it instead of racing it. Unexpected
+    errors are not kept, so the client's next retry runs again. Keys live in
+    this process only, like the other in-memory caches.
+    """
+
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._results: "OrderedDict[Tuple, IdempotentResult]" = OrderedDict()
+        self.stats = {"executed": 0, "replayed": 0, "collapsed": 0, "mismatched": 0, "evicted": 0}
+
+    def _sweep(self, now: float):
+        # Insertion order is creation order, so expired keys are at the front
+        while self._results:
+            result = next(iter(self._results.values()))
+            if now - result.created_at <= self.ttl_seconds:
+                break
+            self._results.popitem(last=False)
+
+    async def run(
+        self,
+        scope: Tuple,
+        key: Optional[str],
+        request_fingerprint: str,
+        handler: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """The handler's response, or the stored one if this key was seen for this scope"""
+        if key is None:
+            return await handler()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"
+            )
+
+        store_key = (*scope, key)
+        while True:
+            now = time.monotonic()
+            self._sweep(now)
+            result = self._results.get(store_key)
+            if result is None:
+                break
+            if result.fingerprint != request_fingerprint:
+                self.stats["mismatched"] += 1
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Idempotency-Key was already used for a different request"
+                )
+            if result.pending:
+                # Same request still running: wait for it, then replay (or run, if it failed)
+                self.stats["collapsed"] += 1
+                await result.ready.wait()
+                continue
+            self.stats["replayed"] += 1
+            return result.replay()
+
+        while len(self._results) >= self.max_keys:
+            self._results.popitem(last=False)
+            self.stats["evicted"] += 1
+        result = self._results[store_key] = IdempotentResult(request_fingerprint, now)
+        self.stats["executed"] += 1
+        try:
+            response = await handler()
+            result.body = bytes(response.body)
+            result.media_type = response.media_type
+            result.status_code = response.status_code
+        except BaseException as e:
+            if isinstance(e, HTTPException) and e.status_code < 500:
+                result.error = e
+            elif self._results.get(store_key) is result:
+                del self._results[store_key]
+            raise
+        finally:
+            result.ready.set()
+        return response
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "keys": len(self._results)}
+
+# Global store for create/join retries
+idempotent_requests = IdempotencyStore()
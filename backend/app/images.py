@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from app.storage import BlobStore, helmet_store
+from typing import Dict, Optional
+import asyncio
+import multiprocessing
+import os
+
+# Longest side of the image hosts look at when checking a helmet
+HELMET_VERIFY_MAX_SIDE = int(os.getenv("HELMET_VERIFY_MAX_SIDE", "1280"))
+HELMET_THUMBNAIL_MAX_SIDE = int(os.getenv("HELMET_THUMBNAIL_MAX_SIDE", "256"))
+HELMET_IMAGE_WORKERS = int(os.getenv("HELMET_IMAGE_WORKERS", str(min(2, os.cpu_count() or 1))))
+
+VERIFY_VARIANT = "verify"
+THUMBNAIL_VARIANT = "thumb"
+VARIANT_EXTENSION = "jpg"
+
+def _save_jpeg(image: Image.Image, path: str, quality: int):
+    # Write next to the target and rename so readers never see a half-written file
+    partial = f"{path}.{os.getpid()}.part"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # No exif/icc arguments: the re-encoded file carries no camera metadata (GPS, device)
+    image.save(partial, "JPEG", quality=quality, optimize=True, progressive=True)
+    os.replace(partial, path)
+
+def render_variants(source_path: str, verify_path: str, thumbnail_path: str) -> dict:
+    """Build the verification-size and thumbnail JPEGs for one image
+
+    Runs in a worker process: decoding and resampling a 12 MP photo holds the
+    GIL for hundreds of milliseconds.
+    """
+    with Image.open(source_path) as original:
+        original.draft("RGB", (HELMET_VERIFY_MAX_SIDE, HELMET_VERIFY_MAX_SIDE))
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    image.thumbnail((HELMET_VERIFY_MAX_SIDE, HELMET_VERIFY_MAX_SIDE), Image.LANCZOS)
+    _save_jpeg(image, verify_path, quality=85)
+    verify_size = image.size
+
+    image.thumbnail((HELMET_THUMBNAIL_MAX_SIDE, HELMET_THUMBNAIL_MAX_SIDE), Image.LANCZOS)
+    _save_jpeg(image, thumbnail_path, quality=75)
+
+    return {
+        "verify": verify_size,
+        "thumbnail": image.size,
+        "bytes": os.path.getsize(verify_path) + os.path.getsize(thumbnail_path)
+    }
+
+class ImagePipeline:
+    """Generates helmet image variants in a process pool after upload
+
+    Work is keyed by content hash, so concurrent uploads of the same photo share
+    one job and already-processed images are skipped.
+    """
+
+    def __init__(self, store: BlobStore, workers: int = HELMET_IMAGE_WORKERS):
+        self.store = store
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, asyncio.Future] = {}
+        self.stats = {"processed": 0, "skipped": 0, "failed": 0}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and thread pools is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def variant_paths(self, digest: str):
+        return (
+            self.store.path_for(digest, VARIANT_EXTENSION, VERIFY_VARIANT),
+            self.store.path_for(digest, VARIANT_EXTENSION, THUMBNAIL_VARIANT)
+        )
+
+    def variants_exist(self, digest: str) -> bool:
+        """Both variants are on disk (stats files: for write paths, not per served row)"""
+        return all(os.path.exists(path) for path in self.variant_paths(digest))
+
+    def in_flight(self, digest: str) -> Optional[asyncio.Future]:
+        """The running variant job of a blob, if any"""
+        return self._jobs.get(digest)
+
+    def submit(self, digest: str, extension: str) -> asyncio.Future:
+        """Schedule variant generation for a stored blob (fire and forget)"""
+        job = self._jobs.get(digest)
+        if job is None:
+            job = asyncio.ensure_future(self._process(digest, extension))
+            self._jobs[digest] = job
+            job.add_done_callback(lambda _: self._jobs.pop(digest, None))
+        return job
+
+    async def _process(self, digest: str, extension: str) -> Optional[dict]:
+        verify_path, thumbnail_path = self.variant_paths(digest)
+        if os.path.exists(verify_path) and os.path.exists(thumbnail_path):
+            self.stats["skipped"] += 1
+            return None
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self._executor(), render_variants,
+                self.store.path_for(digest, extension), verify_path, thumbnail_path
+            )
+        except Exception as e:
+            # Undecodable or unsupported image: clients fall back to the original
+            self.stats["failed"] += 1
+            print(f"⚠️  Helmet image processing failed for {digest}: {e}")
+            return None
+
+        self.stats["processed"] += 1
+        return result
+
+    def variant_urls(self, image_url: str) -> Dict[str, Optional[str]]:
+        """Public URLs of a stored image's variants, by naming convention (no file access)
+
+        Only meaningful once the variants exist: callers check HelmetCheck.has_variants.
+        """
+        digest = self.store.digest_of_url(image_url)
+        if digest is None:
+            return {"verify_url": None, "thumbnail_url": None}
+        return {
+            "verify_url": self.store.url_for(digest, VARIANT_EXTENSION, VERIFY_VARIANT),
+            "thumbnail_url": self.store.url_for(digest, VARIANT_EXTENSION, THUMBNAIL_VARIANT)
+        }
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "in_flight": len(self._jobs), "workers": self.workers}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+# Global helmet image pipeline
+image_pipeline = ImagePipeline(helmet_store)
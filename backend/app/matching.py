@@ -0,0 +1,212 @@
+from starlette.concurrency import run_in_threadpool
+from scipy.optimize import linear_sum_assignment
+from app.read_model import OpenRide, open_rides
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+import asyncio
+import numpy as np
+import os
+
+# Requests arriving within this window are matched together
+MATCH_WINDOW_MS = float(os.getenv("MATCH_WINDOW_MS", "1500"))
+MATCH_MAX_BATCH = int(os.getenv("MATCH_MAX_BATCH", "1000"))
+# Departure window when the rider gives only depart_after (or nothing: from now)
+MATCH_DEPARTURE_WINDOW_MINUTES = float(os.getenv("MATCH_DEPARTURE_WINDOW_MINUTES", "30"))
+# A late departure costs as much as this many extra km of pickup/drop-off detour, per minute
+MATCH_KM_PER_MINUTE = float(os.getenv("MATCH_KM_PER_MINUTE", "0.1"))
+# Batches a rider is matched in when the assigned ride refuses the join (filled up meanwhile)
+MATCH_MAX_ATTEMPTS = int(os.getenv("MATCH_MAX_ATTEMPTS", "3"))
+
+KM_PER_DEGREE = 111.195
+INFEASIBLE = 1e9
+EPOCH = datetime(1970, 1, 1)
+
+def _seconds(when: datetime) -> float:
+    return (when.replace(tzinfo=None) - EPOCH).total_seconds()
+
+class MatchRequest:
+    """A rider waiting to be assigned a ride"""
+    __slots__ = (
+        "rider_id", "pickup_lat", "pickup_lng", "dropoff_lat", "dropoff_lng",
+        "earliest", "latest", "radius_km", "excluded", "future"
+    )
+
+    def __init__(self, rider_id: int, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng,
+                 earliest: datetime, latest: datetime, radius_km: float):
+        self.rider_id = rider_id
+        self.pickup_lat = pickup_lat
+        self.pickup_lng = pickup_lng
+        self.dropoff_lat = dropoff_lat
+        self.dropoff_lng = dropoff_lng
+        self.earliest = _seconds(earliest)
+        self.latest = _seconds(latest)
+        self.radius_km = radius_km
+        self.excluded: Set[int] = set()  # rides that refused this rider's join
+        self.future: Optional[asyncio.Future] = None
+
+class RideCandidate:
+    """What the solver needs to know about an open ride"""
+    __slots__ = ("ride_id", "host_id", "start_lat", "start_lng", "end_lat", "end_lng", "departs_at", "seats", "rider_ids")
+
+    def __init__(self, ride_id, host_id, start_lat, start_lng, end_lat, end_lng, departs_at: float, seats: int, rider_ids: Set[int]):
+        self.ride_id = ride_id
+        self.host_id = host_id
+        self.start_lat = start_lat
+        self.start_lng = start_lng
+        self.end_lat = end_lat
+        self.end_lng = end_lng
+        self.departs_at = departs_at
+        self.seats = seats
+        self.rider_ids = rider_ids
+
+    @classmethod
+    def from_open_ride(cls, ride: OpenRide) -> "RideCandidate":
+        payload = ride.payload
+        return cls(
+            ride.ride_id, ride.host_id, ride.start_lat, ride.start_lng, payload["end_lat"], payload["end_lng"],
+            _seconds(datetime.fromisoformat(payload["departure_time"])),
+            # Outstanding requests hold a seat too, so batches spread riders over hosts
+            max(0, ride.max_passengers - ride.requested - ride.confirmed),
+            ride.rider_ids
+        )
+
+def _distance_km(lat1, lng1, lat2, lng2):
+    """Equirectangular distance (well under 1% off at city scale, and no trigonometry per pair)"""
+    dlat = (lat2 - lat1) * KM_PER_DEGREE
+    dlng = (lng2 - lng1) * (KM_PER_DEGREE * np.cos(np.radians(lat1)))
+    return np.hypot(dlat, dlng)
+
+def cost_matrix(requests: List[MatchRequest], candidates: List[RideCandidate]):
+    """Riders x seats cost (km-equivalent) and the ride index of each seat column
+
+    A ride with k free seats contributes k identical columns, so the one-to-one
+    assignment respects max_passengers. Pairs outside the rider's pickup radius
+    or departure window, rides the rider hosts, already joined or was refused by,
+    cost INFEASIBLE.
+    """
+    def ride_row(attribute):
+        return np.array([getattr(candidate, attribute) for candidate in candidates], dtype=np.float64)[None, :]
+
+    def rider_column(attribute):
+        return np.array([getattr(request, attribute) for request in requests], dtype=np.float64)[:, None]
+
+    # Riders x rides first, then one column per free seat
+    pickup_km = _distance_km(rider_column("pickup_lat"), rider_column("pickup_lng"), ride_row("start_lat"), ride_row("start_lng"))
+    dropoff_km = _distance_km(rider_column("dropoff_lat"), rider_column("dropoff_lng"), ride_row("end_lat"), ride_row("end_lng"))
+    departs_at = ride_row("departs_at")
+    earliest, latest = rider_column("earliest"), rider_column("latest")
+
+    cost = pickup_km + dropoff_km + (departs_at - earliest) / 60.0 * MATCH_KM_PER_MINUTE
+    infeasible = (pickup_km > rider_column("radius_km")) | (departs_at < earliest) | (departs_at > latest)
+
+    # Hosts and riders already on a ride (sparse, so not worth a dense comparison)
+    row_of = {request.rider_id: row for row, request in enumerate(requests)}
+    for index, candidate in enumerate(candidates):
+        for rider_id in (candidate.host_id, *candidate.rider_ids):
+            row = row_of.get(rider_id)
+            if row is not None:
+                infeasible[row, index] = True
+    index_of = {candidate.ride_id: index for index, candidate in enumerate(candidates)}
+    for row, request in enumerate(requests):
+        for ride_id in request.excluded:
+            index = index_of.get(ride_id)
+            if index is not None:
+                infeasible[row, index] = True
+
+    cost[infeasible] = INFEASIBLE
+    seats = np.array([min(candidate.seats, len(requests)) for candidate in candidates], dtype=np.int64)
+    column_ride = np.repeat(np.arange(len(candidates)), seats)
+    return cost[:, column_ride], column_ride
+
+def solve(requests: List[MatchRequest], candidates: List[RideCandidate]) -> List[Optional[int]]:
+    """Minimum-cost assignment: the candidate index for each request, or None"""
+    assigned: List[Optional[int]] = [None] * len(requests)
+    if not requests or not candidates:
+        return assigned
+    cost, column_ride = cost_matrix(requests, candidates)
+    if cost.shape[1] == 0:
+        return assigned
+    rows, columns = linear_sum_assignment(cost)
+    for row, column in zip(rows, columns):
+        if cost[row, column] < INFEASIBLE:
+            assigned[row] = int(column_ride[column])
+    return assigned
+
+class RideMatcher:
+    """Batches rider match requests and assigns them to open rides together
+
+    Riders calling /api/rides/match wait up to one window; every request that
+    arrived meanwhile is solved as one assignment problem over the open rides
+    near any of them (from the read model), so the morning rush spreads over
+    all nearby hosts instead of piling onto the few best rides. The solve runs
+    in a worker thread; each rider's request then joins its ride through the
+    normal join path. If that join is refused (the ride filled up or the rider
+    joined it since the read model saw it), the rider goes into the next batch
+    without that ride.
+    """
+
+    def __init__(self, window_ms: float = MATCH_WINDOW_MS, max_batch: int = MATCH_MAX_BATCH):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self.stats = {"requests": 0, "matched": 0, "unmatched": 0, "join_refused": 0, "batches": 0, "last_solve_ms": 0.0}
+
+    def start(self) -> asyncio.Task:
+        self._queue = asyncio.Queue()
+        return asyncio.create_task(self._run())
+
+    async def match(self, request: MatchRequest) -> Optional[RideCandidate]:
+        """The ride assigned to this rider in the next batch, or None"""
+        request.future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(request)
+        self.stats["requests"] += 1
+        return await request.future
+
+    def join_refused(self, request: MatchRequest, ride_id: int):
+        """Keep ride_id out of this rider's next match"""
+        request.excluded.add(ride_id)
+        self.stats["join_refused"] += 1
+
+    async def _next_batch(self) -> List[MatchRequest]:
+        batch = [await self._queue.get()]
+        await asyncio.sleep(self.window)
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                candidates = self._candidates(batch)
+                loop = asyncio.get_running_loop()
+                started = loop.time()
+                assigned = await run_in_threadpool(solve, batch, candidates)
+                self.stats["last_solve_ms"] = round((loop.time() - started) * 1000, 3)
+            except Exception as e:
+                print(f"⚠️  Ride matching failed: {e}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            self.stats["batches"] += 1
+            for request, index in zip(batch, assigned):
+                self.stats["matched" if index is not None else "unmatched"] += 1
+                if not request.future.done():  # the rider may have gone away
+                    request.future.set_result(candidates[index] if index is not None else None)
+
+    @staticmethod
+    def _candidates(batch: List[MatchRequest]) -> List[RideCandidate]:
+        """Open rides with free seats within reach of any rider in the batch"""
+        rides: Dict[int, OpenRide] = {}
+        for request in batch:
+            for ride in open_rides.nearby(request.pickup_lat, request.pickup_lng, request.radius_km):
+                rides[ride.ride_id] = ride
+        candidates = [RideCandidate.from_open_ride(ride) for ride in rides.values()]
+        return [candidate for candidate in candidates if candidate.seats > 0]
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "waiting": self._queue.qsize() if self._queue is not None else 0}
+
+# Global matcher for peak-hour ride requests
+ride_matcher = RideMatcher()
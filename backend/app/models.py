@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Enum as SQLEnum, Float
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, ForeignKey, Enum as SQLEnum, Float, Index, LargeBinary
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import expression
 from app.database import Base
 from datetime import datetime
 import enum
@@ -17,6 +18,12 @@ class RideStatus(enum.Enum):
     COMPLETED = "completed"
     CANCELLED = "cancelled"
 
+class VerificationStatus(enum.Enum):
+    PENDING = "pending"  # waiting for the verification worker
+    VERIFIED = "verified"
+    REJECTED = "rejected"  # the photo did not pass
+    FAILED = "failed"  # could not be verified (verifier busy or down); the rider can resubmit
+
 class User(Base):
     __tablename__ = "users"
     
@@ -64,6 +71,11 @@ class Ride(Base):
     host = relationship("User", foreign_keys=[host_id], back_populates="hosted_rides")
     participants = relationship("RideParticipant", back_populates="ride")
     helmet_checks = relationship("HelmetCheck", back_populates="ride")
+    
+    __table_args__ = (
+        Index("ix_rides_created_at", "created_at", "id"),
+        Index("ix_rides_status_updated", "status", "updated_at"),
+    )
 
 class RideParticipant(Base):
     __tablename__ = "ride_participants"
@@ -77,6 +89,10 @@ class RideParticipant(Base):
     # Relationships
     ride = relationship("Ride", back_populates="participants")
     rider = relationship("User", back_populates="joined_rides")
+    
+    __table_args__ = (
+        Index("ix_ride_participants_ride_rider", "ride_id", "rider_id"),
+    )
 
 class HelmetCheck(Base):
     __tablename__ = "helmet_checks"
@@ -86,8 +102,64 @@ class HelmetCheck(Base):
     ride_id = Column(Integer, ForeignKey("rides.id"), nullable=False)
     image_url = Column(String, nullable=False)
     is_verified = Column(Boolean, default=False)
+    # Stored as a string so existing databases can gain the column with ALTER TABLE
+    verification_status = Column(
+        SQLEnum(VerificationStatus, native_enum=False),
+        default=VerificationStatus.PENDING,
+        server_default=VerificationStatus.PENDING.name,
+        nullable=False
+    )
+    # Downscaled/thumbnail variants of image_url exist (set once the image pipeline has rendered them)
+    has_variants = Column(Boolean, default=False, server_default=expression.false(), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="helmet_checks")
-    ride = relationship("Ride", back_populates="helmet_checks")
\ No newline at end of file
+    ride = relationship("Ride", back_populates="helmet_checks")
+    
+    __table_args__ = (
+        Index("ix_helmet_checks_ride_user", "ride_id", "user_id"),
+        Index("ix_helmet_checks_user_created", "user_id", "created_at", "id"),
+    )
+
+class HelmetImageHash(Base):
+    __tablename__ = "helmet_image_hashes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_sha256 = Column(String(64), unique=True, index=True, nullable=False)
+    dhash = Column(BigInteger, nullable=False)  # 64-bit difference hash, stored signed
+    # The check that first used the photo (unknown on rows indexed before these columns existed)
+    user_id = Column(Integer, nullable=True)
+    ride_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    
+    # Counters maintained by the ride lifecycle and helmet verification (see app/stats.py)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    rides_hosted = Column(Integer, default=0, nullable=False)
+    rides_joined = Column(Integer, default=0, nullable=False)
+    rides_completed = Column(Integer, default=0, nullable=False)  # as host or confirmed rider
+    rides_cancelled = Column(Integer, default=0, nullable=False)  # hosted rides or join requests cancelled
+    helmet_checks = Column(Integer, default=0, nullable=False)
+    helmet_verified = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RideTrailChunk(Base):
+    __tablename__ = "ride_trail_chunks"
+    
+    # A run of one user's location fixes during a ride, packed by app/trails.py.
+    # No foreign keys: fixes are written in batches, and one for a ride that is
+    # gone by then must not fail the whole batch.
+    id = Column(Integer, primary_key=True, index=True)
+    ride_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    points = Column(Integer, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_ride_trail_chunks_ride_user", "ride_id", "user_id", "started_at"),
+    )
@@ -1,4 +1,7 @@
 from typing import List, Dict, Optional
+from app.events import RideEvent
+from app.digest import JoinRequestDigests
+from collections import deque
 import json
 import asyncio
 from datetime import datetime
@@ -10,9 +13,17 @@ load_dotenv()
 # In production, use services like Firebase Cloud Messaging (FCM) or OneSignal
 # For now, we'll create a notification system that can be easily integrated
 
+# Recent notifications kept in memory until an FCM integration drains them
+NOTIFICATION_QUEUE_LIMIT = int(os.getenv("NOTIFICATION_QUEUE_LIMIT", "1000"))
+
+def _names(names: List[str], shown: int = 3) -> str:
+    """'A, B, C and 4 more'"""
+    listed = ", ".join(names[:shown])
+    return f"{listed} and {len(names) - shown} more" if len(names) > shown else listed
+
 class NotificationService:
     def __init__(self):
-        self.notification_queue = []
+        self.notification_queue = deque(maxlen=NOTIFICATION_QUEUE_LIMIT)  # most recent only
         self.user_tokens: Dict[int, str] = {}  # user_id -> FCM token
         
     def register_device_token(self, user_id: int, token: str):
@@ -65,6 +76,10 @@ class NotificationService:
                 "title": "New Ride Request",
                 "body": f"Someone wants to join your ride '{ride_data.get('title', 'Untitled')}'"
             },
+            "ride_request_digest": {
+                "title": f"{ride_data.get('count', 0)} New Ride Requests",
+                "body": f"{_names(ride_data.get('rider_names', []))} want to join your ride '{ride_data.get('title', 'Untitled')}'"
+            },
             "ride_confirmed": {
                 "title": "Ride Confirmed!",
                 "body": f"Your ride '{ride_data.get('title', 'Untitled')}' has been confirmed"
@@ -137,6 +152,13 @@ async def notify_ride_request(ride_id: int, host_user_id: int, ride_data: Dict):
         ride_id, [host_user_id], "ride_request", ride_data
     )
 
+async def notify_ride_request_digest(ride_id: int, host_user_id: int, ride_data: Dict, rider_names: List[str]):
+    """Notify host about several ride requests in one push"""
+    await notification_service.send_ride_notification(
+        ride_id, [host_user_id], "ride_request_digest",
+        {**ride_data, "count": len(rider_names), "rider_names": rider_names}
+    )
+
 async def notify_ride_confirmed(ride_id: int, participant_user_ids: List[int], ride_data: Dict):
     """Notify participants about ride confirmation"""
     await notification_service.send_ride_notification(
@@ -167,4 +189,35 @@ async def notify_emergency_alert(ride_id: int, all_user_ids: List[int], location
         all_user_ids,
         location,
         "Emergency SOS triggered in your ride. Please check on all participants."
-    )
\ No newline at end of file
+    )
+
+async def _push_ride_request(ride_id: int, host_id: int, rider: dict, title: Optional[str]):
+    await notify_ride_request(ride_id, host_id, {"title": title, "rider_name": rider["full_name"]})
+
+async def _push_ride_request_digest(ride_id: int, host_id: int, riders: List[dict], title: Optional[str]):
+    await notify_ride_request_digest(ride_id, host_id, {"title": title}, [rider["full_name"] for rider in riders])
+
+# Join request bursts reach the host as one push per window
+push_join_digests = JoinRequestDigests(_push_ride_request, _push_ride_request_digest)
+
+async def push_ride_event(event: RideEvent):
+    """Event bus consumer: push notifications for ride lifecycle events"""
+    data = event.data
+    ride_data = {"title": data.get("title")}
+    if event.kind == "ride_request":
+        await push_join_digests.add(event.ride_id, data["host_id"], data["rider"], data.get("title"))
+        return
+    # Held requests go out before anything that happens to the ride after them
+    await push_join_digests.flush_ride(event.ride_id)
+    if event.kind == "ride_confirmed":
+        await notify_ride_confirmed(event.ride_id, [rider["user_id"] for rider in data["riders"]], ride_data)
+    elif event.kind == "ride_status" and data["status"] == "ongoing":
+        await notify_ride_started(event.ride_id, data["user_ids"], ride_data)
+    elif event.kind == "ride_status" and data["status"] == "completed":
+        await notify_ride_completed(event.ride_id, data["user_ids"], ride_data)
+    elif event.kind == "route_deviation" and data["off_route"]:
+        await notification_service.send_safety_alert(
+            data["user_ids"],
+            data["location"],
+            f"Your ride is {data['distance_from_route_m']} m off its route. Please check on all participants."
+        )
@@ -0,0 +1,55 @@
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+import base64
+import heapq
+
+Keyset = Tuple[datetime, int]
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor pointing just past (created_at, id)"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Keyset:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def newest_first(query, created_column, id_column, after: Optional[Keyset], limit: int):
+    """Keyset page ordered by (created_at, id) descending, starting after a cursor
+
+    Unlike OFFSET, the cost of a page does not grow with how deep the client
+    has scrolled: a composite index on (..., created_at, id) seeks straight to
+    the cursor position.
+    """
+    if after is not None:
+        created_at, row_id = after
+        query = query.filter(or_(
+            created_column < created_at,
+            and_(created_column == created_at, id_column < row_id)
+        ))
+    return query.order_by(created_column.desc(), id_column.desc()).limit(limit)
+
+def merge_newest_first(pages: Iterable[list], limit: int) -> list:
+    """Merge keyset pages from several sources (e.g. hot and archive tables) into one
+
+    Each page must already be newest-first from the same cursor; rows present
+    in more than one source are returned once.
+    """
+    merged, seen = [], set()
+    for row in heapq.merge(*pages, key=lambda row: (row.created_at, row.id), reverse=True):
+        if row.id in seen:
+            continue
+        seen.add(row.id)
+        merged.append(row)
+        if len(merged) == limit:
+            break
+    return merged
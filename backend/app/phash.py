@@ -0,0 +1,159 @@
+from PIL import Image
+from sqlalchemy.orm import Session
+from app.models import HelmetImageHash
+from array import array
+from itertools import combinations
+from typing import Callable, Dict, List, Optional, Tuple
+import os
+import threading
+
+# Photos whose 64-bit dHashes differ in at most this many bits count as the same photo
+HELMET_DUPLICATE_MAX_DISTANCE = int(os.getenv("HELMET_DUPLICATE_MAX_DISTANCE", "6"))
+
+HASH_BITS = 64
+UNSIGNED_MASK = (1 << HASH_BITS) - 1
+
+def difference_hash(path: str) -> int:
+    """64-bit dHash: is each pixel brighter than its right neighbour on a 9x8 grayscale?
+
+    Survives re-encoding, resizing and small crops, so a re-uploaded or
+    screenshotted photo lands within a few bits of the original.
+    """
+    with Image.open(path) as image:
+        image.draft("L", (64, 64))
+        small = image.convert("L").resize((9, 8), Image.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def to_signed(value: int) -> int:
+    """Fit an unsigned 64-bit hash into a signed BIGINT column"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+def to_unsigned(value: int) -> int:
+    return value & UNSIGNED_MASK
+
+class PerceptualHashIndex:
+    """Multi-index hashing over 64-bit perceptual hashes
+
+    Each hash is split into four 16-bit chunks with one lookup table per chunk.
+    If two hashes are within distance d, at least one chunk differs in at most
+    d // 4 bits (pigeonhole), so a query only probes the buckets within that
+    many bits of each chunk (17 probes per chunk for d < 8) and computes exact
+    Hamming distances on that short candidate list instead of scanning every
+    stored hash.
+
+    Writers (add, catch_up) are serialized by a lock, since catch_up runs in
+    the threadpool for several verification batches at once. near() runs on
+    the event loop without it: a hash is appended before its table entries,
+    so a reader never sees a position that is not filled in yet.
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = 16
+    CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+    def __init__(self, max_distance: int = HELMET_DUPLICATE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._hashes = array("Q")
+        self._row_ids = array("q")
+        # (user_id, ride_id) of the check that first used each photo (0 when unknown)
+        self._user_ids = array("q")
+        self._ride_ids = array("q")
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(self.CHUNKS)]
+        self._probe_masks: Dict[int, List[int]] = {}
+        self.last_row_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _masks(self, radius: int) -> List[int]:
+        masks = self._probe_masks.get(radius)
+        if masks is None:
+            masks = [0]
+            for bits in range(1, radius + 1):
+                for positions in combinations(range(self.CHUNK_BITS), bits):
+                    mask = 0
+                    for position in positions:
+                        mask |= 1 << position
+                    masks.append(mask)
+            self._probe_masks[radius] = masks
+        return masks
+
+    def add(self, row_id: int, value: int, user_id: Optional[int] = None, ride_id: Optional[int] = None):
+        with self._lock:
+            self._add(row_id, value, user_id, ride_id)
+
+    def _add(self, row_id: int, value: int, user_id: Optional[int], ride_id: Optional[int]):
+        position = len(self._hashes)
+        self._hashes.append(value)
+        self._row_ids.append(row_id)
+        self._user_ids.append(user_id or 0)
+        self._ride_ids.append(ride_id or 0)
+        for chunk in range(self.CHUNKS):
+            key = (value >> (chunk * self.CHUNK_BITS)) & self.CHUNK_MASK
+            self._tables[chunk].setdefault(key, []).append(position)
+        self.last_row_id = max(self.last_row_id, row_id)
+
+    def near(
+        self,
+        value: int,
+        max_distance: Optional[int] = None,
+        owner: Optional[Tuple[int, int]] = None
+    ) -> List[Tuple[int, int]]:
+        """(row_id, distance) of every indexed hash within max_distance bits
+
+        Hashes first used by owner (user_id, ride_id) are skipped: resubmitting
+        a photo for the same ride is not reusing it.
+        """
+        max_distance = self.max_distance if max_distance is None else max_distance
+        masks = self._masks(max_distance // self.CHUNKS)
+        hashes = self._hashes
+        seen = set()
+        matches = []
+        for chunk, table in enumerate(self._tables):
+            key = (value >> (chunk * self.CHUNK_BITS)) & self.CHUNK_MASK
+            for mask in masks:
+                for position in table.get(key ^ mask, ()):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    distance = (value ^ hashes[position]).bit_count()
+                    if distance <= max_distance and (
+                        owner is None or owner != (self._user_ids[position], self._ride_ids[position])
+                    ):
+                        matches.append((self._row_ids[position], distance))
+        return matches
+
+    def catch_up(self, session_factory: Callable[[], Session], batch_size: int = 10000) -> int:
+        """Index rows added since the last call (by this or any other process)"""
+        with self._lock:
+            db = session_factory()
+            try:
+                rows = db.query(
+                    HelmetImageHash.id, HelmetImageHash.dhash, HelmetImageHash.user_id, HelmetImageHash.ride_id
+                ).filter(
+                    HelmetImageHash.id > self.last_row_id
+                ).order_by(HelmetImageHash.id).execution_options(yield_per=batch_size)
+                added = 0
+                for row_id, value, user_id, ride_id in rows:
+                    self._add(row_id, to_unsigned(value), user_id, ride_id)
+                    added += 1
+                return added
+            finally:
+                db.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "hashes": len(self._hashes),
+            "max_distance": self.max_distance,
+            "buckets": [len(table) for table in self._tables]
+        }
+
+# Global index of helmet photos used by previous checks
+helmet_hashes = PerceptualHashIndex()
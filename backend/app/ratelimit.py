@@ -0,0 +1,113 @@
+from fastapi import Depends, HTTPException, status
+from app.auth import get_current_user_readonly
+from app.models import User
+from typing import Dict, Optional, Tuple
+import math
+import os
+import time
+
+# Budgets as (tokens per second, burst). Override one with e.g.
+# RATE_LIMIT_WS_LOCATION_UPDATE=2,10 (rate,burst).
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "ws_location_update": (1.0, 5),  # the app sends a fix every few seconds
+    "ws_subscribe_ride": (5.0, 20),
+    "ws_unsubscribe_ride": (5.0, 20),
+    "ws_default": (10.0, 30),  # pongs and anything else
+    "rest_nearby": (2.0, 10),
+}
+
+# Never throttled, whatever the client does
+EXEMPT_BUDGETS = {"ws_emergency_alert"}
+
+def _budget_from_env(name: str, default: Tuple[float, float]) -> Tuple[float, float]:
+    value = os.getenv(f"RATE_LIMIT_{name.upper()}")
+    if not value:
+        return default
+    rate, burst = value.split(",")
+    return float(rate), float(burst)
+
+class TokenBucket:
+    """Per-user token buckets for one budget
+
+    A bucket is only stored while it is below burst: one whose tokens would
+    have refilled completely is the same as no entry, so idle users are
+    swept out and the dict stays the size of the currently active set.
+    """
+
+    def __init__(self, rate: float, burst: float, sweep_seconds: float = 60.0):
+        self.rate = rate
+        self.burst = burst
+        self.sweep_seconds = sweep_seconds
+        self._buckets: Dict[int, list] = {}  # user_id -> [tokens, updated]
+        self._next_sweep = time.monotonic() + sweep_seconds
+        self.stats = {"allowed": 0, "rejected": 0}
+
+    def take(self, user_id: int, now: Optional[float] = None) -> float:
+        """0.0 if a token was taken, else seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            self.stats["allowed"] += 1
+            return 0.0
+        self.stats["rejected"] += 1
+        return (1.0 - bucket[0]) / self.rate
+
+    def _sweep(self, now: float):
+        refill_seconds = self.burst / self.rate
+        self._buckets = {
+            user_id: bucket for user_id, bucket in self._buckets.items() if now - bucket[1] < refill_seconds
+        }
+        self._next_sweep = now + self.sweep_seconds
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "rate": self.rate, "burst": self.burst, "tracked_users": len(self._buckets)}
+
+class RateLimits:
+    """Named budgets; unknown names use their prefix's default budget (ws_default), if any"""
+
+    def __init__(self, budgets: Dict[str, Tuple[float, float]] = DEFAULT_RATE_LIMITS):
+        self.buckets = {name: TokenBucket(*_budget_from_env(name, budget)) for name, budget in budgets.items()}
+        self.exempt = {name: 0 for name in EXEMPT_BUDGETS}
+
+    def take(self, budget: str, user_id: int, now: Optional[float] = None) -> float:
+        """0.0 if allowed, else the Retry-After in seconds"""
+        if budget in self.exempt:
+            self.exempt[budget] += 1
+            return 0.0
+        bucket = self.buckets.get(budget) or self.buckets.get(budget.split("_", 1)[0] + "_default")
+        return bucket.take(user_id, now) if bucket is not None else 0.0
+
+    def get_stats(self) -> dict:
+        return {
+            "budgets": {name: bucket.get_stats() for name, bucket in self.buckets.items()},
+            "exempt": dict(self.exempt),
+            "rejected": sum(bucket.stats["rejected"] for bucket in self.buckets.values())
+        }
+
+# Global limiter shared by WebSocket messages and REST routes
+rate_limits = RateLimits()
+
+def rate_limited(budget: str):
+    """Route dependency: the current user, or 429 once they exceed the budget"""
+
+    async def dependency(current_user: User = Depends(get_current_user_readonly)) -> User:
+        retry_after = rate_limits.take(budget, current_user.id)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please slow down",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+        return current_user
+
+    return dependency
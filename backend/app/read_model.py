@@ -0,0 +1,280 @@
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.database import SessionLocal
+from app.models import Ride, RideParticipant, RideStatus
+from app.schemas import RideResponse
+from app.serialization import ride_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import json
+import math
+import os
+
+OPEN_STATUSES = (RideStatus.CREATED, RideStatus.REQUESTED)
+OPEN_RIDES_RECONCILE_SECONDS = float(os.getenv("OPEN_RIDES_RECONCILE_SECONDS", "60"))
+
+# Grid cell size for the proximity index (~5.5 km of latitude)
+CELL_DEGREES = 0.05
+EARTH_RADIUS_KM = 6371
+
+class OpenRide:
+    """In-memory view of one joinable ride"""
+    __slots__ = (
+        "ride_id", "host_id", "status", "start_lat", "start_lng",
+        "max_passengers", "requested", "confirmed", "rider_ids", "payload", "json"
+    )
+
+    def __init__(self, ride_id, host_id, status, start_lat, start_lng, max_passengers, payload, json_bytes):
+        self.ride_id = ride_id
+        self.host_id = host_id
+        self.status = status
+        self.start_lat = start_lat
+        self.start_lng = start_lng
+        self.max_passengers = max_passengers
+        self.requested = 0
+        self.confirmed = 0
+        self.rider_ids: Set[int] = set()
+        self.payload = payload
+        self.json = json_bytes
+
+    @property
+    def seats_left(self) -> int:
+        return self.max_passengers - self.confirmed
+
+def _cell(lat: float, lng: float) -> Tuple[int, int]:
+    return (math.floor(lat / CELL_DEGREES), math.floor(lng / CELL_DEGREES))
+
+def _distance_km(lat1, lng1, lat2, lng2) -> float:
+    """Haversine distance, same formula as routes.rides.calculate_distance"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lng = math.radians(lng2 - lng1)
+    a = (math.sin(delta_lat / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) *
+         math.sin(delta_lng / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+class OpenRideStore:
+    """CQRS read model of CREATED/REQUESTED rides and their participants
+
+    Loaded at startup, updated by the ride lifecycle handlers right after they
+    commit, and periodically reconciled against the database to repair drift
+    (e.g. writes made by another worker process).
+    """
+
+    def __init__(self):
+        self._rides: Dict[int, OpenRide] = {}
+        self._grid: Dict[Tuple[int, int], Set[int]] = {}
+        # ride_id -> sequence number of the last in-process change, so a
+        # reconcile that raced with live events does not roll them back
+        self._sequence = 0
+        self._touched: Dict[int, int] = {}
+        self.loaded = False
+        self.stats = {"reconciliations": 0, "repaired": 0}
+
+    def __len__(self):
+        return len(self._rides)
+
+    def get(self, ride_id: int) -> Optional[OpenRide]:
+        return self._rides.get(ride_id)
+
+    # Index maintenance
+    def _index(self, ride: OpenRide):
+        self._grid.setdefault(_cell(ride.start_lat, ride.start_lng), set()).add(ride.ride_id)
+
+    def _unindex(self, ride: OpenRide):
+        cell = _cell(ride.start_lat, ride.start_lng)
+        members = self._grid.get(cell)
+        if members is not None:
+            members.discard(ride.ride_id)
+            if not members:
+                del self._grid[cell]
+
+    def _touch(self, ride_id: int):
+        self._sequence += 1
+        self._touched[ride_id] = self._sequence
+
+    def _put(self, ride: OpenRide):
+        previous = self._rides.get(ride.ride_id)
+        if previous is not None:
+            self._unindex(previous)
+        self._rides[ride.ride_id] = ride
+        self._index(ride)
+
+    def _drop(self, ride_id: int):
+        ride = self._rides.pop(ride_id, None)
+        if ride is not None:
+            self._unindex(ride)
+
+    @staticmethod
+    def _from_row(ride: Ride, use_cache: bool = True) -> OpenRide:
+        if use_cache:
+            cached = ride_cache.get(ride)
+            payload, json_bytes = cached.payload, cached.json
+        else:
+            # Snapshots are built off the event loop thread; keep them away from the shared cache
+            model = RideResponse.model_validate(ride)
+            payload, json_bytes = model.model_dump(mode="json"), model.model_dump_json().encode()
+        return OpenRide(
+            ride.id, ride.host_id, ride.status, ride.start_lat, ride.start_lng,
+            ride.max_passengers, payload, json_bytes
+        )
+
+    # Lifecycle events
+    def ride_created(self, ride: Ride) -> Optional[OpenRide]:
+        """A ride was created or found open in the DB"""
+        self._touch(ride.id)
+        if ride.status not in OPEN_STATUSES:
+            self._drop(ride.id)
+            return None
+        open_ride = self._from_row(ride)
+        existing = self._rides.get(ride.id)
+        if existing is not None:
+            open_ride.requested = existing.requested
+            open_ride.confirmed = existing.confirmed
+            open_ride.rider_ids = existing.rider_ids
+        self._put(open_ride)
+        return open_ride
+
+    def ride_joined(self, ride_id: int, rider_id: int, new_status: RideStatus):
+        """A join request was committed"""
+        self._touch(ride_id)
+        ride = self._rides.get(ride_id)
+        if ride is None:
+            return
+        ride.requested += 1
+        ride.rider_ids.add(rider_id)
+        if ride.status != new_status:
+            self._set_status(ride, new_status)
+
+    def ride_status_changed(self, ride_id: int, new_status: RideStatus):
+        """A lifecycle transition was committed"""
+        self._touch(ride_id)
+        ride = self._rides.get(ride_id)
+        if ride is None:
+            return
+        if new_status not in OPEN_STATUSES:
+            self._drop(ride_id)
+        else:
+            self._set_status(ride, new_status)
+
+    @staticmethod
+    def _set_status(ride: OpenRide, new_status: RideStatus):
+        ride.status = new_status
+        ride.payload = {**ride.payload, "status": new_status.value}
+        ride.json = json.dumps(ride.payload, separators=(",", ":")).encode()
+
+    # Queries
+    def nearby(self, lat: float, lng: float, radius_km: float) -> List[OpenRide]:
+        """Open rides starting within radius_km of (lat, lng)"""
+        dlat = radius_km / 111.0
+        dlng = radius_km / max(111.0 * math.cos(math.radians(lat)), 1e-6)
+        min_cell = _cell(lat - dlat, lng - dlng)
+        max_cell = _cell(lat + dlat, lng + dlng)
+        cell_count = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+
+        if cell_count > len(self._grid):
+            candidates: Iterable[OpenRide] = self._rides.values()
+        else:
+            candidates = (
+                self._rides[ride_id]
+                for x in range(min_cell[0], max_cell[0] + 1)
+                for y in range(min_cell[1], max_cell[1] + 1)
+                for ride_id in self._grid.get((x, y), ())
+            )
+
+        results = []
+        for ride in candidates:
+            # Cheap bounding-box reject before the trigonometry
+            if abs(ride.start_lat - lat) > dlat or abs(ride.start_lng - lng) > dlng:
+                continue
+            if _distance_km(lat, lng, ride.start_lat, ride.start_lng) <= radius_km:
+                results.append(ride)
+        return results
+
+    # Loading and reconciliation
+    @staticmethod
+    def snapshot(db: Session) -> Dict[int, OpenRide]:
+        """Read every open ride and its participants from the database"""
+        rides = db.query(Ride).filter(Ride.status.in_(OPEN_STATUSES)).all()
+        snapshot = {ride.id: OpenRideStore._from_row(ride, use_cache=False) for ride in rides}
+
+        participants = db.query(
+            RideParticipant.ride_id, RideParticipant.rider_id, RideParticipant.status
+        ).join(Ride, Ride.id == RideParticipant.ride_id).filter(
+            Ride.status.in_(OPEN_STATUSES)
+        ).all()
+        for ride_id, rider_id, participant_status in participants:
+            ride = snapshot.get(ride_id)
+            if ride is None:
+                continue
+            ride.rider_ids.add(rider_id)
+            if participant_status == "requested":
+                ride.requested += 1
+            elif participant_status == "confirmed":
+                ride.confirmed += 1
+        return snapshot
+
+    def sequence(self) -> int:
+        return self._sequence
+
+    def reconcile(self, snapshot: Dict[int, OpenRide], started_at_sequence: int) -> int:
+        """Swap in a DB snapshot, keeping rides changed in-process since it was taken"""
+        repaired = 0
+        for ride_id in set(self._rides) | set(snapshot):
+            if self._touched.get(ride_id, 0) > started_at_sequence:
+                continue
+            fresh = snapshot.get(ride_id)
+            current = self._rides.get(ride_id)
+            if fresh is None:
+                if current is not None:
+                    self._drop(ride_id)
+                    repaired += 1
+            elif current is None or (
+                current.status != fresh.status
+                or current.requested != fresh.requested
+                or current.confirmed != fresh.confirmed
+            ):
+                self._put(fresh)
+                repaired += int(self.loaded)
+            else:
+                # Unchanged: keep the current object, refresh its payload
+                current.payload, current.json = fresh.payload, fresh.json
+
+        # Entries older than this snapshot are now covered by it
+        self._touched = {k: v for k, v in self._touched.items() if v > started_at_sequence}
+        self.loaded = True
+        self.stats["reconciliations"] += 1
+        self.stats["repaired"] += repaired
+        return repaired
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "open_rides": len(self._rides), "grid_cells": len(self._grid)}
+
+# Global read model instance
+open_rides = OpenRideStore()
+
+def _load_snapshot() -> Dict[int, OpenRide]:
+    db = SessionLocal()
+    try:
+        return OpenRideStore.snapshot(db)
+    finally:
+        db.close()
+
+async def reconcile_open_rides():
+    """Re-read open rides from the primary off the event loop and merge them in"""
+    started_at = open_rides.sequence()
+    snapshot = await run_in_threadpool(_load_snapshot)
+    repaired = open_rides.reconcile(snapshot, started_at)
+    if repaired:
+        print(f"🗺️  Open-ride read model repaired {repaired} rides during reconciliation")
+
+async def run_reconciliation_loop(interval: float = OPEN_RIDES_RECONCILE_SECONDS):
+    """Background task that keeps the read model honest"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reconcile_open_rides()
+        except Exception as e:
+            print(f"⚠️  Open-ride reconciliation failed: {e}")
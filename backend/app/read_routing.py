@@ -0,0 +1,152 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import OperationalError
+from jose import JWTError, jwt
+from typing import Dict, List, Optional
+import itertools
+import random
+import threading
+import time
+
+POLICIES = ("round_robin", "random", "least_busy")
+
+class ReplicaRouter:
+    """Pick the engine a read-only session should use
+
+    Reads go to a healthy replica chosen by the load-balancing policy. A caller
+    who committed a write within the last `sticky_seconds` is pinned to the
+    primary so they read their own writes, and a replica that fails to hand
+    out a connection is skipped for `retry_seconds` with reads falling back to
+    the primary.
+    """
+
+    def __init__(
+        self,
+        primary,
+        replicas: List,
+        policy: str = "round_robin",
+        sticky_seconds: float = 5.0,
+        retry_seconds: float = 30.0,
+        max_sticky_keys: int = 100000
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown replica policy '{policy}', expected one of {POLICIES}")
+
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.policy = policy
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.max_sticky_keys = max_sticky_keys
+
+        self._round_robin = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        # Read sessions open in the threadpool and mark_write runs in after_commit,
+        # so the stickiness map is touched from many threads
+        self._last_write: Dict[str, float] = {}
+        self._sticky_lock = threading.Lock()
+        self._down_until: Dict[int, float] = {}
+        self.stats = {"primary_reads": 0, "replica_reads": 0, "sticky_reads": 0, "fallbacks": 0}
+
+    # Read-your-writes stickiness
+    def mark_write(self, key: Optional[str]):
+        """Pin `key` to the primary for the stickiness window"""
+        if not key or not self.replicas:
+            return
+        now = time.monotonic()
+        with self._sticky_lock:
+            if len(self._last_write) >= self.max_sticky_keys:
+                self._prune(now)
+            self._last_write[key] = now
+
+    def is_sticky(self, key: Optional[str]) -> bool:
+        if not key:
+            return False
+        written_at = self._last_write.get(key)
+        if written_at is None:
+            return False
+        if time.monotonic() - written_at > self.sticky_seconds:
+            with self._sticky_lock:
+                # Another reader may have expired it (or the writer renewed it) meanwhile
+                if self._last_write.get(key) == written_at:
+                    del self._last_write[key]
+            return False
+        return True
+
+    def _prune(self, now: float):
+        """Drop expired keys (caller holds _sticky_lock)"""
+        expired = [key for key, at in self._last_write.items() if now - at > self.sticky_seconds]
+        for key in expired:
+            del self._last_write[key]
+        # Still full of fresh writers: forget the oldest half rather than grow without bound
+        if len(self._last_write) >= self.max_sticky_keys:
+            for key in sorted(self._last_write, key=self._last_write.get)[:len(self._last_write) // 2]:
+                del self._last_write[key]
+
+    # Replica selection
+    def _healthy(self) -> List[int]:
+        now = time.monotonic()
+        return [i for i in range(len(self.replicas)) if self._down_until.get(i, 0) <= now]
+
+    def _pick(self, healthy: List[int]) -> int:
+        if self.policy == "random":
+            return random.choice(healthy)
+        if self.policy == "least_busy":
+            return min(healthy, key=lambda i: self.replicas[i].pool.checkedout())
+        # round_robin: advance until we land on a healthy replica
+        for _ in range(len(self.replicas)):
+            index = next(self._round_robin)
+            if index in healthy:
+                return index
+        return healthy[0]
+
+    def session(self, key: Optional[str] = None) -> Session:
+        """Open a read-only session on a replica, or on the primary when pinned or degraded"""
+        if not self.replicas:
+            self.stats["primary_reads"] += 1
+            return Session(bind=self.primary, autoflush=False)
+
+        if self.is_sticky(key):
+            self.stats["sticky_reads"] += 1
+            return Session(bind=self.primary, autoflush=False)
+
+        healthy = self._healthy()
+        while healthy:
+            index = self._pick(healthy)
+            db = Session(bind=self.replicas[index], autoflush=False)
+            try:
+                # Check a connection out now so an unreachable replica falls back here,
+                # not halfway through the route handler
+                db.connection()
+                self.stats["replica_reads"] += 1
+                return db
+            except OperationalError:
+                db.close()
+                self._down_until[index] = time.monotonic() + self.retry_seconds
+                self.stats["fallbacks"] += 1
+                print(f"⚠️  Read replica {index} unavailable, retrying it in {self.retry_seconds}s")
+                healthy.remove(index)
+
+        self.stats["primary_reads"] += 1
+        return Session(bind=self.primary, autoflush=False)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "replicas": len(self.replicas),
+            "healthy_replicas": len(self._healthy()),
+            "policy": self.policy,
+            "sticky_users": len(self._last_write)
+        }
+
+def sticky_key_from_headers(headers) -> Optional[str]:
+    """Identify the caller for read-your-writes routing
+
+    The token is only inspected here, not trusted: authentication still happens
+    in app.auth.verify_token. A forged `sub` can at worst route reads to the primary.
+    """
+    authorization = headers.get("authorization") if headers is not None else None
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        return jwt.get_unverified_claims(authorization.split(" ", 1)[1]).get("sub")
+    except JWTError:
+        return None
@@ -0,0 +1,118 @@
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+from app.models import HelmetCheck, Ride, RideParticipant, User
+from collections import OrderedDict
+from typing import List, Optional, Set
+import os
+import time
+
+# Cached "ready" answers are trusted for this long; "not ready" is always re-read
+HELMET_READINESS_TTL_SECONDS = float(os.getenv("HELMET_READINESS_TTL_SECONDS", "30"))
+
+def ride_helmet_rows(db: Session, ride_id: int) -> List[tuple]:
+    """One joined query: the ride's host plus every active participant and their helmet check
+
+    Yields a single row with NULL participant columns for a ride nobody joined,
+    and no rows at all for an unknown ride.
+    """
+    return db.query(
+        Ride.host_id,
+        RideParticipant.rider_id,
+        RideParticipant.status,
+        User.full_name,
+        HelmetCheck.id,
+        HelmetCheck.is_verified,
+        HelmetCheck.image_url,
+        HelmetCheck.created_at,
+        HelmetCheck.has_variants
+    ).outerjoin(
+        RideParticipant,
+        and_(RideParticipant.ride_id == Ride.id, RideParticipant.status != "cancelled")
+    ).outerjoin(
+        User, User.id == RideParticipant.rider_id
+    ).outerjoin(
+        HelmetCheck,
+        and_(HelmetCheck.ride_id == Ride.id, HelmetCheck.user_id == RideParticipant.rider_id)
+    ).filter(Ride.id == ride_id).all()
+
+class RideReadiness:
+    """Which confirmed riders of a ride still need a verified helmet"""
+    __slots__ = ("required", "verified", "loaded_at")
+
+    def __init__(self, required: Set[int], verified: Set[int]):
+        self.required = required
+        self.verified = verified
+        self.loaded_at = time.monotonic()
+
+    @property
+    def missing(self) -> Set[int]:
+        return self.required - self.verified
+
+    @property
+    def ready(self) -> bool:
+        return self.required <= self.verified
+
+    @classmethod
+    def from_rows(cls, rows: List[tuple]) -> "RideReadiness":
+        required, verified = set(), set()
+        for _, rider_id, participant_status, _, _, is_verified, _, _, _ in rows:
+            if rider_id is None or participant_status != "confirmed":
+                continue
+            required.add(rider_id)
+            if is_verified:
+                verified.add(rider_id)
+        return cls(required, verified)
+
+class HelmetReadinessCache:
+    """Per-ride helmet readiness summaries for gating start_ride
+
+    The verification worker marks riders verified as results are written, and
+    confirm/delete invalidate the ride. Another worker process can only make a
+    cached entry look *less* ready than it is, so start_ride re-reads before
+    refusing; a cached "ready" is trusted for ttl_seconds.
+    """
+
+    def __init__(self, ttl_seconds: float = HELMET_READINESS_TTL_SECONDS, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, RideReadiness]" = OrderedDict()
+        self.stats = {"hits": 0, "loads": 0}
+
+    def _store(self, ride_id: int, readiness: RideReadiness) -> RideReadiness:
+        self._entries[ride_id] = readiness
+        self._entries.move_to_end(ride_id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return readiness
+
+    def load(self, db: Session, ride_id: int) -> RideReadiness:
+        self.stats["loads"] += 1
+        return self._store(ride_id, RideReadiness.from_rows(ride_helmet_rows(db, ride_id)))
+
+    def peek(self, ride_id: int) -> Optional[RideReadiness]:
+        readiness = self._entries.get(ride_id)
+        if readiness is None or time.monotonic() - readiness.loaded_at > self.ttl_seconds:
+            return None
+        return readiness
+
+    def ensure_ready(self, db: Session, ride_id: int) -> RideReadiness:
+        """Readiness for the start transition (cached when ready, fresh otherwise)"""
+        readiness = self.peek(ride_id)
+        if readiness is not None and readiness.ready:
+            self.stats["hits"] += 1
+            return readiness
+        return self.load(db, ride_id)
+
+    def rider_verified(self, ride_id: int, user_id: int):
+        readiness = self._entries.get(ride_id)
+        if readiness is not None:
+            readiness.verified.add(user_id)
+
+    def invalidate(self, ride_id: int):
+        self._entries.pop(ride_id, None)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "entries": len(self._entries)}
+
+# Global readiness cache
+helmet_readiness = HelmetReadinessCache()
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.database import read_router
+from app.models import User, UserRole
+from app.auth import get_current_user_readonly
+from app.exports import export_rides
+from app.serialization import NDJSONResponse
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+
+router = APIRouter()
+
+def require_admin(current_user: User = Depends(get_current_user_readonly)) -> User:
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
+@router.get("/export/rides")
+async def export_rides_endpoint(
+    start: datetime,
+    end: datetime,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    admin: User = Depends(require_admin)
+):
+    """Stream rides created in [start, end) with participant and helmet counts"""
+    
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="end must be after start"
+        )
+    
+    # The body is produced after this handler returns, so the export opens
+    # its own (replica-routed) sessions chunk by chunk
+    body = export_rides(read_router.session, start, end, format)
+    filename = f"rides-{start:%Y%m%d%H%M}-{end:%Y%m%d%H%M}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    
+    if format == "csv":
+        return StreamingResponse(body, media_type="text/csv", headers=headers)
+    return NDJSONResponse(body, headers=headers)
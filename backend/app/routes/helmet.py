@@ -1,25 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Request, Response
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import HelmetCheck, User, Ride
-from app.schemas import HelmetCheckCreate, HelmetCheckResponse
-from app.auth import get_current_user
-from typing import List
+from app.database import SessionLocal, get_db, get_read_db, read_router
+from app.read_routing import sticky_key_from_headers
+from app.models import HelmetCheck, User, Ride, UserRole, VerificationStatus
+from app.schemas import HelmetCheckCreate, HelmetCheckResponse, ParticipantHelmetStatus, RideHelmetStatusResponse
+from app.auth import get_current_user, get_current_user_readonly
+from app.uploads import stream_upload_to_disk
+from app.storage import blob_extension, helmet_store
+from app.images import image_pipeline
+from app.verification import VerificationJob, helmet_verifier
+from app.readiness import RideReadiness, helmet_readiness, ride_helmet_rows
+from app.pagination import Keyset, decode_cursor, encode_cursor, merge_newest_first, newest_first
+from app.stats import bump_user_stats
+from app.archive import archived_helmet_check, archived_helmet_checks_page, archived_ride_helmet_rows
+from app.serialization import NDJSONResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import asyncio
 import os
-import uuid
 from datetime import datetime
 
 router = APIRouter()
 
-# Simple file upload directory (in production, use cloud storage)
-UPLOAD_DIR = "uploads/helmets"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 @router.post("/upload", response_model=dict)
 async def upload_helmet_image(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_readonly)
 ):
     """Upload helmet verification image"""
     
@@ -30,32 +36,91 @@ async def upload_helmet_image(
             detail="Only image files are allowed"
         )
     
-    # Generate unique filename
-    file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
+    # Stream to disk in chunks (size-limited, hashed on the way)
+    stored = await stream_upload_to_disk(file, helmet_store.root)
     
-    # Save file
     try:
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Content-addressed: re-uploads of the same image reuse the stored file
+        extension = blob_extension(stored.head, file.filename)
+        image_url, _ = await helmet_store.put(stored, extension)
         
-        # Return file URL (in production, return cloud storage URL)
-        image_url = f"/uploads/helmets/{unique_filename}"
+        # Downscaled/thumbnail variants are rendered in the background
+        image_pipeline.submit(stored.sha256, extension)
         
         return {
             "success": True,
             "image_url": image_url,
+            "sha256": stored.sha256,
+            "size": stored.size,
             "message": "Image uploaded successfully"
         }
         
-    except Exception as e:
+    except OSError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to upload image"
         )
 
+def helmet_image_path(image_url: str):
+    """Local file to verify for an uploaded image (the downscaled copy when ready)"""
+    digest = helmet_store.digest_of_url(image_url)
+    if digest is not None:
+        verify_path, _ = image_pipeline.variant_paths(digest)
+        if os.path.exists(verify_path):
+            return verify_path
+    path = helmet_store.path_for_url(image_url)
+    return path if path is not None and os.path.isfile(path) else None
+
+def pending_verification_jobs() -> List[VerificationJob]:
+    """Jobs for checks a previous run left PENDING (their image gone: settled as FAILED)"""
+    db = SessionLocal()
+    try:
+        # Checks verified before verification_status existed
+        db.query(HelmetCheck).filter(
+            HelmetCheck.verification_status == VerificationStatus.PENDING,
+            HelmetCheck.is_verified.is_(True)
+        ).update({HelmetCheck.verification_status: VerificationStatus.VERIFIED}, synchronize_session=False)
+        pending = db.query(HelmetCheck.id, HelmetCheck.ride_id, HelmetCheck.user_id, HelmetCheck.image_url).filter(
+            HelmetCheck.verification_status == VerificationStatus.PENDING
+        ).order_by(HelmetCheck.id).all()
+        jobs, missing = [], []
+        for check_id, ride_id, user_id, image_url in pending:
+            image_path = helmet_image_path(image_url)
+            if image_path is None:
+                missing.append(check_id)
+                continue
+            jobs.append(VerificationJob(
+                check_id, ride_id, user_id, image_path, digest=helmet_store.digest_of_url(image_url)
+            ))
+        if missing:
+            db.query(HelmetCheck).filter(HelmetCheck.id.in_(missing)).update(
+                {HelmetCheck.verification_status: VerificationStatus.FAILED}, synchronize_session=False
+            )
+        db.commit()
+        return jobs
+    finally:
+        db.close()
+
+def helmet_check_response(check) -> HelmetCheckResponse:
+    """Serialize a check (ORM or archive row), with variant URLs once they exist"""
+    response = HelmetCheckResponse.model_validate(check)
+    if check.has_variants:
+        for name, url in image_pipeline.variant_urls(check.image_url).items():
+            setattr(response, name, url)
+    return response
+
+def _mark_variants_rendered(check_id: int, digest: str):
+    if not image_pipeline.variants_exist(digest):
+        return  # rendering failed: clients keep using the original
+    db = SessionLocal()
+    try:
+        db.query(HelmetCheck).filter(HelmetCheck.id == check_id).update(
+            {"has_variants": True}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
 @router.post("/verify", response_model=HelmetCheckResponse)
 async def verify_helmet(
     helmet_data: HelmetCheckCreate,
@@ -64,6 +129,21 @@ async def verify_helmet(
 ):
     """Create helmet verification record"""
     
+    # Refuse early while the verifier is saturated rather than queueing unboundedly
+    if helmet_verifier.full():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Helmet verification is busy, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    
+    image_path = helmet_image_path(helmet_data.image_url)
+    if image_path is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload the helmet image via /api/helmet/upload first"
+        )
+    
     # Check if ride exists
     ride = db.query(Ride).filter(Ride.id == helmet_data.ride_id).first()
     if not ride:
@@ -78,39 +158,71 @@ async def verify_helmet(
         HelmetCheck.ride_id == helmet_data.ride_id
     ).first()
     
-    if existing_check:
+    if existing_check and existing_check.is_verified:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Helmet verification already exists for this ride"
         )
     
+    # Variants are usually rendered by now; if not, flag the check when they are
+    digest = helmet_store.digest_of_url(helmet_data.image_url)
+    has_variants = digest is not None and image_pipeline.variants_exist(digest)
+    
     # Create helmet check record
     helmet_check = HelmetCheck(
         user_id=current_user.id,
         ride_id=helmet_data.ride_id,
         image_url=helmet_data.image_url,
-        is_verified=True,  # In production, implement actual verification logic
+        is_verified=False,  # set by the verification worker
+        has_variants=has_variants,
         created_at=datetime.utcnow()
     )
     
+    if existing_check:
+        # A rejected, failed or still pending photo is replaced (a result for it is discarded)
+        db.delete(existing_check)
+    else:
+        bump_user_stats(db, current_user.id, helmet_checks=1)
     db.add(helmet_check)
     db.commit()
     db.refresh(helmet_check)
     
-    return helmet_check
+    # Outcome arrives as a helmet_verified WebSocket message
+    try:
+        helmet_verifier.submit(VerificationJob(
+            helmet_check.id, ride.id, current_user.id, image_path, digest=digest
+        ))
+    except asyncio.QueueFull:
+        # Settled as FAILED rather than left pending: the rider resubmits after Retry-After
+        helmet_check.verification_status = VerificationStatus.FAILED
+        db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Helmet verification is busy, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    
+    rendering = image_pipeline.in_flight(digest) if digest is not None and not has_variants else None
+    if rendering is not None:
+        check_id = helmet_check.id
+        rendering.add_done_callback(
+            lambda _: asyncio.ensure_future(run_in_threadpool(_mark_variants_rendered, check_id, digest))
+        )
+    
+    return helmet_check_response(helmet_check)
 
 @router.get("/check/{ride_id}", response_model=HelmetCheckResponse)
 async def get_helmet_check(
     ride_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_readonly),
+    db: Session = Depends(get_read_db)
 ):
     """Get helmet verification status for a ride"""
     
     helmet_check = db.query(HelmetCheck).filter(
         HelmetCheck.user_id == current_user.id,
         HelmetCheck.ride_id == ride_id
-    ).first()
+    ).first() or archived_helmet_check(current_user.id, ride_id)
     
     if not helmet_check:
         raise HTTPException(
@@ -118,20 +230,106 @@ async def get_helmet_check(
             detail="No helmet verification found for this ride"
         )
     
-    return helmet_check
+    return helmet_check_response(helmet_check)
+
+@router.get("/ride/{ride_id}", response_model=RideHelmetStatusResponse)
+async def get_ride_helmet_status(
+    ride_id: int,
+    current_user: User = Depends(get_current_user_readonly),
+    db: Session = Depends(get_read_db)
+):
+    """Helmet status of every participant of a ride (host or participants only)"""
+    
+    rows = ride_helmet_rows(db, ride_id) or archived_ride_helmet_rows(db, ride_id)
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ride not found"
+        )
+    
+    host_id = rows[0][0]
+    participant_ids = {row[1] for row in rows if row[1] is not None}
+    if current_user.id != host_id and current_user.id not in participant_ids and current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view helmet checks for this ride"
+        )
+    
+    participants = []
+    for _, rider_id, participant_status, full_name, check_id, is_verified, image_url, checked_at, has_variants in rows:
+        if rider_id is None:
+            continue
+        participants.append(ParticipantHelmetStatus(
+            user_id=rider_id,
+            full_name=full_name,
+            participant_status=participant_status,
+            check_id=check_id,
+            is_verified=bool(is_verified),
+            image_url=image_url,
+            thumbnail_url=image_pipeline.variant_urls(image_url)["thumbnail_url"] if has_variants else None,
+            checked_at=checked_at
+        ))
+    
+    readiness = RideReadiness.from_rows(rows)
+    return RideHelmetStatusResponse(
+        ride_id=ride_id,
+        ready=readiness.ready,
+        required=len(readiness.required),
+        verified=len(readiness.verified),
+        participants=participants
+    )
+
+def helmet_checks_page(db: Session, user_id: int, after: Optional[Keyset], limit: int) -> list:
+    """One page of a user's checks across the hot and archive tables"""
+    query = db.query(HelmetCheck).filter(HelmetCheck.user_id == user_id)
+    hot = newest_first(query, HelmetCheck.created_at, HelmetCheck.id, after, limit).all()
+    return merge_newest_first([hot, archived_helmet_checks_page(user_id, after, limit)], limit)
+
+def stream_helmet_checks(user_id: int, after: Optional[Keyset], sticky_key: Optional[str], page_size: int = 500):
+    """Yield a user's checks as NDJSON, one short-lived read session per page"""
+    while True:
+        db = read_router.session(sticky_key)
+        try:
+            page = helmet_checks_page(db, user_id, after, page_size)
+            lines = [helmet_check_response(check).model_dump_json() for check in page]
+        finally:
+            db.close()
+        if lines:
+            yield ("\n".join(lines) + "\n").encode()
+        if len(page) < page_size:
+            return
+        after = (page[-1].created_at, page[-1].id)
 
 @router.get("/user-checks", response_model=List[HelmetCheckResponse])
 async def get_user_helmet_checks(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    current_user: User = Depends(get_current_user_readonly),
+    db: Session = Depends(get_read_db)
 ):
-    """Get all helmet checks for current user"""
+    """Get the current user's helmet checks, newest first
+    
+    Pages are keyset-paginated: pass the X-Next-Cursor header of one page as
+    `cursor` to get the next. format=ndjson streams the whole history instead.
+    """
     
-    helmet_checks = db.query(HelmetCheck).filter(
-        HelmetCheck.user_id == current_user.id
-    ).order_by(HelmetCheck.created_at.desc()).all()
+    after = decode_cursor(cursor) if cursor else None
     
-    return helmet_checks
+    if format == "ndjson":
+        return NDJSONResponse(stream_helmet_checks(
+            current_user.id, after, sticky_key_from_headers(request.headers)
+        ))
+    
+    helmet_checks = helmet_checks_page(db, current_user.id, after, limit + 1)
+    if len(helmet_checks) > limit:
+        helmet_checks = helmet_checks[:limit]
+        last = helmet_checks[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    
+    return [helmet_check_response(check) for check in helmet_checks]
 
 @router.delete("/check/{check_id}")
 async def delete_helmet_check(
@@ -150,13 +348,17 @@ async def delete_helmet_check(
         )
     
     # Check permissions
-    if helmet_check.user_id != current_user.id and current_user.role != "admin":
+    if helmet_check.user_id != current_user.id and current_user.role != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to delete this helmet check"
         )
     
     db.delete(helmet_check)
+    bump_user_stats(
+        db, helmet_check.user_id, helmet_checks=-1, helmet_verified=-1 if helmet_check.is_verified else 0
+    )
     db.commit()
+    helmet_readiness.invalidate(helmet_check.ride_id)
     
     return {"message": "Helmet check deleted successfully"}
\ No newline at end of file
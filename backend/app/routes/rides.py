@@ -1,12 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.database import get_db
-from app.models import Ride, User, RideStatus, RideParticipant
-from app.schemas import RideCreate, RideResponse, LocationQuery
-from app.auth import get_current_user
-from app.websocket import notify_ride_status_change, notify_new_ride_request, notify_ride_confirmation
-from typing import List
+from app.database import get_db, get_read_db
+from app.models import Ride, User, RideStatus, RideParticipant, UserRole
+from app.schemas import RideCreate, RideResponse, LocationQuery, RideMatchRequest, RideTrailResponse, UserTrail
+from app.auth import get_current_user, get_current_user_readonly, verify_token, websocket_user_ids
+from app.ratelimit import rate_limited
+from app.events import ride_events
+from app.idempotency import fingerprint, idempotent_requests
+from app.serialization import ride_cache, JSONFragmentsResponse, RawJSONResponse
+from app.read_model import open_rides, OPEN_STATUSES
+from app.readiness import helmet_readiness, ride_helmet_rows
+from app.archive import archived_ride, archived_ride_helmet_rows
+from app.trails import load_trails, simplify
+from app.tracking import ride_tracker
+from app.matching import MATCH_DEPARTURE_WINDOW_MINUTES, MATCH_MAX_ATTEMPTS, MatchRequest, ride_matcher
+from app.stats import bump_user_stats, bump_many_user_stats
+from datetime import datetime, timedelta
+from typing import List, Optional
 import math
 
 router = APIRouter()
@@ -30,13 +42,20 @@ def calculate_distance(lat1, lng1, lat2, lng2):
 @router.post("/create", response_model=RideResponse)
 async def create_ride(
     ride_data: RideCreate,
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Create a new ride"""
+    """Create a new ride (a retry with the same Idempotency-Key gets the original response)"""
     
+    return await idempotent_requests.run(
+        ("create_ride", current_user.id), idempotency_key, fingerprint(ride_data.model_dump_json()),
+        lambda: _create_ride(ride_data, current_user, db)
+    )
+
+async def _create_ride(ride_data: RideCreate, current_user: User, db: Session) -> RawJSONResponse:
     # Check if user can host rides
-    if current_user.role not in ["bike_host", "admin"]:
+    if current_user.role not in [UserRole.BIKE_HOST, UserRole.ADMIN]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only bike hosts can create rides"
@@ -59,100 +78,118 @@ async def create_ride(
     )
     
     db.add(db_ride)
+    bump_user_stats(db, current_user.id, rides_hosted=1)
     db.commit()
     db.refresh(db_ride)
     
-    # Notify about new ride creation
-    ride_response = RideResponse(
-        id=db_ride.id,
-        host_id=db_ride.host_id,
-        title=db_ride.title,
-        description=db_ride.description,
-        start_address=db_ride.start_address,
-        end_address=db_ride.end_address,
-        departure_time=db_ride.departure_time,
-        max_passengers=db_ride.max_passengers,
-        status=db_ride.status,
-        start_lat=db_ride.start_lat,
-        start_lng=db_ride.start_lng,
-        end_lat=db_ride.end_lat,
-        end_lng=db_ride.end_lng,
-        created_at=db_ride.created_at
-    )
+    # Serialize once for both the HTTP response and the WebSocket payload
+    cached_ride = ride_cache.get(db_ride)
+    open_rides.ride_created(db_ride)
     
-    # Real-time notification
-    await notify_ride_status_change(
-        db_ride.id, 
-        db_ride.status.value, 
-        ride_response.dict()
-    )
+    # Real-time notification (delivered by the event bus after the response)
+    ride_events.publish("ride_status", db_ride.id, status=db_ride.status.value, details=cached_ride.payload)
     
-    return ride_response
+    return RawJSONResponse(cached_ride.json)
 
 @router.post("/nearby", response_model=List[RideResponse])
 async def get_nearby_rides(
     location: LocationQuery,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(rate_limited("rest_nearby"))
 ):
-    """Get rides near a specific location"""
+    """Get rides near a specific location (served from the open-ride read model, 429 when over budget)"""
     
-    # Get all available rides
-    rides = db.query(Ride).filter(
-        Ride.status.in_([RideStatus.CREATED, RideStatus.REQUESTED])
-    ).all()
+    nearby_rides = open_rides.nearby(location.lat, location.lng, location.radius_km)
+    return JSONFragmentsResponse([ride.json for ride in nearby_rides])
+
+@router.get("/{ride_id}", response_model=RideResponse)
+async def get_ride(
+    ride_id: int,
+    current_user: User = Depends(get_current_user_readonly),
+    db: Session = Depends(get_read_db)
+):
+    """Get a ride snapshot (open rides come from the read model, old ones from the archive)"""
+    
+    open_ride = open_rides.get(ride_id)
+    if open_ride is not None:
+        return RawJSONResponse(open_ride.json)
     
-    # Filter by distance
-    nearby_rides = []
-    for ride in rides:
-        distance = calculate_distance(
-            location.lat, location.lng,
-            ride.start_lat, ride.start_lng
+    # Finished rides move to the archive after a while
+    ride = db.query(Ride).filter(Ride.id == ride_id).first() or archived_ride(ride_id)
+    if not ride:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ride not found"
         )
-        
-        if distance <= location.radius_km:
-            nearby_rides.append(RideResponse(
-                id=ride.id,
-                host_id=ride.host_id,
-                title=ride.title,
-                description=ride.description,
-                start_address=ride.start_address,
-                end_address=ride.end_address,
-                departure_time=ride.departure_time,
-                max_passengers=ride.max_passengers,
-                status=ride.status,
-                start_lat=ride.start_lat,
-                start_lng=ride.start_lng,
-                end_lat=ride.end_lat,
-                end_lng=ride.end_lng,
-                created_at=ride.created_at
-            ))
-    
-    return nearby_rides
+    
+    return RawJSONResponse(ride_cache.get(ride).json)
 
-@router.post("/join/{ride_id}")
-async def join_ride(
+@router.get("/{ride_id}/trail", response_model=RideTrailResponse)
+async def get_ride_trail(
     ride_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    tolerance_m: float = Query(10.0, ge=0, le=1000),
+    current_user: User = Depends(get_current_user_readonly),
+    db: Session = Depends(get_db)  # primary: chunks flushed a moment ago must be visible
 ):
-    """Request to join a ride"""
+    """Recorded location trail of every rider (host, participants or admins only)
     
-    # Check if ride exists
-    ride = db.query(Ride).filter(Ride.id == ride_id).first()
-    if not ride:
+    Each trail is simplified with Douglas-Peucker to tolerance_m metres
+    (0 returns every recorded fix).
+    """
+    
+    # Host and participants, from the same rows the helmet status uses
+    rows = ride_helmet_rows(db, ride_id) or archived_ride_helmet_rows(db, ride_id)
+    if not rows:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Ride not found"
         )
     
-    # Check if ride is available for joining
-    if ride.status not in [RideStatus.CREATED, RideStatus.REQUESTED]:
+    host_id = rows[0][0]
+    participant_ids = {row[1] for row in rows if row[1] is not None}
+    if current_user.id != host_id and current_user.id not in participant_ids and current_user.role != UserRole.ADMIN:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Ride is not available for joining"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view the trail of this ride"
         )
     
+    trails = load_trails(db, ride_id)
+    return RideTrailResponse(
+        ride_id=ride_id,
+        tolerance_m=tolerance_m,
+        trails=[
+            UserTrail(
+                user_id=user_id,
+                recorded_points=len(points),
+                points=[[lat, lng, round(at, 3)] for lat, lng, at in simplify(points, tolerance_m)]
+            )
+            for user_id, points in sorted(trails.items())
+            if user_id == host_id or user_id in participant_ids
+        ]
+    )
+
+def request_to_join(ride_id: int, current_user: User, db: Session) -> RideParticipant:
+    """Record a join request (shared by join_ride and match_ride); raises HTTPException if not allowed"""
+    
+    # Availability checks come from the read model; only rides missing from it hit the DB
+    ride = open_rides.get(ride_id)
+    if ride is None:
+        db_ride = db.query(Ride).filter(Ride.id == ride_id).first()
+        if not db_ride:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Ride not found"
+            )
+        
+        # Check if ride is available for joining
+        if db_ride.status not in OPEN_STATUSES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Ride is not available for joining"
+            )
+        
+        # Open in the DB but not in memory yet (e.g. created by another worker)
+        ride = open_rides.ride_created(db_ride)
+    
     # Check if user is not the host
     if ride.host_id == current_user.id:
         raise HTTPException(
@@ -161,7 +198,7 @@ async def join_ride(
         )
     
     # Check if user already requested to join
-    existing_request = db.query(RideParticipant).filter(
+    existing_request = current_user.id in ride.rider_ids or db.query(RideParticipant.id).filter(
         RideParticipant.ride_id == ride_id,
         RideParticipant.rider_id == current_user.id
     ).first()
@@ -173,12 +210,7 @@ async def join_ride(
         )
     
     # Check if ride has space
-    current_participants = db.query(RideParticipant).filter(
-        RideParticipant.ride_id == ride_id,
-        RideParticipant.status == "confirmed"
-    ).count()
-    
-    if current_participants >= ride.max_passengers:
+    if ride.seats_left <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Ride is full"
@@ -194,24 +226,114 @@ async def join_ride(
     db.add(participant)
     
     # Update ride status to REQUESTED if it was CREATED
-    if ride.status == RideStatus.CREATED:
-        ride.status = RideStatus.REQUESTED
-    
+    status_changed = ride.status == RideStatus.CREATED
+    if status_changed:
+        db.query(Ride).filter(
+            Ride.id == ride_id,
+            Ride.status == RideStatus.CREATED
+        ).update({"status": RideStatus.REQUESTED}, synchronize_session=False)
+    
+    bump_user_stats(db, current_user.id, rides_joined=1)
     db.commit()
     db.refresh(participant)
+    open_rides.ride_joined(ride_id, current_user.id, RideStatus.REQUESTED)
+    if status_changed:
+        ride_cache.invalidate(ride_id)
+    
+    # Real-time notifications (delivered by the event bus after the response)
+    ride_events.publish(
+        "ride_request", ride_id,
+        host_id=ride.host_id,
+        title=ride.payload.get("title"),
+        rider={
+            "user_id": current_user.id,
+            "full_name": current_user.full_name,
+            "email": current_user.email
+        }
+    )
     
-    # Real-time notifications
-    await notify_new_ride_request(ride_id, {
-        "user_id": current_user.id,
-        "full_name": current_user.full_name,
-        "email": current_user.email
-    })
+    return participant
+
+@router.post("/join/{ride_id}")
+async def join_ride(
+    ride_id: int,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Request to join a ride (a retry with the same Idempotency-Key gets the original response)"""
     
-    return {
+    return await idempotent_requests.run(
+        ("join_ride", current_user.id), idempotency_key, fingerprint(ride_id),
+        lambda: _join_ride(ride_id, current_user, db)
+    )
+
+async def _join_ride(ride_id: int, current_user: User, db: Session) -> JSONResponse:
+    participant = request_to_join(ride_id, current_user, db)
+    return JSONResponse({
         "message": "Join request sent successfully",
         "participant_id": participant.id,
         "status": participant.status
-    }
+    })
+
+@router.post("/match")
+async def match_ride(
+    trip: RideMatchRequest,
+    token_data: dict = Depends(verify_token),
+    db: Session = Depends(get_db)
+):
+    """Get matched to an open ride in the next batch and request to join it
+    
+    Requests are collected for MATCH_WINDOW_MS and assigned together (see
+    app/matching.py). No connection is held while waiting: the user id comes
+    from the same cache WebSocket connects use (a miss is looked up in the
+    threadpool), and the session is first used once a ride is assigned. A ride that refuses the join is left out of the
+    rider's next batch, up to MATCH_MAX_ATTEMPTS batches.
+    """
+    
+    user_id = await websocket_user_ids.get(token_data["supabase_id"])
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    earliest = trip.depart_after or datetime.utcnow()
+    latest = trip.depart_before or earliest + timedelta(minutes=MATCH_DEPARTURE_WINDOW_MINUTES)
+    request = MatchRequest(
+        user_id, trip.pickup_lat, trip.pickup_lng, trip.dropoff_lat, trip.dropoff_lng,
+        earliest, latest, trip.radius_km
+    )
+    user = None
+    for _ in range(MATCH_MAX_ATTEMPTS):
+        ride = await ride_matcher.match(request)
+        if ride is None:
+            break
+        if user is None:
+            user = db.get(User, user_id)
+            if user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="User not found"
+                )
+        try:
+            participant = request_to_join(ride.ride_id, user, db)
+        except HTTPException:
+            # Release the connection before waiting for the next batch
+            db.rollback()
+            ride_matcher.join_refused(request, ride.ride_id)
+            continue
+        return {
+            "message": "Matched and join request sent successfully",
+            "ride_id": ride.ride_id,
+            "participant_id": participant.id,
+            "status": participant.status
+        }
+    
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="No open ride matches this trip right now"
+    )
 
 @router.post("/confirm/{ride_id}")
 async def confirm_ride(
@@ -257,9 +379,12 @@ async def confirm_ride(
     ride.status = RideStatus.CONFIRMED
     
     db.commit()
+    ride_cache.invalidate(ride_id)
+    open_rides.ride_status_changed(ride_id, RideStatus.CONFIRMED)
+    helmet_readiness.invalidate(ride_id)
     
-    # Real-time notification
-    await notify_ride_confirmation(ride_id, confirmed_riders)
+    # Real-time notification (delivered by the event bus after the response)
+    ride_events.publish("ride_confirmed", ride_id, title=ride.title, riders=confirmed_riders)
     
     return {
         "message": "Ride confirmed successfully",
@@ -293,15 +418,28 @@ async def start_ride(
             detail="Ride must be confirmed before starting"
         )
     
+    # Every confirmed rider needs a verified helmet check
+    readiness = helmet_readiness.ensure_ready(db, ride_id)
+    if not readiness.ready:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{len(readiness.missing)} rider(s) have not verified their helmet yet"
+        )
+    
     # Update ride status
     ride.status = RideStatus.ONGOING
     db.commit()
-    
-    # Real-time notification
-    await notify_ride_status_change(
-        ride_id,
-        ride.status.value,
-        {"message": "Ride has started! Safe journey!"}
+    ride_cache.invalidate(ride_id)
+    open_rides.ride_status_changed(ride_id, RideStatus.ONGOING)
+    ride_tracker.ride_started(ride, readiness.required)
+    
+    # Real-time notification (delivered by the event bus after the response)
+    ride_events.publish(
+        "ride_status", ride_id,
+        status=ride.status.value,
+        details={"message": "Ride has started! Safe journey!"},
+        title=ride.title,
+        user_ids=[current_user.id, *readiness.required]
     )
     
     return {
@@ -337,13 +475,23 @@ async def complete_ride(
     
     # Update ride status
     ride.status = RideStatus.COMPLETED
+    confirmed_rider_ids = [rider_id for (rider_id,) in db.query(RideParticipant.rider_id).filter(
+        RideParticipant.ride_id == ride_id,
+        RideParticipant.status == "confirmed"
+    )]
+    bump_many_user_stats(db, [current_user.id, *confirmed_rider_ids], rides_completed=1)
     db.commit()
-    
-    # Real-time notification
-    await notify_ride_status_change(
-        ride_id,
-        ride.status.value,
-        {"message": "Ride completed successfully! Thank you for using PILLION."}
+    ride_cache.invalidate(ride_id)
+    open_rides.ride_status_changed(ride_id, RideStatus.COMPLETED)
+    ride_tracker.ride_finished(ride_id)
+    
+    # Real-time notification (delivered by the event bus after the response)
+    ride_events.publish(
+        "ride_status", ride_id,
+        status=ride.status.value,
+        details={"message": "Ride completed successfully! Thank you for using PILLION."},
+        title=ride.title,
+        user_ids=[current_user.id, *confirmed_rider_ids]
     )
     
     return {
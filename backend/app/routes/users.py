@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import User
-from app.schemas import UserCreate, UserResponse
-from app.auth import get_current_user
+from app.database import get_db, get_read_db
+from app.models import User, UserStats
+from app.schemas import UserCreate, UserResponse, UserStatsResponse
+from app.auth import get_current_user_readonly
 from app.services import create_user, get_user_by_supabase_id
 
 router = APIRouter()
@@ -28,6 +28,17 @@ async def register_user(
     return user
 
 @router.get("/profile", response_model=UserResponse)
-async def get_user_profile(current_user: User = Depends(get_current_user)):
+async def get_user_profile(current_user: User = Depends(get_current_user_readonly)):
     """Get current user profile"""
-    return current_user
\ No newline at end of file
+    return current_user
+
+@router.get("/stats", response_model=UserStatsResponse)
+async def get_user_stats(
+    current_user: User = Depends(get_current_user_readonly),
+    db: Session = Depends(get_read_db)
+):
+    """Get current user's ride and helmet totals (one primary-key lookup)"""
+    stats = db.get(UserStats, current_user.id)
+    if stats is None:
+        return UserStatsResponse(user_id=current_user.id)
+    return stats
@@ -1,75 +1,67 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import User
-from app.websocket import manager, handle_websocket_message
-from jose import JWTError, jwt
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from app.auth import user_id_from_token, websocket_user_ids
+from app.websocket import manager, handle_websocket_message, websocket_join_digests
+from app.notifications import push_join_digests
+from app.ratelimit import rate_limits
+from app.events import ride_events
+from app.tracking import ride_tracker
+from app.matching import ride_matcher
+from app.idempotency import idempotent_requests
 import json
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 router = APIRouter()
 
-SUPABASE_JWT_SECRET = os.getenv("JWT_SECRET")
-
-async def get_user_from_token(token: str, db: Session):
-    """Extract user from JWT token for websocket authentication"""
-    try:
-        payload = jwt.decode(
-            token, 
-            SUPABASE_JWT_SECRET, 
-            algorithms=["HS256"],
-            audience="authenticated"
-        )
-        
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
-            
-        user = db.query(User).filter(User.supabase_id == user_id).first()
-        return user
-        
-    except JWTError:
-        return None
-
 @router.websocket("/ws/{token}")
-async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Depends(get_db)):
-    """WebSocket endpoint for real-time updates"""
+async def websocket_endpoint(websocket: WebSocket, token: str):
+    """WebSocket endpoint for real-time updates
+    
+    Authentication borrows a database session only for a cache miss, so an
+    open socket holds no pooled connection however long it lives.
+    """
     
     # Authenticate user from token
-    user = await get_user_from_token(token, db)
-    if not user:
+    user_id = await user_id_from_token(token)
+    if user_id is None:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
     # Connect user to websocket
-    await manager.connect(websocket, user.id)
+    connection = await manager.connect(websocket, user_id)
     
     try:
         while True:
             # Receive message from client
             data = await websocket.receive_text()
+            manager.touch(connection)
             
             try:
                 message = json.loads(data)
-                await handle_websocket_message(websocket, user.id, message)
+                await handle_websocket_message(connection, message)
             except json.JSONDecodeError:
-                await manager.send_personal_message({
+                await manager.send_to_connection(connection, {
                     "type": "error",
                     "message": "Invalid JSON format"
-                }, user.id)
+                })
                 
     except WebSocketDisconnect:
-        manager.disconnect(user.id)
-        print(f"User {user.id} disconnected from WebSocket")
+        manager.disconnect(connection)
+        print(f"User {user_id} disconnected from WebSocket")
 
 @router.get("/ws/status")
 async def websocket_status():
     """Get WebSocket connection status"""
     return {
-        "active_connections": len(manager.active_connections),
-        "total_subscriptions": sum(len(subs) for subs in manager.ride_subscriptions.values()),
+        "active_connections": manager.connection_count,
+        "connected_users": len(manager.user_connections),
+        "total_subscriptions": manager.subscription_count,
+        "heartbeats": manager.get_stats(),
+        "reaped_connections": manager.stats["reaped_connections"],
+        "auth_cache": websocket_user_ids.get_stats(),
+        "rate_limits": rate_limits.get_stats(),
+        "event_bus": ride_events.get_stats(),
+        "ride_tracking": ride_tracker.get_stats(),
+        "ride_matching": ride_matcher.get_stats(),
+        "idempotency": idempotent_requests.get_stats(),
+        "join_digests": {"websocket": websocket_join_digests.get_stats(), "push": push_join_digests.get_stats()},
         "status": "WebSocket server running"
     }
\ No newline at end of file
@@ -1,7 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from datetime import datetime
 from typing import Optional, List
-from app.models import UserRole, RideStatus
+from app.models import UserRole, RideStatus, VerificationStatus
 
 # User schemas
 class UserBase(BaseModel):
@@ -22,6 +22,25 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class UserStatsResponse(BaseModel):
+    user_id: int
+    rides_hosted: int = 0
+    rides_joined: int = 0
+    rides_completed: int = 0
+    rides_cancelled: int = 0
+    helmet_checks: int = 0
+    helmet_verified: int = 0
+    helmet_compliance_rate: Optional[float] = None  # verified / submitted helmet checks
+    
+    class Config:
+        from_attributes = True
+
+    @model_validator(mode="after")
+    def compute_compliance_rate(self):
+        if self.helmet_checks:
+            self.helmet_compliance_rate = round(self.helmet_verified / self.helmet_checks, 4)
+        return self
+
 # Ride schemas
 class RideBase(BaseModel):
     title: str
@@ -56,6 +75,16 @@ class LocationQuery(BaseModel):
     lng: float
     radius_km: float = 5.0
 
+# Batch matching request
+class RideMatchRequest(BaseModel):
+    pickup_lat: float
+    pickup_lng: float
+    dropoff_lat: float
+    dropoff_lng: float
+    depart_after: Optional[datetime] = None  # default: now
+    depart_before: Optional[datetime] = None  # default: depart_after + MATCH_DEPARTURE_WINDOW_MINUTES
+    radius_km: float = Field(3.0, gt=0, le=20)
+
 # Helmet check schemas
 class HelmetCheckCreate(BaseModel):
     ride_id: int
@@ -67,7 +96,39 @@ class HelmetCheckResponse(BaseModel):
     ride_id: int
     image_url: str
     is_verified: bool
+    verification_status: VerificationStatus
     created_at: datetime
+    # Downscaled, metadata-free variants (None until the image pipeline has produced them;
+    # attached by the helmet routes)
+    verify_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ParticipantHelmetStatus(BaseModel):
+    user_id: int
+    full_name: str
+    participant_status: str
+    check_id: Optional[int] = None
+    is_verified: bool = False
+    image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    checked_at: Optional[datetime] = None
+
+class RideHelmetStatusResponse(BaseModel):
+    ride_id: int
+    ready: bool  # every confirmed rider has a verified helmet check
+    required: int
+    verified: int
+    participants: List[ParticipantHelmetStatus]
+
+class UserTrail(BaseModel):
+    user_id: int
+    recorded_points: int
+    points: List[List[float]]  # [lat, lng, unix seconds], simplified
+
+class RideTrailResponse(BaseModel):
+    ride_id: int
+    tolerance_m: float
+    trails: List[UserTrail]
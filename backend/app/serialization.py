@@ -0,0 +1,75 @@
+from fastapi.responses import Response, StreamingResponse
+from app.models import Ride
+from app.schemas import RideResponse
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+class CachedRide:
+    """A ride serialized once for a given version"""
+    __slots__ = ("version", "json", "payload")
+
+    def __init__(self, version: tuple, json: bytes, payload: dict):
+        self.version = version
+        self.json = json          # ready-to-send RideResponse bytes
+        self.payload = payload    # JSON-safe dict for WebSocket messages
+
+class RideCache:
+    """Serialized RideResponse per ride, rebuilt only when the ride changes
+
+    The version is (status, updated_at): every ORM update bumps updated_at, so a
+    stale entry can never be served even if an invalidate() call is missed.
+    """
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, CachedRide]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def version_of(ride: Ride) -> tuple:
+        return (ride.status, ride.updated_at)
+
+    def get(self, ride: Ride) -> CachedRide:
+        version = self.version_of(ride)
+        entry = self._entries.get(ride.id)
+        if entry is not None and entry.version == version:
+            self.hits += 1
+            self._entries.move_to_end(ride.id)
+            return entry
+
+        self.misses += 1
+        model = RideResponse.model_validate(ride)
+        entry = CachedRide(version, model.model_dump_json().encode(), model.model_dump(mode="json"))
+        self._entries[ride.id] = entry
+        self._entries.move_to_end(ride.id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def peek(self, ride_id: int) -> Optional[CachedRide]:
+        return self._entries.get(ride_id)
+
+    def invalidate(self, ride_id: int):
+        self._entries.pop(ride_id, None)
+
+    def get_stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+class JSONFragmentsResponse(Response):
+    """JSON array response assembled from already-serialized fragments"""
+    media_type = "application/json"
+
+    def render(self, content: Iterable[bytes]) -> bytes:
+        return b"[" + b",".join(content) + b"]"
+
+class RawJSONResponse(Response):
+    """Response for a single already-serialized JSON document"""
+    media_type = "application/json"
+
+class NDJSONResponse(StreamingResponse):
+    """Newline-delimited JSON streamed from an iterator of encoded lines"""
+    media_type = "application/x-ndjson"
+
+# Global ride serialization cache
+ride_cache = RideCache()
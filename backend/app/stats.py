@@ -0,0 +1,134 @@
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import RideStatus, UserStats
+from app.archive import ARCHIVE_TABLES, HOT_TABLES, ArchiveSession
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable
+
+USER_STAT_FIELDS = (
+    "rides_hosted", "rides_joined", "rides_completed", "rides_cancelled", "helmet_checks", "helmet_verified"
+)
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def bump_user_stats(db: Session, user_id: int, **deltas: int):
+    """Add deltas to a user's counters as part of the caller's transaction
+
+    A single upsert, so the first event for a user and concurrent events for
+    the same user never race on creating the row. Other dialects update the
+    row in place and insert it if missing (see _bump_without_upsert).
+    """
+    now = datetime.utcnow()
+    dialect_insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert is None:
+        _bump_without_upsert(db, user_id, deltas, now)
+        return
+    values = {field: 0 for field in USER_STAT_FIELDS}
+    values.update(deltas)
+    statement = dialect_insert(UserStats.__table__).values(user_id=user_id, updated_at=now, **values)
+    columns = UserStats.__table__.c
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[columns.user_id],
+        set_={
+            **{field: columns[field] + statement.excluded[field] for field in deltas},
+            "updated_at": statement.excluded.updated_at
+        }
+    ))
+
+def _add_to_counters(db: Session, user_id: int, deltas: Dict[str, int], now: datetime) -> int:
+    columns = UserStats.__table__.c
+    return db.execute(update(UserStats.__table__).where(columns.user_id == user_id).values(
+        updated_at=now, **{field: columns[field] + delta for field, delta in deltas.items()}
+    )).rowcount
+
+def _bump_without_upsert(db: Session, user_id: int, deltas: Dict[str, int], now: datetime):
+    """Increment in place; create the row if there is none
+
+    The increments happen in SQL, so concurrent bumps of an existing row never
+    lose updates. If another transaction creates the row between the update
+    and the insert, the insert (in a savepoint) fails on the primary key and
+    the increment is applied to that row instead.
+    """
+    if _add_to_counters(db, user_id, deltas, now):
+        return
+    values = {field: 0 for field in USER_STAT_FIELDS}
+    values.update(deltas)
+    try:
+        with db.begin_nested():
+            db.execute(insert(UserStats.__table__).values(user_id=user_id, updated_at=now, **values))
+    except IntegrityError:
+        _add_to_counters(db, user_id, deltas, now)
+
+def bump_many_user_stats(db: Session, user_ids: Iterable[int], **deltas: int):
+    for user_id in user_ids:
+        bump_user_stats(db, user_id, **deltas)
+
+def _aggregate(db: Session, tables: tuple, totals: Dict[int, Dict[str, int]]):
+    """Add one store's (hot or archive) per-user counts to totals"""
+    rides, participants, checks = tables
+
+    def count_where(condition):
+        return func.sum(case((condition, 1), else_=0))
+
+    for host_id, hosted, completed, cancelled in db.execute(select(
+        rides.c.host_id, func.count(rides.c.id),
+        count_where(rides.c.status == RideStatus.COMPLETED),
+        count_where(rides.c.status == RideStatus.CANCELLED)
+    ).group_by(rides.c.host_id)):
+        totals[host_id]["rides_hosted"] += hosted
+        totals[host_id]["rides_completed"] += completed or 0
+        totals[host_id]["rides_cancelled"] += cancelled or 0
+
+    for rider_id, joined, cancelled in db.execute(select(
+        participants.c.rider_id, func.count(participants.c.id),
+        count_where(participants.c.status == "cancelled")
+    ).group_by(participants.c.rider_id)):
+        totals[rider_id]["rides_joined"] += joined
+        totals[rider_id]["rides_cancelled"] += cancelled or 0
+
+    for rider_id, completed in db.execute(select(
+        participants.c.rider_id, func.count(participants.c.id)
+    ).join(rides, rides.c.id == participants.c.ride_id).where(
+        participants.c.status == "confirmed", rides.c.status == RideStatus.COMPLETED
+    ).group_by(participants.c.rider_id)):
+        totals[rider_id]["rides_completed"] += completed
+
+    for user_id, submitted, verified in db.execute(select(
+        checks.c.user_id, func.count(checks.c.id), count_where(checks.c.is_verified.is_(True))
+    ).group_by(checks.c.user_id)):
+        totals[user_id]["helmet_checks"] += submitted
+        totals[user_id]["helmet_verified"] += verified or 0
+
+def rebuild_user_stats(batch_size: int = 5000) -> dict:
+    """Recompute every user's counters from the hot and archived tables
+
+    The old rows are deleted first, so on SQLite the rebuild holds the write
+    lock (and on PostgreSQL the stats row locks) until it commits: lifecycle
+    events that happen meanwhile wait and are applied on top of the rebuilt
+    counts rather than lost. Do not run it alongside archive-rides, which
+    briefly has a batch in both stores.
+    """
+    totals: Dict[int, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(USER_STAT_FIELDS, 0))
+    db = SessionLocal()
+    try:
+        db.execute(delete(UserStats))
+        _aggregate(db, HOT_TABLES, totals)
+        cold = ArchiveSession()
+        try:
+            _aggregate(cold, ARCHIVE_TABLES, totals)
+        finally:
+            cold.close()
+
+        now = datetime.utcnow()
+        rows = [{"user_id": user_id, "updated_at": now, **counts} for user_id, counts in totals.items()]
+        for start in range(0, len(rows), batch_size):
+            db.execute(insert(UserStats), rows[start:start + batch_size])
+        db.commit()
+    finally:
+        db.close()
+    return {"users": len(totals)}
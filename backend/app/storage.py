@@ -0,0 +1,193 @@
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from app.uploads import StoredUpload
+from typing import Iterable, Iterator, Optional, Tuple
+import os
+import re
+import time
+
+# Served by the /uploads static mount in main.py
+HELMET_STORE_DIR = "uploads/helmets"
+HELMET_STORE_URL = "/uploads/helmets"
+
+# Extensions we keep; anything else is stored as .jpg
+ALLOWED_EXTENSIONS = {"jpg", "png", "webp", "heic", "gif"}
+
+# <2 hex>/<2 hex>/<64 hex sha256>.<ext> (variants add a suffix before the extension)
+BLOB_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})(?P<variant>\.[a-z]+)?\.(?P<ext>[a-z0-9]+)$")
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """Extension for the image format the leading bytes announce (None if unknown)"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"heim", b"heis", b"mif1", b"msf1"):
+        return "heic"
+    return None
+
+def blob_extension(head: bytes, filename: Optional[str]) -> str:
+    """Extension a blob is stored under: from its bytes, so the same image always
+    gets the same address whatever the client named it; the file name only
+    decides for formats we do not recognise"""
+    return sniff_extension(head) or normalize_extension(filename)
+
+def normalize_extension(filename: Optional[str]) -> str:
+    extension = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else "jpg"
+    extension = "jpg" if extension == "jpeg" else extension
+    return extension if extension in ALLOWED_EXTENSIONS else "jpg"
+
+class BlobStore:
+    """Content-addressed image store sharded by hash prefix
+
+    A blob lives at <root>/ab/cd/abcd....<ext> where abcd... is its SHA-256, so
+    identical uploads land on the same file and no directory grows beyond a few
+    thousand entries even with millions of images.
+    """
+
+    def __init__(self, root: str, url_prefix: str, shard_levels: int = 2, shard_width: int = 2):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+        self.shard_levels = shard_levels
+        self.shard_width = shard_width
+        os.makedirs(self.root, exist_ok=True)
+
+    def relative_path(self, digest: str, extension: str, variant: str = "") -> str:
+        shards = [digest[i * self.shard_width:(i + 1) * self.shard_width] for i in range(self.shard_levels)]
+        name = f"{digest}.{variant}.{extension}" if variant else f"{digest}.{extension}"
+        return os.path.join(*shards, name)
+
+    def path_for(self, digest: str, extension: str, variant: str = "") -> str:
+        return os.path.join(self.root, self.relative_path(digest, extension, variant))
+
+    def url_for(self, digest: str, extension: str, variant: str = "") -> str:
+        return f"{self.url_prefix}/{self.relative_path(digest, extension, variant).replace(os.sep, '/')}"
+
+    def path_for_url(self, url: str) -> Optional[str]:
+        """Map a public URL back to a file inside the store (None if it is not ours)"""
+        if not url or not url.startswith(self.url_prefix + "/"):
+            return None
+        relative = os.path.normpath(url[len(self.url_prefix) + 1:])
+        if relative.startswith("..") or os.path.isabs(relative):
+            return None
+        return os.path.join(self.root, relative)
+
+    @staticmethod
+    def digest_of_url(url: str) -> Optional[str]:
+        match = BLOB_NAME.match(url.rsplit("/", 1)[-1]) if url else None
+        return match.group("digest") if match else None
+
+    def _commit(self, stored: StoredUpload, extension: str) -> Tuple[str, bool]:
+        final_path = self.path_for(stored.sha256, extension)
+        if os.path.exists(final_path):
+            # Identical bytes already stored: restart the GC grace period, since a
+            # new reference to the blob is on its way, and drop the new copy
+            try:
+                os.utime(final_path)
+            except FileNotFoundError:
+                # The GC removed the old blob between the check and the touch:
+                # store this copy in its place instead
+                pass
+            else:
+                os.remove(stored.path)
+                return final_path, False
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(stored.path, final_path)
+        return final_path, True
+
+    async def put(self, stored: StoredUpload, extension: str) -> Tuple[str, bool]:
+        """Move a streamed upload into place; returns (url, newly_stored)"""
+        _, created = await run_in_threadpool(self._commit, stored, extension)
+        return self.url_for(stored.sha256, extension), created
+
+    def iter_blobs(self) -> Iterator[Tuple[str, str, os.stat_result]]:
+        """Yield (path, digest, stat) for every blob and variant in the store"""
+        stack = [self.root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    match = BLOB_NAME.match(entry.name)
+                    if match:
+                        yield entry.path, match.group("digest"), entry.stat(follow_symlinks=False)
+
+    def iter_partials(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """Yield leftover .part files from interrupted uploads"""
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".part"):
+                    yield entry.path, entry.stat()
+
+    def collect_garbage(
+        self,
+        referenced_urls: Iterable[str],
+        grace_seconds: float = 3600,
+        dry_run: bool = False
+    ) -> dict:
+        """Delete blobs no HelmetCheck.image_url refers to
+
+        Blobs younger than `grace_seconds` survive, because a rider uploads first
+        and only references the image in the follow-up verify call.
+        """
+        referenced = set()
+        for url in referenced_urls:
+            digest = self.digest_of_url(url)
+            if digest:
+                referenced.add(digest)
+
+        cutoff = time.time() - grace_seconds
+        stats = {"scanned": 0, "referenced": len(referenced), "removed": 0, "removed_bytes": 0, "kept_recent": 0}
+
+        for path, digest, stat_result in self.iter_blobs():
+            stats["scanned"] += 1
+            if digest in referenced:
+                continue
+            if stat_result.st_mtime > cutoff:
+                stats["kept_recent"] += 1
+                continue
+            stats["removed"] += 1
+            stats["removed_bytes"] += stat_result.st_size
+            if not dry_run:
+                os.remove(path)
+
+        for path, stat_result in self.iter_partials():
+            if stat_result.st_mtime <= cutoff:
+                stats["removed"] += 1
+                stats["removed_bytes"] += stat_result.st_size
+                if not dry_run:
+                    os.remove(path)
+
+        return stats
+
+class ContentAddressedStaticFiles(StaticFiles):
+    """StaticFiles that marks content-addressed blobs as immutable
+
+    The file name is the SHA-256 of its bytes, so it doubles as a strong ETag and
+    the response can be cached forever. Other files get Starlette's defaults.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        match = BLOB_NAME.match(os.path.basename(str(full_path)))
+        if match is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        headers = {
+            "etag": f'"{match.group("digest")}{match.group("variant") or ""}"',
+            "cache-control": "public, max-age=31536000, immutable"
+        }
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+# Global helmet image store
+helmet_store = BlobStore(HELMET_STORE_DIR, HELMET_STORE_URL)
@@ -0,0 +1,41 @@
+from typing import Any, Dict, Iterator, List
+import math
+
+class TimerWheel:
+    """Coarse timers bucketed by tick, expired in O(expired)
+
+    schedule() drops an item into the bucket of the tick its deadline falls
+    in; advance() pops only the buckets whose tick has passed. Buckets are
+    keyed by absolute tick number, so there is no wrap-around to handle and
+    a far-off deadline costs the same as a near one. Cancelling is left to
+    the caller: check whether a popped item is still current and ignore or
+    reschedule it (cheaper than removing it from its bucket on every touch).
+    """
+
+    def __init__(self, tick_seconds: float, now: float = 0.0):
+        self.tick_seconds = tick_seconds
+        self._buckets: Dict[int, List[Any]] = {}
+        self._current = self._tick_of(now)
+        self.scheduled = 0
+
+    def __len__(self):
+        return self.scheduled
+
+    def _tick_of(self, when: float) -> int:
+        return math.floor(when / self.tick_seconds)
+
+    def schedule(self, item: Any, deadline: float):
+        # Never into a bucket that has already been expired
+        tick = max(math.ceil(deadline / self.tick_seconds), self._current + 1)
+        self._buckets.setdefault(tick, []).append(item)
+        self.scheduled += 1
+
+    def advance(self, now: float) -> Iterator[Any]:
+        """Items whose deadline is at or before now"""
+        target = self._tick_of(now)
+        while self._current < target:
+            self._current += 1
+            bucket = self._buckets.pop(self._current, None)
+            if bucket:
+                self.scheduled -= len(bucket)
+                yield from bucket
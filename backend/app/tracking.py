@@ -0,0 +1,215 @@
+from starlette.concurrency import run_in_threadpool
+from app.database import SessionLocal
+from app.events import ride_events
+from app.models import Ride, RideParticipant, RideStatus
+from typing import Dict, List, Optional
+import math
+import os
+import time
+
+# A ride is off route once its host is this far from the start-end line ...
+ROUTE_DEVIATION_METERS = float(os.getenv("ROUTE_DEVIATION_METERS", "1000"))
+# ... for this many fixes in a row (one bad GPS fix is not a deviation)
+ROUTE_DEVIATION_FIXES = int(os.getenv("ROUTE_DEVIATION_FIXES", "3"))
+# Speed assumed for the ETA until the ride has moved (km/h)
+DEFAULT_SPEED_KMH = float(os.getenv("DEFAULT_SPEED_KMH", "25"))
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = math.pi / 180 * EARTH_RADIUS_M
+# Moves shorter than this are GPS jitter, not distance travelled
+JITTER_METERS = 5.0
+# Weight of the newest speed sample in the moving average
+SPEED_SMOOTHING = 0.3
+# Samples above this (m/s) are GPS jumps and are capped
+MAX_SPEED_MPS = 40.0
+# Back on route once within this share of the deviation threshold
+ROUTE_REJOIN_RATIO = 0.8
+
+class RideTrack:
+    """Running state of one ongoing ride, updated in O(1) per fix
+
+    Positions are projected to metres on a plane tangent at the start (good
+    to well under 1% across a city), with the planned route taken as the
+    straight start-end segment.
+    """
+    __slots__ = (
+        "ride_id", "user_ids", "kx", "start_lat", "start_lng", "end_x", "end_y", "length_sq",
+        "x", "y", "fixed_at", "travelled", "speed", "off_route", "strikes", "deviations"
+    )
+
+    def __init__(self, ride_id: int, user_ids: List[int], start_lat, start_lng, end_lat, end_lng):
+        self.ride_id = ride_id
+        self.user_ids = user_ids  # host first, then confirmed riders
+        self.kx = math.cos(math.radians(start_lat)) * METERS_PER_DEGREE
+        self.start_lat = start_lat
+        self.start_lng = start_lng
+        self.end_x, self.end_y = self._project(end_lat, end_lng)
+        self.length_sq = self.end_x ** 2 + self.end_y ** 2
+        self.x = self.y = 0.0
+        self.fixed_at: Optional[float] = None
+        self.travelled = 0.0
+        self.speed = DEFAULT_SPEED_KMH / 3.6
+        self.off_route = False
+        self.strikes = 0
+        self.deviations = 0
+
+    def _project(self, lat: float, lng: float):
+        return (lng - self.start_lng) * self.kx, (lat - self.start_lat) * METERS_PER_DEGREE
+
+    def cross_track(self, x: float, y: float) -> float:
+        """Distance from the start-end segment, in metres"""
+        if self.length_sq == 0:
+            return math.hypot(x, y)
+        along = max(0.0, min(1.0, (x * self.end_x + y * self.end_y) / self.length_sq))
+        return math.hypot(x - along * self.end_x, y - along * self.end_y)
+
+    def remaining(self) -> float:
+        return math.hypot(self.end_x - self.x, self.end_y - self.y)
+
+    def progress(self) -> dict:
+        remaining = self.remaining()
+        return {
+            "distance_travelled_m": round(self.travelled),
+            "remaining_m": round(remaining),
+            "eta_seconds": round(remaining / self.speed),
+            "off_route": self.off_route
+        }
+
+class RideTracker:
+    """Distance, ETA and off-route state of every ongoing ride
+
+    Rides are registered when they start (and loaded at startup) and dropped
+    when they complete. Only the host's fixes move the ride, since riders'
+    phones are on the same bike. Entering or leaving the off-route state
+    publishes a route_deviation event, which the WebSocket and push
+    consumers turn into alerts for everyone on the ride.
+    """
+
+    def __init__(
+        self,
+        deviation_meters: float = ROUTE_DEVIATION_METERS,
+        deviation_fixes: int = ROUTE_DEVIATION_FIXES
+    ):
+        self.deviation_meters = deviation_meters
+        self.deviation_fixes = deviation_fixes
+        self._rides: Dict[int, RideTrack] = {}
+        self.stats = {"fixes": 0, "ignored_fixes": 0, "deviations": 0, "rejoined": 0}
+
+    def __len__(self):
+        return len(self._rides)
+
+    def get(self, ride_id: int) -> Optional[RideTrack]:
+        return self._rides.get(ride_id)
+
+    def ride_started(self, ride: Ride, rider_ids) -> RideTrack:
+        track = RideTrack(
+            ride.id, [ride.host_id, *rider_ids], ride.start_lat, ride.start_lng, ride.end_lat, ride.end_lng
+        )
+        self._rides[ride.id] = track
+        return track
+
+    def ride_finished(self, ride_id: int):
+        self._rides.pop(ride_id, None)
+
+    def update(self, ride_id: int, user_id: int, lat: float, lng: float, now: Optional[float] = None) -> Optional[dict]:
+        """Apply a fix; the ride's progress, or None if the fix does not move a tracked ride"""
+        track = self._rides.get(ride_id)
+        if track is None or user_id != track.user_ids[0]:
+            self.stats["ignored_fixes"] += 1
+            return None
+        now = time.time() if now is None else now
+        self.stats["fixes"] += 1
+
+        x, y = track._project(lat, lng)
+        if track.fixed_at is None:
+            # First fix: measure from the planned start
+            track.x, track.y, track.fixed_at = 0.0, 0.0, now
+        step = math.hypot(x - track.x, y - track.y)
+        if step >= JITTER_METERS:
+            elapsed = now - track.fixed_at
+            if elapsed > 0:
+                track.speed += SPEED_SMOOTHING * (min(step / elapsed, MAX_SPEED_MPS) - track.speed)
+                track.speed = max(track.speed, 1.0)
+            track.travelled += step
+            track.x, track.y, track.fixed_at = x, y, now
+
+        off = track.cross_track(x, y)
+        if not track.off_route:
+            track.strikes = track.strikes + 1 if off > self.deviation_meters else 0
+            if track.strikes >= self.deviation_fixes:
+                track.off_route = True
+                track.deviations += 1
+                self.stats["deviations"] += 1
+                self._publish(track, lat, lng, off)
+        elif off < self.deviation_meters * ROUTE_REJOIN_RATIO:
+            track.off_route = False
+            track.strikes = 0
+            self.stats["rejoined"] += 1
+            self._publish(track, lat, lng, off)
+        return track.progress()
+
+    def _publish(self, track: RideTrack, lat: float, lng: float, off: float):
+        ride_events.publish(
+            "route_deviation", track.ride_id,
+            off_route=track.off_route,
+            distance_from_route_m=round(off),
+            location={"latitude": lat, "longitude": lng},
+            user_ids=list(track.user_ids)
+        )
+
+    def load(self, db, ride_id: Optional[int] = None) -> int:
+        """Register every ONGOING ride (after a restart), or only ride_id"""
+        query = db.query(Ride).filter(Ride.status == RideStatus.ONGOING)
+        if ride_id is not None:
+            query = query.filter(Ride.id == ride_id)
+        rides = query.all()
+        riders: Dict[int, List[int]] = {}
+        if rides:
+            for ride_id, rider_id in db.query(RideParticipant.ride_id, RideParticipant.rider_id).filter(
+                RideParticipant.ride_id.in_([ride.id for ride in rides]),
+                RideParticipant.status == "confirmed"
+            ):
+                riders.setdefault(ride_id, []).append(rider_id)
+        for ride in rides:
+            if ride.id not in self._rides:
+                self.ride_started(ride, riders.get(ride.id, []))
+        return len(rides)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "tracked_rides": len(self._rides),
+            "off_route": sum(1 for track in self._rides.values() if track.off_route)
+        }
+
+# Global tracker for ongoing rides
+ride_tracker = RideTracker()
+
+def _load_ongoing_rides() -> int:
+    db = SessionLocal()
+    try:
+        return ride_tracker.load(db)
+    finally:
+        db.close()
+
+async def load_ongoing_rides() -> int:
+    return await run_in_threadpool(_load_ongoing_rides)
+
+def _load_ongoing_ride(ride_id: int) -> Optional[RideTrack]:
+    db = SessionLocal()
+    try:
+        ride_tracker.load(db, ride_id)
+    finally:
+        db.close()
+    return ride_tracker.get(ride_id)
+
+async def is_on_ongoing_ride(ride_id: int, user_id: int) -> bool:
+    """Whether user_id is the host or a confirmed rider of ride_id, and the ride is ONGOING
+
+    Answered by the tracker; a ride it does not know (e.g. started by another
+    worker process) is looked up once and registered.
+    """
+    track = ride_tracker.get(ride_id)
+    if track is None:
+        track = await run_in_threadpool(_load_ongoing_ride, ride_id)
+    return track is not None and user_id in track.user_ids
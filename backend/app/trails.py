@@ -0,0 +1,248 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.database import SessionLocal
+from app.models import RideTrailChunk
+from app.archive import archived_trail_chunks_of
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import math
+import os
+import sys
+import time
+
+# Buffered fixes are written out this often, or sooner once this many are waiting
+TRAIL_FLUSH_SECONDS = float(os.getenv("TRAIL_FLUSH_SECONDS", "5"))
+TRAIL_FLUSH_POINTS = int(os.getenv("TRAIL_FLUSH_POINTS", "50000"))
+
+# Coordinates are kept as int32 in units of 1e-7 degrees (~1 cm)
+COORDINATE_SCALE = 10_000_000
+EARTH_RADIUS_M = 6371000.0
+
+class TrailBuffer:
+    """Fixes of one user on one ride, in parallel typed arrays (16 bytes a point)"""
+    __slots__ = ("times", "lats", "lngs")
+
+    def __init__(self):
+        self.times = array("d")
+        self.lats = array("i")
+        self.lngs = array("i")
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, at: float, lat: float, lng: float):
+        self.times.append(at)
+        self.lats.append(round(lat * COORDINATE_SCALE))
+        self.lngs.append(round(lng * COORDINATE_SCALE))
+
+    def pack(self) -> bytes:
+        """times, then lats, then lngs, little-endian"""
+        parts = [self.times, self.lats, self.lngs]
+        if sys.byteorder == "big":
+            parts = [array(part.typecode, part) for part in parts]
+            for part in parts:
+                part.byteswap()
+        return b"".join(part.tobytes() for part in parts)
+
+    @classmethod
+    def unpack(cls, data: bytes, points: int) -> "TrailBuffer":
+        buffer = cls()
+        buffer.times.frombytes(data[:8 * points])
+        buffer.lats.frombytes(data[8 * points:12 * points])
+        buffer.lngs.frombytes(data[12 * points:16 * points])
+        if sys.byteorder == "big":
+            for part in (buffer.times, buffer.lats, buffer.lngs):
+                part.byteswap()
+        return buffer
+
+    def points(self) -> List[Tuple[float, float, float]]:
+        return [
+            (lat / COORDINATE_SCALE, lng / COORDINATE_SCALE, at)
+            for at, lat, lng in zip(self.times, self.lats, self.lngs)
+        ]
+
+def _write_chunks(rows: List[dict]):
+    db = SessionLocal()
+    try:
+        db.execute(insert(RideTrailChunk), rows)
+        db.commit()
+    finally:
+        db.close()
+
+class TrailStore:
+    """Write-behind store for live location fixes
+
+    add() only appends to an in-memory buffer per (ride, user); a background
+    loop swaps the buffers out and writes each as one packed chunk row, all in
+    a single insert per flush. Buffers being written stay readable, so a
+    replay right after an SOS still sees the latest fixes.
+    """
+
+    def __init__(self, flush_seconds: float = TRAIL_FLUSH_SECONDS, flush_points: int = TRAIL_FLUSH_POINTS):
+        self.flush_seconds = flush_seconds
+        self.flush_points = flush_points
+        self._buffers: Dict[Tuple[int, int], TrailBuffer] = {}
+        self._flushing: Dict[Tuple[int, int], List[TrailBuffer]] = {}
+        self._buffered = 0
+        self._wake: Optional[asyncio.Event] = None
+        self.stats = {"points": 0, "rejected_points": 0, "flushes": 0, "chunks_written": 0, "errors": 0}
+
+    def add(self, ride_id: int, user_id: int, location: dict, at: Optional[float] = None) -> bool:
+        """Buffer a fix ({"latitude", "longitude"}); False if it is not a valid coordinate"""
+        try:
+            lat, lng = float(location["latitude"]), float(location["longitude"])
+        except (KeyError, TypeError, ValueError):
+            lat = lng = math.nan
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+            self.stats["rejected_points"] += 1
+            return False
+
+        key = (ride_id, user_id)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = TrailBuffer()
+        buffer.append(time.time() if at is None else at, lat, lng)
+        self.stats["points"] += 1
+        self._buffered += 1
+        if self._buffered >= self.flush_points and self._wake is not None:
+            self._wake.set()
+        return True
+
+    def _take(self) -> List[dict]:
+        """Swap the live buffers out as chunk rows (kept readable until written)"""
+        buffers, self._buffers, self._buffered = self._buffers, {}, 0
+        rows = []
+        for key, buffer in buffers.items():
+            self._flushing.setdefault(key, []).append(buffer)
+            rows.append({
+                "ride_id": key[0],
+                "user_id": key[1],
+                "points": len(buffer),
+                "started_at": datetime.utcfromtimestamp(buffer.times[0]),
+                "ended_at": datetime.utcfromtimestamp(buffer.times[-1]),
+                "data": buffer.pack()
+            })
+        return rows
+
+    def _written(self, rows: List[dict]):
+        for row in rows:
+            key = (row["ride_id"], row["user_id"])
+            pending = self._flushing.get(key)
+            if pending:
+                pending.pop(0)
+                if not pending:
+                    del self._flushing[key]
+
+    async def flush(self):
+        rows = self._take()
+        if not rows:
+            return
+        try:
+            await run_in_threadpool(_write_chunks, rows)
+        except Exception as e:
+            # Keep the fixes: put them back in front of anything buffered since
+            self.stats["errors"] += 1
+            print(f"⚠️  Could not write ride trails: {e}")
+            for key, pending in self._flushing.items():
+                merged = TrailBuffer()
+                for buffer in pending + ([self._buffers[key]] if key in self._buffers else []):
+                    merged.times.extend(buffer.times)
+                    merged.lats.extend(buffer.lats)
+                    merged.lngs.extend(buffer.lngs)
+                self._buffers[key] = merged
+            self._buffered = sum(len(buffer) for buffer in self._buffers.values())
+            self._flushing.clear()
+            return
+        self._written(rows)
+        self.stats["flushes"] += 1
+        self.stats["chunks_written"] += len(rows)
+
+    async def run_flush_loop(self):
+        self._wake = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                await self.flush()
+        finally:
+            # Shutting down: write whatever is left
+            rows = self._take()
+            if rows:
+                _write_chunks(rows)
+                self._written(rows)
+
+    def unflushed(self, ride_id: int) -> Dict[int, List[TrailBuffer]]:
+        """Buffers of a ride not yet in the database, by user, oldest first"""
+        trails: Dict[int, List[TrailBuffer]] = {}
+        for source in (self._flushing, {key: [buffer] for key, buffer in self._buffers.items()}):
+            for (buffer_ride_id, user_id), buffers in source.items():
+                if buffer_ride_id == ride_id:
+                    trails.setdefault(user_id, []).extend(buffers)
+        return trails
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "buffered_points": self._buffered, "open_trails": len(self._buffers)}
+
+# Global trail store
+trail_store = TrailStore()
+
+def load_trails(db: Session, ride_id: int) -> Dict[int, List[Tuple[float, float, float]]]:
+    """Every recorded fix of a ride as (lat, lng, unix seconds), by user, in time order"""
+    chunks = db.query(
+        RideTrailChunk.user_id, RideTrailChunk.points, RideTrailChunk.data
+    ).filter(RideTrailChunk.ride_id == ride_id).order_by(RideTrailChunk.started_at, RideTrailChunk.id).all()
+    # Finished rides move to the archive with their trail
+    if not chunks:
+        chunks = archived_trail_chunks_of(ride_id)
+
+    buffers: Dict[int, List[TrailBuffer]] = {}
+    for user_id, points, data in chunks:
+        buffers.setdefault(user_id, []).append(TrailBuffer.unpack(data, points))
+    for user_id, pending in trail_store.unflushed(ride_id).items():
+        buffers.setdefault(user_id, []).extend(pending)
+
+    trails = {}
+    for user_id, chunks in buffers.items():
+        points = [point for chunk in chunks for point in chunk.points()]
+        points.sort(key=lambda point: point[2])
+        trails[user_id] = points
+    return trails
+
+def simplify(points: List[Tuple[float, float, float]], tolerance_m: float) -> List[Tuple[float, float, float]]:
+    """Douglas-Peucker: drop fixes within tolerance_m of the line between the ones kept"""
+    if len(points) < 3 or tolerance_m <= 0:
+        return list(points)
+
+    # Local equirectangular projection to metres (trails span a few km at most)
+    lat0 = math.radians(sum(point[0] for point in points) / len(points))
+    kx = math.cos(lat0) * math.pi / 180 * EARTH_RADIUS_M
+    ky = math.pi / 180 * EARTH_RADIUS_M
+    xs = [point[1] * kx for point in points]
+    ys = [point[0] * ky for point in points]
+
+    keep = bytearray(len(points))
+    keep[0] = keep[-1] = 1
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        dx, dy = xs[last] - xs[first], ys[last] - ys[first]
+        length = math.hypot(dx, dy)
+        farthest, max_distance = 0, tolerance_m
+        for i in range(first + 1, last):
+            if length > 0:
+                distance = abs(dy * (xs[i] - xs[first]) - dx * (ys[i] - ys[first])) / length
+            else:
+                distance = math.hypot(xs[i] - xs[first], ys[i] - ys[first])
+            if distance > max_distance:
+                farthest, max_distance = i, distance
+        if farthest:
+            keep[farthest] = 1
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
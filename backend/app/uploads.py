@@ -0,0 +1,127 @@
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+import hashlib
+import os
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Uploads above this size are rejected (default 10 MB)
+HELMET_UPLOAD_MAX_BYTES = int(os.getenv("HELMET_UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+
+# Multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+# Leading bytes kept from each upload to sniff its format
+SNIFF_BYTES = 16
+
+class StoredUpload:
+    """Result of streaming an upload to disk"""
+    __slots__ = ("path", "size", "sha256", "head")
+
+    def __init__(self, path: str, size: int, sha256: str, head: bytes = b""):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.head = head  # first SNIFF_BYTES bytes
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Image exceeds the {max_bytes // (1024 * 1024)} MB upload limit"
+    )
+
+async def stream_upload_to_disk(
+    upload: UploadFile,
+    directory: str,
+    suffix: str = "",
+    max_bytes: int = HELMET_UPLOAD_MAX_BYTES
+) -> StoredUpload:
+    """Copy an upload to disk chunk by chunk, hashing as it goes
+
+    Disk writes run in the thread pool so a slow disk never stalls the event loop,
+    and at most one chunk of the image is held in memory at a time.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f".{uuid.uuid4()}{suffix}.part")
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+
+    out = await run_in_threadpool(open, path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            digest.update(chunk)
+            if len(head) < SNIFF_BYTES:
+                head += chunk[:SNIFF_BYTES - len(head)]
+            await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(_remove_quietly, path)
+        raise
+
+    await run_in_threadpool(out.close)
+    return StoredUpload(path, size, digest.hexdigest(), head)
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized upload requests before their body is parsed
+
+    FastAPI parses multipart forms before the route runs, so the route alone
+    cannot stop a huge upload. This checks Content-Length up front and counts
+    streamed body bytes for chunked requests without one.
+    """
+
+    def __init__(self, app, path_prefixes=("/api/helmet/upload",), max_bytes: int = HELMET_UPLOAD_MAX_BYTES):
+        self.app = app
+        self.path_prefixes = tuple(path_prefixes)
+        self.max_bytes = max_bytes
+        self.limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > self.limit:
+                    response = JSONResponse(
+                        {"detail": _too_large(self.max_bytes).detail},
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                    )
+                    await response(scope, receive, send)
+                    return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes a 413
+                    raise _too_large(self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
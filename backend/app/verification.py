@@ -0,0 +1,357 @@
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageFilter, ImageStat
+from starlette.concurrency import run_in_threadpool
+from app.database import SessionLocal
+from app.models import HelmetCheck, HelmetImageHash, VerificationStatus
+from app.phash import difference_hash, helmet_hashes, to_signed
+from app.readiness import helmet_readiness
+from app.websocket import notify_helmet_verified
+from app.stats import bump_user_stats
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import importlib
+import multiprocessing
+import os
+import time
+
+# "module:callable" taking a list of image paths and returning [(is_verified, reason), ...]
+HELMET_VERIFIER = os.getenv("HELMET_VERIFIER", "app.verification:photo_quality_verifier")
+HELMET_VERIFY_WORKERS = int(os.getenv("HELMET_VERIFY_WORKERS", str(min(2, os.cpu_count() or 1))))
+HELMET_VERIFY_BATCH_SIZE = int(os.getenv("HELMET_VERIFY_BATCH_SIZE", "8"))
+HELMET_VERIFY_BATCH_WAIT_MS = float(os.getenv("HELMET_VERIFY_BATCH_WAIT_MS", "20"))
+HELMET_VERIFY_QUEUE_SIZE = int(os.getenv("HELMET_VERIFY_QUEUE_SIZE", "256"))
+
+VerificationResult = Tuple[bool, str]
+
+# Default heuristic verifier
+MIN_SIDE_PX = 240
+ANALYSIS_SIDE_PX = 256
+
+def _check_photo(path: str) -> VerificationResult:
+    with Image.open(path) as image:
+        if min(image.size) < MIN_SIDE_PX:
+            return False, "image too small"
+        image.draft("L", (ANALYSIS_SIDE_PX, ANALYSIS_SIDE_PX))
+        gray = image.convert("L")
+    gray.thumbnail((ANALYSIS_SIDE_PX, ANALYSIS_SIDE_PX))
+
+    stats = ImageStat.Stat(gray)
+    brightness, contrast = stats.mean[0], stats.stddev[0]
+    if brightness < 30:
+        return False, "image too dark"
+    if brightness > 230:
+        return False, "image overexposed"
+    if contrast < 15:
+        return False, "image has no visible detail"
+
+    sharpness = ImageStat.Stat(gray.filter(ImageFilter.FIND_EDGES)).mean[0]
+    if sharpness < 4:
+        return False, "image too blurry"
+    return True, "ok"
+
+def photo_quality_verifier(paths: List[str]) -> List[VerificationResult]:
+    """Reject photos nobody could check a helmet on (dark, blank, blurry, tiny)
+
+    A stand-in until a helmet detection model is plugged in via HELMET_VERIFIER;
+    it has the same batch signature a model would use.
+    """
+    results = []
+    for path in paths:
+        try:
+            results.append(_check_photo(path))
+        except (OSError, ValueError):
+            results.append((False, "unreadable image"))
+    return results
+
+# Worker process side
+_loaded_verifiers: Dict[str, Callable[[List[str]], List[VerificationResult]]] = {}
+
+def load_verifier(spec: str) -> Callable[[List[str]], List[VerificationResult]]:
+    verifier = _loaded_verifiers.get(spec)
+    if verifier is None:
+        module_name, _, attribute = spec.partition(":")
+        verifier = getattr(importlib.import_module(module_name), attribute)
+        _loaded_verifiers[spec] = verifier
+    return verifier
+
+def _perceptual_hash(path: str) -> Optional[int]:
+    try:
+        return difference_hash(path)
+    except (OSError, ValueError):
+        return None
+
+def run_verifier_batch(spec: str, paths: List[str]) -> List[Tuple[bool, str, Optional[int]]]:
+    """Entry point executed in the worker pool (the model loads once per process)
+
+    Returns (is_verified, reason, perceptual hash) per image; hashing happens
+    here too so the event loop never decodes an image.
+    """
+    results = load_verifier(spec)(paths)
+    if len(results) != len(paths):
+        raise ValueError(f"Verifier {spec} returned {len(results)} results for {len(paths)} images")
+    return [(ok, reason, _perceptual_hash(path)) for (ok, reason), path in zip(results, paths)]
+
+class VerificationJob:
+    """One helmet check waiting for verification"""
+    __slots__ = ("check_id", "ride_id", "user_id", "path", "digest", "queued_at")
+
+    def __init__(self, check_id: int, ride_id: int, user_id: int, path: str, digest: Optional[str] = None):
+        self.check_id = check_id
+        self.ride_id = ride_id
+        self.user_id = user_id
+        self.path = path
+        self.digest = digest  # content hash of the uploaded image, if it is content-addressed
+        self.queued_at = time.perf_counter()
+
+# Per check: (content digest, perceptual hash, (user_id, ride_id))
+PhotoHash = Tuple[str, int, Tuple[int, int]]
+
+def _pending_check_ids(check_ids: List[int]) -> Set[int]:
+    db = SessionLocal()
+    try:
+        return {check_id for (check_id,) in db.query(HelmetCheck.id).filter(
+            HelmetCheck.id.in_(check_ids),
+            HelmetCheck.verification_status == VerificationStatus.PENDING
+        )}
+    finally:
+        db.close()
+
+def _record_results(outcomes: Dict[int, VerificationStatus], new_hashes: Dict[int, PhotoHash]) -> Set[int]:
+    """Settle pending checks; returns the ids settled (replaced or already settled checks are skipped)
+
+    Only the photos of settled checks are indexed, so a check replaced while
+    queued never makes its own resubmission look reused.
+    """
+    db = SessionLocal()
+    try:
+        pending = db.query(HelmetCheck.id, HelmetCheck.user_id).filter(
+            HelmetCheck.id.in_(list(outcomes)),
+            HelmetCheck.verification_status == VerificationStatus.PENDING
+        ).all()
+        by_outcome: Dict[VerificationStatus, List[int]] = {}
+        for check_id, _ in pending:
+            by_outcome.setdefault(outcomes[check_id], []).append(check_id)
+        for outcome, check_ids in by_outcome.items():
+            db.query(HelmetCheck).filter(HelmetCheck.id.in_(check_ids)).update({
+                HelmetCheck.verification_status: outcome,
+                HelmetCheck.is_verified: outcome is VerificationStatus.VERIFIED
+            }, synchronize_session=False)
+        verified_owners = Counter(
+            user_id for check_id, user_id in pending if outcomes[check_id] is VerificationStatus.VERIFIED
+        )
+        for user_id, count in verified_owners.items():
+            bump_user_stats(db, user_id, helmet_verified=count)
+        settled = {check_id for check_id, _ in pending}
+        photos: Dict[str, Tuple[int, Tuple[int, int]]] = {}
+        for check_id, (digest, value, owner) in new_hashes.items():
+            if check_id in settled:
+                photos.setdefault(digest, (value, owner))
+        if photos:
+            known = {
+                digest for (digest,) in db.query(HelmetImageHash.content_sha256).filter(
+                    HelmetImageHash.content_sha256.in_(list(photos))
+                )
+            }
+            db.add_all([
+                HelmetImageHash(content_sha256=digest, dhash=to_signed(value), user_id=user_id, ride_id=ride_id)
+                for digest, (value, (user_id, ride_id)) in photos.items() if digest not in known
+            ])
+        db.commit()
+        return settled
+    finally:
+        db.close()
+
+def mark_checks_failed(check_ids: List[int]) -> Set[int]:
+    """Settle pending checks as FAILED so their riders can resubmit; returns the ids settled"""
+    db = SessionLocal()
+    try:
+        pending = {check_id for (check_id,) in db.query(HelmetCheck.id).filter(
+            HelmetCheck.id.in_(check_ids),
+            HelmetCheck.verification_status == VerificationStatus.PENDING
+        )}
+        if pending:
+            db.query(HelmetCheck).filter(HelmetCheck.id.in_(pending)).update(
+                {HelmetCheck.verification_status: VerificationStatus.FAILED}, synchronize_session=False
+            )
+            db.commit()
+        return pending
+    finally:
+        db.close()
+
+class HelmetVerifier:
+    """Verifies helmet checks off the request path
+
+    verify_helmet enqueues a job and returns at once. A dispatcher drains the
+    bounded queue into micro-batches (up to batch_size images, waiting at most
+    batch_wait_ms for stragglers) and runs them in a process pool, at most one
+    batch per worker, so a full queue means the pool is saturated and new
+    checks are refused with 503 instead of piling up. Outcomes are written to
+    HelmetCheck.verification_status (and is_verified) and pushed over the
+    ride's WebSocket channel. A batch the verifier could not run leaves its
+    checks FAILED, and checks still PENDING after a restart are resubmitted.
+    """
+
+    def __init__(
+        self,
+        spec: str = HELMET_VERIFIER,
+        workers: int = HELMET_VERIFY_WORKERS,
+        batch_size: int = HELMET_VERIFY_BATCH_SIZE,
+        batch_wait_ms: float = HELMET_VERIFY_BATCH_WAIT_MS,
+        queue_size: int = HELMET_VERIFY_QUEUE_SIZE
+    ):
+        self.spec = spec
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._batches = set()
+        self.stats = {"queued": 0, "rejected_full": 0, "verified": 0, "failed_checks": 0, "errors": 0, "batches": 0, "reused_photos": 0}
+
+    def start(self) -> asyncio.Task:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._slots = asyncio.Semaphore(self.workers)
+        # spawn: forking a process that runs an event loop and thread pools is unsafe
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return asyncio.create_task(self._dispatch())
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def full(self) -> bool:
+        return self._queue is None or self._queue.full()
+
+    def submit(self, job: VerificationJob):
+        """Queue a check; raises asyncio.QueueFull when the verifier is saturated"""
+        if self._queue is None:
+            raise asyncio.QueueFull
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["rejected_full"] += 1
+            raise
+        self.stats["queued"] += 1
+
+    async def resubmit(self, jobs: List[VerificationJob]):
+        """Queue checks left pending by a previous run, waiting for room as needed"""
+        for job in jobs:
+            await self._queue.put(job)
+            self.stats["queued"] += 1
+
+    async def _next_batch(self) -> List[VerificationJob]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Whatever else is already waiting rides along for free
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _dispatch(self):
+        while True:
+            # Wait for a free worker first, so backlog stays in the bounded queue
+            await self._slots.acquire()
+            batch = await self._next_batch()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[VerificationJob]):
+        unavailable = False
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                results = await loop.run_in_executor(
+                    self._pool, run_verifier_batch, self.spec, [job.path for job in batch]
+                )
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️  Helmet verification batch failed: {e}")
+                unavailable = True
+                results = [(False, "verification unavailable", None)] * len(batch)
+        finally:
+            self._slots.release()
+        self.stats["batches"] += 1
+
+        try:
+            # Pick up photos indexed by other processes before judging reuse
+            await run_in_threadpool(helmet_hashes.catch_up, SessionLocal)
+            # Checks replaced (or settled) while queued are neither screened nor indexed
+            live = await run_in_threadpool(_pending_check_ids, [job.check_id for job in batch])
+            outcomes, new_hashes = self._screen_reused_photos(batch, results, live)
+            statuses = {
+                job.check_id: (
+                    VerificationStatus.VERIFIED if ok
+                    else VerificationStatus.FAILED if unavailable
+                    else VerificationStatus.REJECTED
+                )
+                for job, (ok, _) in zip(batch, outcomes) if job.check_id in live
+            }
+            settled = await run_in_threadpool(_record_results, statuses, new_hashes)
+            await run_in_threadpool(helmet_hashes.catch_up, SessionLocal)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"⚠️  Could not record helmet verifications: {e}")
+            try:
+                settled = await run_in_threadpool(mark_checks_failed, [job.check_id for job in batch])
+            except Exception as e:
+                # Still PENDING: resubmitted on the next start
+                print(f"⚠️  Could not mark helmet checks failed: {e}")
+                return
+            outcomes = [(False, "verification unavailable")] * len(batch)
+        verified = sum(1 for job, (ok, _) in zip(batch, outcomes) if ok and job.check_id in settled)
+        self.stats["verified"] += verified
+        self.stats["failed_checks"] += len(settled) - verified
+
+        for job, (ok, reason) in zip(batch, outcomes):
+            if job.check_id not in settled:
+                continue  # replaced by a newer check while queued
+            if ok:
+                helmet_readiness.rider_verified(job.ride_id, job.user_id)
+            await notify_helmet_verified(job.ride_id, job.user_id, job.check_id, ok, reason)
+
+    def _screen_reused_photos(self, batch: List[VerificationJob], results, live: Set[int]):
+        """Fail checks whose photo is a near-duplicate of one used by an earlier check
+
+        Only live checks are screened. A photo first used for the same rider and
+        ride (a resubmission) does not count as reused.
+        """
+        outcomes = []
+        new_hashes: Dict[int, PhotoHash] = {}
+        for job, (ok, reason, value) in zip(batch, results):
+            if job.check_id in live and job.digest is not None and value is not None:
+                owner = (job.user_id, job.ride_id)
+                reused = helmet_hashes.near(value, owner=owner) or any(
+                    (value ^ other).bit_count() <= helmet_hashes.max_distance
+                    for _, other, other_owner in new_hashes.values() if other_owner != owner
+                )
+                if reused:
+                    self.stats["reused_photos"] += 1
+                    ok, reason = False, "helmet photo reused from an earlier check"
+                new_hashes[job.check_id] = (job.digest, value, owner)
+            outcomes.append((ok, reason))
+        return outcomes, new_hashes
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "workers": self.workers,
+            "batch_size": self.batch_size
+        }
+
+# Global helmet verifier
+helmet_verifier = HelmetVerifier()
@@ -1,80 +1,221 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from app.timers import TimerWheel
+from app.digest import JoinRequestDigests
+from app.ratelimit import rate_limits
+from app.events import RideEvent
+from app.trails import trail_store
+from app.tracking import is_on_ongoing_ride, ride_tracker
+from typing import Dict, Optional, Set, Tuple
 import json
 import asyncio
+import os
+import time
 from datetime import datetime
 
+# Server pings a connection after this long without hearing from it ...
+WS_HEARTBEAT_INTERVAL_SECONDS = float(os.getenv("WS_HEARTBEAT_INTERVAL_SECONDS", "25"))
+# ... and reaps it once it has been silent this long (a pong or any message resets both)
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "60"))
+WS_REAPER_TICK_SECONDS = float(os.getenv("WS_REAPER_TICK_SECONDS", "1"))
+
+class Connection:
+    """One open socket: a user may hold several (one per device)"""
+    __slots__ = ("websocket", "user_id", "rides", "last_seen", "pinged")
+
+    def __init__(self, websocket: WebSocket, user_id: int, now: float):
+        self.websocket = websocket  # None once disconnected
+        self.user_id = user_id
+        self.rides: Optional[Set[int]] = None  # created on first subscription
+        self.last_seen = now
+        self.pinged = False
+
 class ConnectionManager:
-    def __init__(self):
-        # Store active connections by user_id
-        self.active_connections: Dict[int, WebSocket] = {}
-        # Store ride subscriptions (user_id -> list of ride_ids)
-        self.ride_subscriptions: Dict[int, List[int]] = {}
+    def __init__(
+        self,
+        heartbeat_interval: float = WS_HEARTBEAT_INTERVAL_SECONDS,
+        idle_timeout: float = WS_IDLE_TIMEOUT_SECONDS,
+        tick_seconds: float = WS_REAPER_TICK_SECONDS
+    ):
+        # Open connections by user_id (a tuple: usually one device, rarely more)
+        self.user_connections: Dict[int, Tuple[Connection, ...]] = {}
+        # Subscribed connections by ride_id, so a broadcast only visits its subscribers
+        self.ride_subscribers: Dict[int, Set[Connection]] = {}
+        self.connection_count = 0
+        self.subscription_count = 0
+        # Heartbeats: idle connections get a ping, silent ones are reaped
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.heartbeats = TimerWheel(tick_seconds, time.monotonic())
+        self.stats = {"pings_sent": 0, "reaped_connections": 0}
         
-    async def connect(self, websocket: WebSocket, user_id: int):
+    async def connect(self, websocket: WebSocket, user_id: int) -> Connection:
         """Accept websocket connection and store it"""
         await websocket.accept()
-        self.active_connections[user_id] = websocket
-        self.ride_subscriptions[user_id] = []
+        now = time.monotonic()
+        connection = Connection(websocket, user_id, now)
+        self.user_connections[user_id] = self.user_connections.get(user_id, ()) + (connection,)
+        self.connection_count += 1
+        self.heartbeats.schedule(connection, now + self.heartbeat_interval)
         
         # Send welcome message
-        await self.send_personal_message({
+        await self.send_to_connection(connection, {
             "type": "connection_established",
             "message": "Connected to PILLION real-time updates",
+            "heartbeat_interval": self.heartbeat_interval,
             "timestamp": datetime.utcnow().isoformat()
-        }, user_id)
+        })
+        return connection
         
-    def disconnect(self, user_id: int):
-        """Remove connection when user disconnects"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        if user_id in self.ride_subscriptions:
-            del self.ride_subscriptions[user_id]
+    def disconnect(self, connection: Connection):
+        """Remove a connection and its subscriptions (idempotent)"""
+        if connection.websocket is None:
+            return
+        connection.websocket = None
+        self.connection_count -= 1
+        
+        remaining = tuple(other for other in self.user_connections.get(connection.user_id, ()) if other is not connection)
+        if remaining:
+            self.user_connections[connection.user_id] = remaining
+        else:
+            self.user_connections.pop(connection.user_id, None)
+        
+        for ride_id in connection.rides or ():
+            subscribers = self.ride_subscribers.get(ride_id)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.ride_subscribers[ride_id]
+        self.subscription_count -= len(connection.rides or ())
+        connection.rides = None
+    
+    def touch(self, connection: Connection):
+        """Record that the client is alive (any inbound message counts)"""
+        connection.last_seen = time.monotonic()
+        connection.pinged = False
+    
+    def is_subscribed(self, user_id: int, ride_id: int) -> bool:
+        return any(ride_id in (connection.rides or ()) for connection in self.user_connections.get(user_id, ()))
+    
+    async def check_heartbeats(self, now: Optional[float] = None) -> int:
+        """Ping quiet connections and reap silent ones; returns how many were reaped
+        
+        Only connections whose timer is due are looked at. A timer that finds
+        the connection was heard from since it was set just re-arms itself, so
+        activity never has to move anything in the wheel.
+        """
+        now = time.monotonic() if now is None else now
+        reaped = 0
+        for connection in list(self.heartbeats.advance(now)):
+            websocket = connection.websocket
+            if websocket is None:
+                continue  # disconnected since the timer was set
+            idle = now - connection.last_seen
+            if idle >= self.idle_timeout:
+                self.disconnect(connection)
+                self.stats["reaped_connections"] += 1
+                reaped += 1
+                try:
+                    await websocket.close(code=1001)
+                except Exception:
+                    pass
+            elif idle >= self.heartbeat_interval and not connection.pinged:
+                connection.pinged = True
+                self.stats["pings_sent"] += 1
+                await self.send_to_connection(connection, {"type": "ping", "timestamp": datetime.utcnow().isoformat()})
+                self.heartbeats.schedule(connection, connection.last_seen + self.idle_timeout)
+            else:
+                next_check = self.idle_timeout if connection.pinged else self.heartbeat_interval
+                self.heartbeats.schedule(connection, connection.last_seen + next_check)
+        return reaped
+    
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "awaiting_pong": sum(
+                1 for connections in self.user_connections.values() for connection in connections if connection.pinged
+            ),
+            "timers": len(self.heartbeats),
+            "heartbeat_interval": self.heartbeat_interval,
+            "idle_timeout": self.idle_timeout
+        }
+    
+    async def _send_text(self, connection: Connection, text: str):
+        websocket = connection.websocket
+        if websocket is None:
+            return
+        try:
+            await websocket.send_text(text)
+        except:
+            # Connection might be closed, remove it
+            self.disconnect(connection)
+    
+    async def send_to_connection(self, connection: Connection, message: dict):
+        """Send message to one device"""
+        await self._send_text(connection, json.dumps(message))
             
     async def send_personal_message(self, message: dict, user_id: int):
-        """Send message to specific user"""
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_text(json.dumps(message))
-            except:
-                # Connection might be closed, remove it
-                self.disconnect(user_id)
+        """Send message to every device of a user"""
+        connections = self.user_connections.get(user_id)
+        if connections:
+            text = json.dumps(message)
+            for connection in connections:
+                await self._send_text(connection, text)
                 
     async def broadcast_to_ride(self, message: dict, ride_id: int):
-        """Send message to all users subscribed to a ride"""
-        for user_id, ride_ids in self.ride_subscriptions.items():
-            if ride_id in ride_ids:
-                await self.send_personal_message(message, user_id)
+        """Send message to all connections subscribed to a ride"""
+        subscribers = self.ride_subscribers.get(ride_id)
+        if subscribers:
+            text = json.dumps(message)
+            for connection in list(subscribers):
+                await self._send_text(connection, text)
                 
-    async def subscribe_to_ride(self, user_id: int, ride_id: int):
-        """Subscribe user to ride updates"""
-        if user_id in self.ride_subscriptions:
-            if ride_id not in self.ride_subscriptions[user_id]:
-                self.ride_subscriptions[user_id].append(ride_id)
+    async def subscribe_to_ride(self, connection: Connection, ride_id: int):
+        """Subscribe a connection to ride updates"""
+        if connection.websocket is not None:
+            if connection.rides is None:
+                connection.rides = set()
+            if ride_id not in connection.rides:
+                connection.rides.add(ride_id)
+                self.ride_subscribers.setdefault(ride_id, set()).add(connection)
+                self.subscription_count += 1
                 
-        await self.send_personal_message({
+        await self.send_to_connection(connection, {
             "type": "ride_subscription",
             "ride_id": ride_id,
             "message": f"Subscribed to ride {ride_id} updates",
             "timestamp": datetime.utcnow().isoformat()
-        }, user_id)
+        })
         
-    async def unsubscribe_from_ride(self, user_id: int, ride_id: int):
-        """Unsubscribe user from ride updates"""
-        if user_id in self.ride_subscriptions:
-            if ride_id in self.ride_subscriptions[user_id]:
-                self.ride_subscriptions[user_id].remove(ride_id)
+    async def unsubscribe_from_ride(self, connection: Connection, ride_id: int):
+        """Unsubscribe a connection from ride updates"""
+        if connection.rides and ride_id in connection.rides:
+            connection.rides.discard(ride_id)
+            subscribers = self.ride_subscribers.get(ride_id)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.ride_subscribers[ride_id]
+            self.subscription_count -= 1
                 
-        await self.send_personal_message({
+        await self.send_to_connection(connection, {
             "type": "ride_unsubscription",
             "ride_id": ride_id,
             "message": f"Unsubscribed from ride {ride_id} updates",
             "timestamp": datetime.utcnow().isoformat()
-        }, user_id)
+        })
 
 # Global connection manager instance
 manager = ConnectionManager()
 
+async def run_heartbeat_loop(tick_seconds: float = WS_REAPER_TICK_SECONDS):
+    """Drive manager.check_heartbeats for the lifetime of the app"""
+    while True:
+        await asyncio.sleep(tick_seconds)
+        try:
+            await manager.check_heartbeats()
+        except Exception as e:
+            print(f"⚠️  WebSocket heartbeat check failed: {e}")
+
 # Real-time event functions
 async def notify_ride_status_change(ride_id: int, new_status: str, ride_data: dict):
     """Notify all subscribed users about ride status change"""
@@ -97,6 +238,17 @@ async def notify_new_ride_request(ride_id: int, requester_data: dict):
     }
     await manager.broadcast_to_ride(message, ride_id)
 
+async def notify_ride_requests_digest(ride_id: int, requesters: list):
+    """Notify ride host about several join requests at once (see app/digest.py)"""
+    message = {
+        "type": "ride_requests_digest",
+        "ride_id": ride_id,
+        "count": len(requesters),
+        "requesters": requesters,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    await manager.broadcast_to_ride(message, ride_id)
+
 async def notify_ride_confirmation(ride_id: int, confirmed_riders: list):
     """Notify all participants about ride confirmation"""
     message = {
@@ -107,7 +259,7 @@ async def notify_ride_confirmation(ride_id: int, confirmed_riders: list):
     }
     await manager.broadcast_to_ride(message, ride_id)
 
-async def notify_location_update(ride_id: int, user_id: int, location_data: dict):
+async def notify_location_update(ride_id: int, user_id: int, location_data: dict, progress: Optional[dict] = None):
     """Notify ride participants about location updates during ongoing ride"""
     message = {
         "type": "location_update",
@@ -116,7 +268,24 @@ async def notify_location_update(ride_id: int, user_id: int, location_data: dict
         "location": location_data,
         "timestamp": datetime.utcnow().isoformat()
     }
+    if progress is not None:
+        message["progress"] = progress  # distance, remaining distance, ETA, off-route
+    await manager.broadcast_to_ride(message, ride_id)
+
+async def notify_route_deviation(ride_id: int, off_route: bool, distance_from_route_m: int, location_data: dict):
+    """Warn everyone on a ride that it left (or came back to) its route"""
+    message = {
+        "type": "route_deviation",
+        "ride_id": ride_id,
+        "off_route": off_route,
+        "distance_from_route_m": distance_from_route_m,
+        "location": location_data,
+        "message": "Ride has gone off its route" if off_route else "Ride is back on its route",
+        "timestamp": datetime.utcnow().isoformat()
+    }
     await manager.broadcast_to_ride(message, ride_id)
+    if off_route:
+        print(f"🧭 ROUTE DEVIATION: ride {ride_id} is {distance_from_route_m} m off route at {location_data}")
 
 async def notify_emergency_alert(ride_id: int, user_id: int, location_data: dict):
     """Notify all participants and emergency contacts about SOS"""
@@ -133,25 +302,109 @@ async def notify_emergency_alert(ride_id: int, user_id: int, location_data: dict
     # Also notify emergency services (in production, integrate with actual services)
     print(f"🚨 EMERGENCY ALERT: User {user_id} in ride {ride_id} at {location_data}")
 
-async def handle_websocket_message(websocket: WebSocket, user_id: int, message: dict):
+async def notify_helmet_verified(ride_id: int, user_id: int, check_id: int, is_verified: bool, reason: str):
+    """Notify the ride and the rider about a finished helmet verification"""
+    message = {
+        "type": "helmet_verified",
+        "ride_id": ride_id,
+        "user_id": user_id,
+        "check_id": check_id,
+        "is_verified": is_verified,
+        "reason": reason,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    await manager.broadcast_to_ride(message, ride_id)
+    if not manager.is_subscribed(user_id, ride_id):
+        await manager.send_personal_message(message, user_id)
+
+async def _send_ride_request(ride_id: int, host_id: int, requester: dict, title: Optional[str]):
+    await notify_new_ride_request(ride_id, requester)
+
+async def _send_ride_requests_digest(ride_id: int, host_id: int, requesters: list, title: Optional[str]):
+    await notify_ride_requests_digest(ride_id, requesters)
+
+# Join request bursts reach the ride's subscribers as digests
+websocket_join_digests = JoinRequestDigests(_send_ride_request, _send_ride_requests_digest)
+
+async def websocket_ride_event(event: RideEvent):
+    """Event bus consumer: fan ride lifecycle events out to the ride's subscribers"""
+    data = event.data
+    if event.kind == "ride_request":
+        await websocket_join_digests.add(event.ride_id, data["host_id"], data["rider"], data.get("title"))
+        return
+    # Held requests go out before anything that happens to the ride after them
+    await websocket_join_digests.flush_ride(event.ride_id)
+    if event.kind == "ride_status":
+        await notify_ride_status_change(event.ride_id, data["status"], data["details"])
+    elif event.kind == "ride_confirmed":
+        await notify_ride_confirmation(event.ride_id, data["riders"])
+    elif event.kind == "route_deviation":
+        await notify_route_deviation(event.ride_id, data["off_route"], data["distance_from_route_m"], data["location"])
+
+def _as_ride_id(value) -> Optional[int]:
+    """A ride id sent as a JSON number or numeric string (None if it is neither)"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+async def handle_websocket_message(connection: Connection, message: dict):
     """Handle incoming websocket messages from clients"""
+    user_id = connection.user_id
     message_type = message.get("type")
     
+    # Per-user budgets per message type (emergency alerts are exempt)
+    retry_after = rate_limits.take(f"ws_{message_type}", user_id)
+    if retry_after:
+        await manager.send_to_connection(connection, {
+            "type": "error",
+            "code": "rate_limited",
+            "message": f"Too many {message_type} messages, please slow down",
+            "retry_after": round(retry_after, 3),
+            "timestamp": datetime.utcnow().isoformat()
+        })
+        return
+    
     if message_type == "subscribe_ride":
         ride_id = message.get("ride_id")
         if ride_id:
-            await manager.subscribe_to_ride(user_id, ride_id)
+            await manager.subscribe_to_ride(connection, ride_id)
             
     elif message_type == "unsubscribe_ride":
         ride_id = message.get("ride_id")
         if ride_id:
-            await manager.unsubscribe_from_ride(user_id, ride_id)
+            await manager.unsubscribe_from_ride(connection, ride_id)
             
     elif message_type == "location_update":
-        ride_id = message.get("ride_id")
+        ride_id = _as_ride_id(message.get("ride_id"))
         location = message.get("location")
-        if ride_id and location:
-            await notify_location_update(ride_id, user_id, location)
+        if ride_id is None or not location:
+            await manager.send_to_connection(connection, {
+                "type": "error",
+                "message": "location_update needs an integer ride_id and a location",
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        elif not await is_on_ongoing_ride(ride_id, user_id):
+            # Only the host and confirmed riders of an ongoing ride record its trail
+            await manager.send_to_connection(connection, {
+                "type": "error",
+                "message": f"You are not on ongoing ride {ride_id}",
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        else:
+            # Kept for replay after an SOS (buffered, written in batches)
+            progress = None
+            if trail_store.add(ride_id, user_id, location):
+                progress = ride_tracker.update(
+                    ride_id, user_id, float(location["latitude"]), float(location["longitude"])
+                )
+            await notify_location_update(ride_id, user_id, location, progress)
+            
+    elif message_type == "pong":
+        pass  # the endpoint already recorded the activity
             
     elif message_type == "emergency_alert":
         ride_id = message.get("ride_id")
@@ -160,8 +413,8 @@ async def handle_websocket_message(websocket: WebSocket, user_id: int, message:
             await notify_emergency_alert(ride_id, user_id, location)
             
     else:
-        await manager.send_personal_message({
+        await manager.send_to_connection(connection, {
             "type": "error",
             "message": f"Unknown message type: {message_type}",
             "timestamp": datetime.utcnow().isoformat()
-        }, user_id)
\ No newline at end of file
+        })
\ No newline at end of file
@@ -0,0 +1 @@
+# PILLION benchmark suite
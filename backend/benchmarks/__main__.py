@@ -0,0 +1,144 @@
+"""PILLION benchmark runner
+
+Run from the backend directory:
+
+    python -m benchmarks all --users 2000 --rides 5000 --output results.jsonl
+    python -m benchmarks nearby --requests 5000 --concurrency 10
+    python -m benchmarks ws --clients 10000
+    python -m benchmarks ws_soak --soak-sockets 10000
+
+By default the app is driven in-process against a throwaway SQLite database.
+Pass --base-url (and the server's --database-url) to load-test a running server.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+BENCH_DATABASE_URL = "sqlite:///./pillion_bench.db"
+BENCH_ARCHIVE_DATABASE_URL = "sqlite:///./pillion_bench_archive.db"
+BENCH_JWT_SECRET = "pillion-benchmark-secret"
+PROTECTED_DATABASE_URLS = {"sqlite:///./pillion.db", "sqlite:///./pillion_archive.db"}
+
+SCENARIOS = ["nearby", "join", "lifecycle", "ws", "ws_soak"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="PILLION load tests")
+    parser.add_argument("scenario", choices=SCENARIOS + ["all"])
+    parser.add_argument("--base-url", help="Load-test a running server instead of the in-process app")
+    parser.add_argument("--database-url", default=BENCH_DATABASE_URL, help="Database to seed (wiped first)")
+    parser.add_argument("--archive-database-url", default=BENCH_ARCHIVE_DATABASE_URL, help="Archive database (wiped first)")
+    parser.add_argument("--output", help="Append JSON-lines results to this file")
+    parser.add_argument("--seed", type=int, default=42)
+
+    city = parser.add_argument_group("synthetic city")
+    city.add_argument("--users", type=int, default=2000)
+    city.add_argument("--rides", type=int, default=5000)
+    city.add_argument("--hot-rides", type=int, default=5)
+
+    load = parser.add_argument_group("load shape")
+    load.add_argument("--requests", type=int, default=2000, help="/nearby requests in the search storm")
+    # Route handlers run their queries on the event loop, so concurrency above the
+    # SQLAlchemy pool size stalls the in-process app until pool checkout times out
+    load.add_argument("--concurrency", type=int, default=10)
+    load.add_argument("--joiners", type=int, default=500, help="Riders in the join burst")
+    load.add_argument("--lifecycle-rides", type=int, default=100)
+    load.add_argument("--clients", type=int, default=5000, help="Simulated WebSocket clients")
+    load.add_argument("--ws-rides", type=int, default=50)
+    load.add_argument("--broadcasts", type=int, default=200)
+    load.add_argument("--soak-sockets", type=int, default=10000, help="WebSockets held open in the soak (in-process only)")
+    load.add_argument("--soak-requests", type=int, default=2000, help="REST requests while the sockets are open")
+    return parser.parse_args(argv)
+
+def prepare_environment(args):
+    """Point the app at the benchmark database before any app module is imported"""
+    if args.database_url in PROTECTED_DATABASE_URLS:
+        sys.exit(f"Refusing to wipe {args.database_url}; pass a dedicated --database-url")
+    if args.archive_database_url in PROTECTED_DATABASE_URLS:
+        sys.exit(f"Refusing to wipe {args.archive_database_url}; pass a dedicated --archive-database-url")
+
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["ARCHIVE_DATABASE_URL"] = args.archive_database_url
+    if not args.base_url:
+        os.environ.setdefault("JWT_SECRET", BENCH_JWT_SECRET)
+
+def seed_database(args):
+    from app.database import Base, SessionLocal, engine
+    from app.archive import archive_engine, archive_metadata
+    from benchmarks.datagen import generate_city
+
+    # Archived rows would shadow the freshly seeded ride ids (recreated at app startup)
+    archive_metadata.drop_all(bind=archive_engine)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        return generate_city(db, users=args.users, rides=args.rides, hot_rides=args.hot_rides, seed=args.seed)
+    finally:
+        db.close()
+
+async def run(args, city):
+    import httpx
+    from benchmarks import scenarios
+    from benchmarks.stats import write_results
+
+    selected = SCENARIOS if args.scenario == "all" else [args.scenario]
+    tokens = scenarios.TokenCache()
+    results = []
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60.0)
+        lifespan = None
+    else:
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60.0)
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+
+    try:
+        if "nearby" in selected:
+            results.append(await scenarios.nearby_search_storm(
+                client, city, tokens, requests=args.requests, concurrency=args.concurrency, seed=args.seed
+            ))
+        if "join" in selected:
+            results.append(await scenarios.join_burst(
+                client, city, tokens, riders=args.joiners, concurrency=args.concurrency, seed=args.seed
+            ))
+        if "lifecycle" in selected:
+            results.extend(await scenarios.lifecycle_transitions(
+                client, city, tokens, rides=args.lifecycle_rides, seed=args.seed
+            ))
+        if "ws" in selected:
+            if args.base_url:
+                ws_url = args.base_url.replace("http", "ws", 1)
+                results.append(await scenarios.websocket_fanout_remote(
+                    ws_url, city, tokens, clients=args.clients, rides=args.ws_rides,
+                    broadcasts=args.broadcasts, seed=args.seed
+                ))
+            else:
+                results.append(await scenarios.websocket_fanout_inprocess(
+                    clients=args.clients, rides=args.ws_rides, broadcasts=args.broadcasts, seed=args.seed
+                ))
+        if "ws_soak" in selected:
+            if args.base_url:
+                print("Skipping ws_soak: it drives the in-process app")
+            else:
+                results.extend(await scenarios.websocket_soak(
+                    app, client, city, tokens, sockets=args.soak_sockets, requests=args.soak_requests,
+                    concurrency=args.concurrency, seed=args.seed
+                ))
+    finally:
+        await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    write_results(results, args.output)
+
+def main(argv=None):
+    args = parse_args(argv)
+    prepare_environment(args)
+    city = seed_database(args)
+    asyncio.run(run(args, city))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.models import User, Ride, RideParticipant, HelmetCheck, UserRole, RideStatus
+from datetime import datetime, timedelta
+from typing import Dict, List
+import random
+
+# Bengaluru neighbourhoods where most commuter rides start or end
+HOTSPOTS = [
+    ("Koramangala", 12.9352, 77.6245),
+    ("Indiranagar", 12.9784, 77.6408),
+    ("Whitefield", 12.9698, 77.7500),
+    ("Electronic City", 12.8452, 77.6602),
+    ("Hebbal", 13.0358, 77.5970),
+    ("Jayanagar", 12.9250, 77.5938),
+    ("MG Road", 12.9756, 77.6066),
+    ("Marathahalli", 12.9569, 77.7011),
+    ("Yelahanka", 13.1007, 77.5963),
+    ("BTM Layout", 12.9166, 77.6101)
+]
+
+# Share of generated rides per status; open rides are what /nearby scans
+STATUS_MIX = [
+    (RideStatus.CREATED, 0.30),
+    (RideStatus.REQUESTED, 0.15),
+    (RideStatus.CONFIRMED, 0.05),
+    (RideStatus.ONGOING, 0.05),
+    (RideStatus.COMPLETED, 0.40),
+    (RideStatus.CANCELLED, 0.05)
+]
+
+HOST_FRACTION = 0.25
+INSERT_CHUNK = 5000
+
+class City:
+    """Handles to the generated data that scenario drivers need"""
+
+    def __init__(self):
+        self.riders: List[Dict] = []
+        self.hosts: List[Dict] = []
+        self.open_ride_ids: List[int] = []
+        self.hot_ride_ids: List[int] = []
+        self.ride_hosts: Dict[int, int] = {}
+        self.hotspots = HOTSPOTS
+
+    def host_supabase_id(self, ride_id: int) -> str:
+        return f"bench-user-{self.ride_hosts[ride_id]}"
+
+def _jitter(rng: random.Random, lat: float, lng: float, spread_km: float):
+    """Gaussian offset around a point (roughly 1 degree ~ 111 km)"""
+    return (
+        lat + rng.gauss(0, spread_km / 111.0),
+        lng + rng.gauss(0, spread_km / 111.0)
+    )
+
+def _bulk_insert(db: Session, model, rows: List[Dict]):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        db.execute(insert(model), rows[i:i + INSERT_CHUNK])
+
+def _pick_status(rng: random.Random) -> RideStatus:
+    roll = rng.random()
+    cumulative = 0.0
+    for ride_status, share in STATUS_MIX:
+        cumulative += share
+        if roll <= cumulative:
+            return ride_status
+    return STATUS_MIX[-1][0]
+
+def generate_city(
+    db: Session,
+    users: int = 2000,
+    rides: int = 5000,
+    hot_rides: int = 5,
+    spread_km: float = 2.5,
+    seed: int = 42
+) -> City:
+    """Bulk-load a reproducible synthetic city of users, rides, participants and helmet checks"""
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    city = City()
+
+    # Users
+    user_rows = []
+    for i in range(1, users + 1):
+        role = UserRole.BIKE_HOST if rng.random() < HOST_FRACTION else UserRole.RIDER
+        user_rows.append({
+            "id": i,
+            "supabase_id": f"bench-user-{i}",
+            "email": f"bench-user-{i}@bench.pillion.local",
+            "phone": f"+91{9000000000 + i}",
+            "full_name": f"Bench User {i}",
+            "role": role,
+            "is_verified": True,
+            "created_at": now - timedelta(days=rng.randint(1, 365)),
+            "updated_at": now
+        })
+    _bulk_insert(db, User, user_rows)
+
+    for row in user_rows:
+        handle = {"id": row["id"], "supabase_id": row["supabase_id"]}
+        (city.hosts if row["role"] == UserRole.BIKE_HOST else city.riders).append(handle)
+
+    if not city.hosts:
+        raise ValueError("Generated city has no bike hosts; increase the number of users")
+
+    # Rides
+    ride_rows = []
+    participant_rows = []
+    helmet_rows = []
+    participant_id = 0
+    helmet_id = 0
+
+    for ride_id in range(1, rides + 1):
+        host = rng.choice(city.hosts)
+        ride_status = RideStatus.CREATED if ride_id <= hot_rides else _pick_status(rng)
+        start_name, start_lat, start_lng = rng.choice(HOTSPOTS)
+        end_name, end_lat, end_lng = rng.choice(HOTSPOTS)
+        start_lat, start_lng = _jitter(rng, start_lat, start_lng, spread_km)
+        end_lat, end_lng = _jitter(rng, end_lat, end_lng, spread_km)
+
+        if ride_status in (RideStatus.COMPLETED, RideStatus.CANCELLED):
+            departure = now - timedelta(minutes=rng.randint(60, 60 * 24 * 90))
+        else:
+            departure = now + timedelta(minutes=rng.randint(5, 60 * 12))
+
+        # Hot rides are the few attractive rides everyone tries to join at once
+        max_passengers = 1000 if ride_id <= hot_rides else rng.choice([1, 1, 1, 2])
+
+        ride_rows.append({
+            "id": ride_id,
+            "host_id": host["id"],
+            "title": f"{start_name} to {end_name}",
+            "description": "Synthetic benchmark ride",
+            "start_lat": start_lat,
+            "start_lng": start_lng,
+            "end_lat": end_lat,
+            "end_lng": end_lng,
+            "start_address": start_name,
+            "end_address": end_name,
+            "departure_time": departure,
+            "max_passengers": max_passengers,
+            "status": ride_status,
+            "created_at": departure - timedelta(hours=rng.randint(1, 48)),
+            "updated_at": now
+        })
+        city.ride_hosts[ride_id] = host["id"]
+
+        if ride_status in (RideStatus.CREATED, RideStatus.REQUESTED):
+            city.open_ride_ids.append(ride_id)
+        if ride_id <= hot_rides:
+            city.hot_ride_ids.append(ride_id)
+
+        # Participants and helmet checks for rides that got past CREATED
+        if ride_status == RideStatus.CREATED or not city.riders:
+            continue
+
+        participant_status = "requested" if ride_status == RideStatus.REQUESTED else "confirmed"
+        if ride_status == RideStatus.CANCELLED:
+            participant_status = "cancelled"
+
+        for rider in rng.sample(city.riders, min(max_passengers, len(city.riders))):
+            participant_id += 1
+            participant_rows.append({
+                "id": participant_id,
+                "ride_id": ride_id,
+                "rider_id": rider["id"],
+                "status": participant_status,
+                "joined_at": departure - timedelta(minutes=rng.randint(10, 600))
+            })
+
+            if ride_status in (RideStatus.CONFIRMED, RideStatus.ONGOING, RideStatus.COMPLETED):
+                helmet_id += 1
+                helmet_rows.append({
+                    "id": helmet_id,
+                    "user_id": rider["id"],
+                    "ride_id": ride_id,
+                    "image_url": f"/uploads/helmets/bench-{helmet_id}.jpg",
+                    "is_verified": True,
+                    "created_at": departure - timedelta(minutes=rng.randint(1, 30))
+                })
+
+    _bulk_insert(db, Ride, ride_rows)
+    _bulk_insert(db, RideParticipant, participant_rows)
+    _bulk_insert(db, HelmetCheck, helmet_rows)
+    db.commit()
+
+    print(
+        f"🏙️  Generated city: {len(user_rows)} users ({len(city.hosts)} hosts), "
+        f"{len(ride_rows)} rides ({len(city.open_ride_ids)} open), "
+        f"{len(participant_rows)} participants, {len(helmet_rows)} helmet checks"
+    )
+    return city
@@ -0,0 +1,70 @@
+"""Near-duplicate lookup latency of the helmet photo hash index
+
+    python -m benchmarks.helmet_hash_index --hashes 1000000 --queries 5000
+
+Fills the index with random 64-bit hashes, then queries both fresh hashes (misses)
+and hashes a few bits away from stored ones (reused photos). A sample of queries
+is cross-checked against a brute-force scan.
+"""
+import argparse
+import random
+import time
+
+def flip_bits(rng: random.Random, value: int, bits: int) -> int:
+    for position in rng.sample(range(64), bits):
+        value ^= 1 << position
+    return value
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.helmet_hash_index")
+    parser.add_argument("--hashes", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--max-distance", type=int, default=6)
+    parser.add_argument("--verify", type=int, default=50, help="Queries cross-checked by brute force")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from app.phash import PerceptualHashIndex
+    from benchmarks.stats import LatencyRecorder, write_results
+
+    rng = random.Random(args.seed)
+    index = PerceptualHashIndex(max_distance=args.max_distance)
+    stored = [rng.getrandbits(64) for _ in range(args.hashes)]
+    started = time.perf_counter()
+    for row_id, value in enumerate(stored, start=1):
+        index.add(row_id, value)
+    build_seconds = time.perf_counter() - started
+
+    results = []
+    for name, make_query, expect_match in (
+        ("hash_index_miss", lambda: rng.getrandbits(64), False),
+        ("hash_index_reused_photo", lambda: flip_bits(rng, rng.choice(stored), rng.randint(0, args.max_distance)), True),
+    ):
+        queries = [make_query() for _ in range(args.queries)]
+        recorder = LatencyRecorder(name)
+        recorder.start()
+        for query in queries:
+            query_started = time.perf_counter()
+            matches = index.near(query)
+            recorder.record(time.perf_counter() - query_started, bool(matches) or not expect_match)
+        recorder.stop()
+
+        mismatches = 0
+        for query in queries[:args.verify]:
+            brute = sorted(
+                row_id for row_id, value in enumerate(stored, start=1)
+                if (query ^ value).bit_count() <= args.max_distance
+            )
+            if sorted(row_id for row_id, _ in index.near(query)) != brute:
+                mismatches += 1
+
+        result = recorder.summary({"hashes": args.hashes, "max_distance": args.max_distance})
+        result["build_s"] = round(build_seconds, 3)
+        result["brute_force_mismatches"] = mismatches
+        results.append(result)
+
+    write_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
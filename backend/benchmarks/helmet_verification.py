@@ -0,0 +1,97 @@
+"""Helmet verification throughput in images per second per core
+
+    python -m benchmarks.helmet_verification --images 400 --workers 1,2,4 --batch-sizes 1,8,32
+
+Synthetic camera-sized JPEGs are pushed through the same process-pool entry point
+the verification worker uses, keeping one batch in flight per worker.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+
+def make_images(directory: str, count: int, size, seed: int):
+    """Distinct photo-like JPEGs: gradient background plus noise and blocks"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    paths = []
+    base = Image.linear_gradient("L").resize(size).convert("RGB")
+    for i in range(count):
+        image = Image.blend(base, Image.effect_noise(size, rng.uniform(20, 60)).convert("RGB"), 0.4)
+        draw = ImageDraw.Draw(image)
+        for _ in range(6):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            draw.ellipse([x, y, x + rng.randrange(50, 400), y + rng.randrange(50, 400)],
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        path = os.path.join(directory, f"helmet-{i}.jpg")
+        image.save(path, "JPEG", quality=85)
+        paths.append(path)
+    return paths
+
+async def measure(paths, spec: str, workers: int, batch_size: int):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from app.verification import run_verifier_batch
+    from benchmarks.stats import LatencyRecorder
+
+    recorder = LatencyRecorder("helmet_verification")
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    slots = asyncio.Semaphore(workers)
+    loop = asyncio.get_running_loop()
+    verified = 0
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Warm the workers (process start and verifier load are not per-image costs)
+        await asyncio.gather(*[loop.run_in_executor(pool, run_verifier_batch, spec, paths[:1]) for _ in range(workers)])
+
+        async def run_batch(batch):
+            nonlocal verified
+            async with slots:
+                started = time.perf_counter()
+                results = await loop.run_in_executor(pool, run_verifier_batch, spec, batch)
+                recorder.record(time.perf_counter() - started)
+                verified += sum(1 for ok, _, _ in results if ok)
+
+        recorder.start()
+        await asyncio.gather(*[run_batch(batch) for batch in batches])
+        recorder.stop()
+
+    result = recorder.summary({"workers": workers, "batch_size": batch_size, "images": len(paths), "verifier": spec})
+    images_per_second = len(paths) / recorder.duration
+    result["images_per_s"] = round(images_per_second, 2)
+    result["images_per_s_per_core"] = round(images_per_second / min(workers, os.cpu_count() or 1), 2)
+    result["verified"] = verified
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.helmet_verification")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--width", type=int, default=1280, help="Verification-size images by default")
+    parser.add_argument("--height", type=int, default=960)
+    parser.add_argument("--workers", default="1,2")
+    parser.add_argument("--batch-sizes", default="1,8")
+    parser.add_argument("--verifier", default=None, help="module:callable (defaults to HELMET_VERIFIER)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from app.verification import HELMET_VERIFIER
+    from benchmarks.stats import write_results
+
+    directory = tempfile.mkdtemp(prefix="pillion-helmets-")
+    try:
+        paths = make_images(directory, args.images, (args.width, args.height), args.seed)
+        results = []
+        for workers in [int(value) for value in args.workers.split(",")]:
+            for batch_size in [int(value) for value in args.batch_sizes.split(",")]:
+                results.append(asyncio.run(measure(paths, args.verifier or HELMET_VERIFIER, workers, batch_size)))
+        write_results(results, args.output)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Host notifications per join request under join bursts, by digest window
+
+    python -m benchmarks.join_burst --windows 0,1,2,5 --rides 200 --burst 40
+
+--rides popular rides each get --burst join requests spread over --burst-seconds
+(a ride going viral), and as many quiet rides get a single request. Requests are
+replayed through JoinRequestDigests on a simulated clock, so no time is spent
+waiting for windows to close. Window 0 is the old behaviour (one message per
+request). Reports messages sent to hosts, the share of messages saved, and
+the delay from each request to the message that carried it (latency columns).
+"""
+import argparse
+import asyncio
+import random
+import time
+
+async def run(window: float, rides: int, burst: int, burst_seconds: float, seed: int) -> dict:
+    from app.digest import JoinRequestDigests, JOIN_DIGEST_TICK_SECONDS
+    from benchmarks.stats import LatencyRecorder
+
+    rng = random.Random(seed)
+    origin = time.monotonic()  # the digests' timer wheel starts here
+    requests = []
+    for ride_id in range(1, rides + 1):
+        started = rng.uniform(0, 60)
+        for rider in range(burst):
+            requests.append((started + rng.uniform(0, burst_seconds), ride_id, rider))
+        requests.append((rng.uniform(0, 60), rides + ride_id, 0))
+    requests.sort()
+
+    recorder = LatencyRecorder("join_burst")
+    clock = origin
+    per_host = {}
+
+    async def send_one(ride_id, host_id, requester, title):
+        per_host[host_id] = per_host.get(host_id, 0) + 1
+        recorder.record(clock - requester["at"])
+
+    async def send_digest(ride_id, host_id, requesters, title):
+        per_host[host_id] = per_host.get(host_id, 0) + 1
+        for requester in requesters:
+            recorder.record(clock - requester["at"])
+
+    digests = JoinRequestDigests(send_one, send_digest, window_seconds=window)
+    tick = JOIN_DIGEST_TICK_SECONDS
+    next_tick = origin + tick
+    recorder.start()
+    for at, ride_id, rider in requests:
+        # The expiry loop runs every tick in between
+        while next_tick <= origin + at:
+            clock = next_tick
+            await digests.expire(clock)
+            next_tick += tick
+        clock = origin + at
+        await digests.add(ride_id, 1_000_000 + ride_id, {"user_id": rider, "at": clock}, "Ride", now=clock)
+    while digests.get_stats()["open_windows"]:
+        clock = next_tick
+        await digests.expire(clock)
+        next_tick += tick
+    recorder.stop()
+
+    stats = digests.get_stats()
+    result = recorder.summary({
+        "window_s": window, "rides": rides, "burst": burst, "burst_seconds": burst_seconds, "quiet_rides": rides
+    })
+    result["requests"] = stats["requests"]
+    result["messages"] = stats["messages"]
+    result["digests"] = stats["digests"]
+    # Without digests every request is a message
+    result["message_reduction"] = round(1 - stats["messages"] / stats["requests"], 4)
+    result["max_messages_per_popular_host"] = max(per_host.get(1_000_000 + ride_id, 0) for ride_id in range(1, rides + 1))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.join_burst")
+    parser.add_argument("--windows", default="0,1,2,5", help="Comma-separated digest windows in seconds")
+    parser.add_argument("--rides", type=int, default=200, help="Popular rides (and as many quiet ones)")
+    parser.add_argument("--burst", type=int, default=40, help="Join requests per popular ride")
+    parser.add_argument("--burst-seconds", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from benchmarks.stats import write_results
+
+    write_results([
+        asyncio.run(run(float(window), args.rides, args.burst, args.burst_seconds, args.seed))
+        for window in args.windows.split(",")
+    ], args.output)
+
+if __name__ == "__main__":
+    main()
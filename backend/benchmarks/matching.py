@@ -0,0 +1,114 @@
+"""Solve time of batch rider-to-ride matching against batch size
+
+    python -m benchmarks.matching --batches 100,250,500,1000,2000 --repeats 5
+
+Riders and rides are scattered around a few hotspots with departures over the next
+hour; there is about one free seat per rider. Each batch is solved by the matcher
+(vectorised cost matrix + linear_sum_assignment) and, for comparison, greedily in
+arrival order with every rider taking the nearest ride that still has a seat (what
+individual /nearby + join calls amount to).
+"""
+import argparse
+import math
+import random
+import time
+
+HOTSPOTS = [(12.9716, 77.5946), (12.9352, 77.6245), (12.9698, 77.7500), (13.0358, 77.5970)]
+NOW = 1_700_000_000.0
+
+def make_batch(rng: random.Random, riders: int):
+    from app.matching import MatchRequest, RideCandidate, EPOCH
+    from datetime import timedelta
+
+    def near(spread_km: float):
+        lat, lng = rng.choice(HOTSPOTS)
+        return lat + rng.gauss(0, spread_km / 111.0), lng + rng.gauss(0, spread_km / 111.0)
+
+    candidates = []
+    for ride_id in range(1, riders // 2 + 1):
+        (start_lat, start_lng), (end_lat, end_lng) = near(2.0), near(2.0)
+        candidates.append(RideCandidate(
+            ride_id, 1_000_000 + ride_id, start_lat, start_lng, end_lat, end_lng,
+            NOW + rng.uniform(0, 3600), rng.randint(1, 3), set()
+        ))
+    requests = []
+    for rider_id in range(1, riders + 1):
+        (pickup_lat, pickup_lng), (dropoff_lat, dropoff_lng) = near(2.0), near(2.0)
+        earliest = EPOCH + timedelta(seconds=NOW + rng.uniform(0, 1800))
+        requests.append(MatchRequest(
+            rider_id, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng,
+            earliest, earliest + timedelta(minutes=30), 3.0
+        ))
+    return requests, candidates
+
+def greedy(requests, candidates):
+    """Nearest ride with a free seat, first come first served"""
+    from app.matching import INFEASIBLE, cost_matrix
+
+    cost, column_ride = cost_matrix(requests, candidates)
+    seats = [candidate.seats for candidate in candidates]
+    total, matched = 0.0, 0
+    for row in range(len(requests)):
+        best, best_pickup = None, math.inf
+        for column in range(cost.shape[1]):
+            index = column_ride[column]
+            if seats[index] and cost[row, column] < INFEASIBLE:
+                request, ride = requests[row], candidates[index]
+                pickup = math.hypot(request.pickup_lat - ride.start_lat, request.pickup_lng - ride.start_lng)
+                if pickup < best_pickup:
+                    best, best_pickup = column, pickup
+        if best is not None:
+            seats[column_ride[best]] -= 1
+            total += cost[row, best]
+            matched += 1
+    return matched, total
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.matching")
+    parser.add_argument("--batches", default="100,250,500,1000,2000", help="Comma-separated riders per batch")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from app.matching import cost_matrix, solve
+    from benchmarks.stats import LatencyRecorder, write_results
+
+    rng = random.Random(args.seed)
+    results = []
+    for riders in (int(size) for size in args.batches.split(",")):
+        recorder = LatencyRecorder("ride_matching")
+        build_seconds = []
+        recorder.start()
+        for _ in range(args.repeats):
+            requests, candidates = make_batch(rng, riders)
+            started = time.perf_counter()
+            cost, column_ride = cost_matrix(requests, candidates)
+            build_seconds.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            assigned = solve(requests, candidates)
+            recorder.record(time.perf_counter() - started)
+        recorder.stop()
+
+        # Quality of the last batch against the greedy baseline
+        matched = [(row, index) for row, index in enumerate(assigned) if index is not None]
+        optimal_cost = 0.0
+        for row, index in matched:
+            columns = [column for column in range(cost.shape[1]) if column_ride[column] == index]
+            optimal_cost += cost[row, columns[0]]
+        greedy_matched, greedy_cost = greedy(requests, candidates)
+
+        result = recorder.summary({
+            "riders": riders, "rides": len(candidates), "seats": sum(candidate.seats for candidate in candidates)
+        })
+        result["cost_matrix_ms"] = round(sorted(build_seconds)[len(build_seconds) // 2] * 1000, 3)
+        result["matched"] = len(matched)
+        result["mean_cost_km"] = round(optimal_cost / max(len(matched), 1), 3)
+        result["greedy_matched"] = greedy_matched
+        result["greedy_mean_cost_km"] = round(greedy_cost / max(greedy_matched, 1), 3)
+        results.append(result)
+
+    write_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Exercise read-replica routing locally with SQLite files standing in for replicas
+
+    python -m benchmarks.replica_routing --requests 500
+
+The primary and replicas are separate SQLite files. Replicas are refreshed by copying
+the primary, so a write is invisible on them until the next copy -- exactly the lag
+read-your-writes stickiness has to hide. The third replica points at a path that
+cannot be opened to show fallback to the primary.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+
+PRIMARY_FILE = "pillion_bench_primary.db"
+REPLICA_FILES = ["pillion_bench_replica1.db", "pillion_bench_replica2.db"]
+BROKEN_REPLICA_URL = "sqlite:///./missing-dir/replica.db"
+STICKY_SECONDS = 1.0
+
+def prepare_environment():
+    os.environ["DATABASE_URL"] = f"sqlite:///./{PRIMARY_FILE}"
+    os.environ["DATABASE_REPLICA_URLS"] = ",".join(
+        [f"sqlite:///./{name}" for name in REPLICA_FILES] + [BROKEN_REPLICA_URL]
+    )
+    os.environ["READ_YOUR_WRITES_SECONDS"] = str(STICKY_SECONDS)
+    os.environ.setdefault("JWT_SECRET", "pillion-benchmark-secret")
+
+def replicate(engines):
+    """'Ship' the primary to every replica file"""
+    for replica_engine in engines:
+        replica_engine.dispose()
+    for name in REPLICA_FILES:
+        shutil.copyfile(PRIMARY_FILE, name)
+
+async def run(args):
+    import httpx
+    from app.database import Base, SessionLocal, engine, read_router
+    from benchmarks.datagen import generate_city
+    from benchmarks.stats import LatencyRecorder, write_results
+    from benchmarks.tokens import mint_token, auth_headers
+    from main import app
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        city = generate_city(db, users=args.users, rides=args.rides)
+    finally:
+        db.close()
+    replicate(read_router.replicas)
+
+    checks = {}
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    # 1. Read-your-writes: a fresh registration is only on the primary
+    newcomer = "bench-newcomer"
+    headers = auth_headers(mint_token(newcomer))
+    response = await client.post("/api/users/register", headers=headers, json={
+        "supabase_id": newcomer, "email": "newcomer@bench.pillion.local",
+        "phone": "+918000000000", "full_name": "New Comer", "role": "rider"
+    })
+    checks["register"] = response.status_code
+    checks["profile_within_window"] = (await client.get("/api/users/profile", headers=headers)).status_code
+
+    await asyncio.sleep(STICKY_SECONDS + 0.2)
+    checks["profile_after_window_before_replication"] = (
+        await client.get("/api/users/profile", headers=headers)
+    ).status_code
+
+    replicate(read_router.replicas)
+    checks["profile_after_replication"] = (await client.get("/api/users/profile", headers=headers)).status_code
+
+    # 2. Load balancing across replicas (the broken one is skipped after its first failure)
+    recorder = LatencyRecorder("replica_routed_profile_reads")
+    recorder.start()
+    for i in range(args.requests):
+        rider = city.riders[i % len(city.riders)]
+        started = time.perf_counter()
+        response = await client.get("/api/users/profile", headers=auth_headers(mint_token(rider["supabase_id"])))
+        recorder.record(time.perf_counter() - started, response.status_code == 200)
+    recorder.stop()
+    await client.aclose()
+
+    result = recorder.summary({"requests": args.requests, "replicas": len(read_router.replicas)})
+    result["checks"] = checks
+    result["router"] = read_router.get_stats()
+    write_results([result], args.output)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.replica_routing")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rides", type=int, default=500)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    prepare_environment()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
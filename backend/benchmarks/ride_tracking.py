@@ -0,0 +1,99 @@
+"""Per-fix cost of route-deviation / ETA tracking across many ongoing rides
+
+    python -m benchmarks.ride_tracking --rides 10000,50000 --fixes 20
+
+Each synthetic ride runs 3-15 km across Bengaluru; the host's fixes follow the
+start-end line with GPS noise, and --deviating of the rides swing 2 km off it
+halfway through. Fixes from all rides are interleaved as they would arrive.
+Reports update latency, tracker memory per ride, and whether exactly the
+deviating rides were flagged.
+"""
+import argparse
+import gc
+import math
+import random
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+CENTER = (12.9716, 77.5946)
+
+def make_ride(rng: random.Random, ride_id: int):
+    start_lat = CENTER[0] + rng.uniform(-0.1, 0.1)
+    start_lng = CENTER[1] + rng.uniform(-0.1, 0.1)
+    length_km = rng.uniform(3, 15)
+    bearing = rng.uniform(0, 2 * math.pi)
+    end_lat = start_lat + length_km / 111.0 * math.cos(bearing)
+    end_lng = start_lng + length_km / (111.0 * math.cos(math.radians(start_lat))) * math.sin(bearing)
+    return SimpleNamespace(
+        id=ride_id, host_id=1_000_000 + ride_id,
+        start_lat=start_lat, start_lng=start_lng, end_lat=end_lat, end_lng=end_lng
+    )
+
+def fix_at(rng: random.Random, ride, fraction: float, offset_km: float):
+    """Position fraction of the way along the route, offset_km to its left, with ~10 m noise"""
+    lat = ride.start_lat + (ride.end_lat - ride.start_lat) * fraction
+    lng = ride.start_lng + (ride.end_lng - ride.start_lng) * fraction
+    if offset_km:
+        dlat, dlng = ride.end_lat - ride.start_lat, (ride.end_lng - ride.start_lng) * math.cos(math.radians(lat))
+        norm = math.hypot(dlat, dlng)
+        lat += -dlng / norm * offset_km / 111.0
+        lng += dlat / norm * offset_km / (111.0 * math.cos(math.radians(lat)))
+    return lat + rng.gauss(0, 0.0001), lng + rng.gauss(0, 0.0001)
+
+def run(rides: int, fixes: int, deviating: float, seed: int) -> dict:
+    from app.tracking import RideTracker
+    from benchmarks.stats import LatencyRecorder
+
+    rng = random.Random(seed)
+    tracker = RideTracker()
+    planned = [make_ride(rng, ride_id) for ride_id in range(1, rides + 1)]
+    off_route = set(rng.sample(range(1, rides + 1), int(rides * deviating)))
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for ride in planned:
+        tracker.ride_started(ride, [])
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    # A fix every 30 s per ride, all rides interleaved
+    recorder = LatencyRecorder("ride_tracking")
+    recorder.start()
+    for step in range(fixes):
+        fraction = (step + 1) / fixes
+        now = 1_700_000_000 + step * 30.0
+        for ride in planned:
+            swing = 2.0 if ride.id in off_route and fixes // 3 <= step < 2 * fixes // 3 else 0.0
+            lat, lng = fix_at(rng, ride, fraction, swing)
+            started = time.perf_counter()
+            tracker.update(ride.id, ride.host_id, lat, lng, now)
+            recorder.record(time.perf_counter() - started)
+    recorder.stop()
+
+    flagged = {ride.id for ride in planned if tracker.get(ride.id).deviations}
+    remaining_at_arrival = [tracker.get(ride.id).progress()["remaining_m"] for ride in planned]
+    result = recorder.summary({"rides": rides, "fixes_per_ride": fixes, "deviating": len(off_route)})
+    result["bytes_per_ride"] = round(memory / rides, 1)
+    result["flagged_rides"] = len(flagged)
+    result["missed_deviations"] = len(off_route - flagged)
+    result["false_deviations"] = len(flagged - off_route)
+    result["median_remaining_m_at_arrival"] = sorted(remaining_at_arrival)[len(remaining_at_arrival) // 2]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ride_tracking")
+    parser.add_argument("--rides", default="10000,50000", help="Comma-separated ongoing ride counts")
+    parser.add_argument("--fixes", type=int, default=20, help="Host fixes per ride")
+    parser.add_argument("--deviating", type=float, default=0.01, help="Share of rides that leave their route")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from benchmarks.stats import write_results
+
+    write_results([run(int(count), args.fixes, args.deviating, args.seed) for count in args.rides.split(",")], args.output)
+
+if __name__ == "__main__":
+    main()
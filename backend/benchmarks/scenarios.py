@@ -0,0 +1,461 @@
+from benchmarks.datagen import City
+from benchmarks.stats import LatencyRecorder
+from benchmarks.tokens import mint_token, auth_headers
+from typing import Dict, List, Optional
+import asyncio
+import io
+import json
+import random
+import time
+
+class TokenCache:
+    """Mint each simulated user's JWT once per run"""
+
+    def __init__(self):
+        self._headers: Dict[str, dict] = {}
+
+    def headers(self, supabase_id: str) -> dict:
+        if supabase_id not in self._headers:
+            self._headers[supabase_id] = auth_headers(mint_token(supabase_id))
+        return self._headers[supabase_id]
+
+async def _run_pool(jobs: List, concurrency: int, recorder: LatencyRecorder):
+    """Run (coroutine factory) jobs with bounded concurrency, timing each one"""
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def worker():
+        while True:
+            try:
+                job = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                ok = await job()
+            except Exception:
+                ok = False
+            recorder.record(time.perf_counter() - started, ok)
+
+    recorder.start()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    recorder.stop()
+
+async def nearby_search_storm(
+    client,
+    city: City,
+    tokens: TokenCache,
+    requests: int = 2000,
+    concurrency: int = 50,
+    radius_km: float = 5.0,
+    seed: int = 1
+) -> Dict:
+    """Many riders searching /nearby around city hotspots at once"""
+    rng = random.Random(seed)
+    recorder = LatencyRecorder("nearby_search_storm")
+
+    def make_job(rider, lat, lng):
+        async def job():
+            response = await client.post(
+                "/api/rides/nearby",
+                json={"lat": lat, "lng": lng, "radius_km": radius_km},
+                headers=tokens.headers(rider["supabase_id"])
+            )
+            return response.status_code == 200
+        return job
+
+    jobs = []
+    for _ in range(requests):
+        _, lat, lng = rng.choice(city.hotspots)
+        rider = rng.choice(city.riders)
+        jobs.append(make_job(rider, lat + rng.gauss(0, 0.01), lng + rng.gauss(0, 0.01)))
+
+    await _run_pool(jobs, concurrency, recorder)
+    return recorder.summary({"requests": requests, "concurrency": concurrency, "radius_km": radius_km})
+
+async def join_burst(
+    client,
+    city: City,
+    tokens: TokenCache,
+    riders: int = 500,
+    concurrency: int = 100,
+    seed: int = 2
+) -> Dict:
+    """A crowd of riders requesting to join the same few hot rides simultaneously"""
+    rng = random.Random(seed)
+    recorder = LatencyRecorder("join_burst")
+    burst = rng.sample(city.riders, min(riders, len(city.riders)))
+
+    def make_job(rider, ride_id):
+        async def job():
+            response = await client.post(
+                f"/api/rides/join/{ride_id}",
+                headers=tokens.headers(rider["supabase_id"])
+            )
+            return response.status_code == 200
+        return job
+
+    jobs = [make_job(rider, rng.choice(city.hot_ride_ids)) for rider in burst]
+
+    await _run_pool(jobs, concurrency, recorder)
+    return recorder.summary({"riders": len(burst), "concurrency": concurrency, "hot_rides": len(city.hot_ride_ids)})
+
+def helmet_photo(seed: int) -> bytes:
+    """Small distinct JPEG that passes the default helmet photo checks"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    # Random 9x8 brightness grid -> independent dHash bits, so photos never look reused
+    grid = Image.frombytes("L", (9, 8), bytes(rng.randrange(40, 220) for _ in range(72)))
+    image = grid.resize((360, 320), Image.BILINEAR).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(360), rng.randrange(320)
+        draw.ellipse([x, y, x + rng.randrange(10, 60), y + rng.randrange(10, 60)],
+                     outline=tuple(rng.randrange(256) for _ in range(3)), width=3)
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+async def submit_helmets(client, tokens: TokenCache, ride_id: int, host_headers: dict, timeout: float = 30.0) -> bool:
+    """Upload and verify a helmet photo for every confirmed rider, then wait until the ride is ready"""
+    status = (await client.get(f"/api/helmet/ride/{ride_id}", headers=host_headers)).json()
+    for participant in status["participants"]:
+        if participant["participant_status"] != "confirmed" or participant["check_id"] is not None:
+            continue
+        headers = tokens.headers(f"bench-user-{participant['user_id']}")
+        photo = helmet_photo(ride_id * 100003 + participant["user_id"])
+        upload = await client.post("/api/helmet/upload", headers=headers, files={"file": ("helmet.jpg", photo, "image/jpeg")})
+        if upload.status_code != 200:
+            return False
+        verify = await client.post("/api/helmet/verify", headers=headers, json={
+            "ride_id": ride_id, "image_url": upload.json()["image_url"]
+        })
+        if verify.status_code != 200:
+            return False
+
+    # Verification is asynchronous: poll the bulk status like the host's app would
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if status["ready"]:
+            return True
+        await asyncio.sleep(0.05)
+        status = (await client.get(f"/api/helmet/ride/{ride_id}", headers=host_headers)).json()
+    return False
+
+async def lifecycle_transitions(
+    client,
+    city: City,
+    tokens: TokenCache,
+    rides: int = 100,
+    concurrency: int = 10,
+    seed: int = 3
+) -> List[Dict]:
+    """Drive open rides through join -> confirm -> helmet -> start -> complete"""
+    rng = random.Random(seed)
+    hot = set(city.hot_ride_ids)
+    candidates = [ride_id for ride_id in city.open_ride_ids if ride_id not in hot]
+    chosen = rng.sample(candidates, min(rides, len(candidates)))
+
+    steps = ["join", "confirm", "helmet", "start", "complete"]
+    recorders = {step: LatencyRecorder(f"lifecycle_{step}") for step in steps}
+    overall = LatencyRecorder("lifecycle_full")
+    host_ids = set(city.ride_hosts.values())
+
+    async def drive(ride_id):
+        host_headers = tokens.headers(city.host_supabase_id(ride_id))
+        rider = rng.choice(city.riders)
+        for step in steps:
+            started = time.perf_counter()
+            if step == "helmet":
+                ok = await submit_helmets(client, tokens, ride_id, host_headers)
+            else:
+                if step == "join":
+                    url, headers = f"/api/rides/join/{ride_id}", tokens.headers(rider["supabase_id"])
+                else:
+                    url, headers = f"/api/rides/{step}/{ride_id}", host_headers
+                response = await client.post(url, headers=headers)
+                ok = response.status_code == 200
+            recorders[step].record(time.perf_counter() - started, ok)
+            # A rider may already sit on a generated REQUESTED ride; carry on to confirm
+            if not ok and step != "join":
+                return False
+        return True
+
+    def make_job(ride_id):
+        return lambda: drive(ride_id)
+
+    for recorder in recorders.values():
+        recorder.start()
+    await _run_pool([make_job(ride_id) for ride_id in chosen], concurrency, overall)
+    for recorder in recorders.values():
+        recorder.stop()
+
+    params = {"rides": len(chosen), "concurrency": concurrency, "hosts": len(host_ids)}
+    return [recorders[step].summary(params) for step in steps] + [overall.summary(params)]
+
+class SimulatedSocket:
+    """Stand-in for a Starlette WebSocket that timestamps every frame it receives"""
+
+    def __init__(self, recorder: LatencyRecorder):
+        self.recorder = recorder
+        self.frames = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.frames += 1
+        message = json.loads(data)
+        sent_at = (message.get("location") or {}).get("bench_sent_at")
+        if sent_at is not None:
+            self.recorder.record(time.perf_counter() - sent_at)
+
+    async def close(self, code: int = 1000):
+        pass
+
+async def websocket_fanout_inprocess(
+    clients: int = 5000,
+    rides: int = 50,
+    broadcasts: int = 200,
+    seed: int = 4
+) -> Dict:
+    """Fan location updates out to thousands of simulated in-process sockets"""
+    from app.models import Ride
+    from app.tracking import ride_tracker
+    from app.websocket import manager, handle_websocket_message
+
+    rng = random.Random(seed)
+    recorder = LatencyRecorder("websocket_fanout")
+    # Synthetic user ids well above anything the generator creates
+    base_user_id = 10_000_000
+    connections = []
+
+    for i in range(clients):
+        connection = await manager.connect(SimulatedSocket(recorder), base_user_id + i)
+        await manager.subscribe_to_ride(connection, 1 + i % rides)
+        connections.append(connection)
+
+    # Only people on an ongoing ride may publish its fixes: start each ride with its sockets aboard
+    for ride_id in range(1, rides + 1):
+        aboard = [connection.user_id for connection in connections[ride_id - 1::rides]]
+        ride_tracker.ride_started(
+            Ride(id=ride_id, host_id=aboard[0], start_lat=12.97, start_lng=77.59, end_lat=13.02, end_lng=77.64),
+            aboard[1:]
+        )
+
+    recorder.start()
+    for broadcast in range(broadcasts):
+        ride_id = rng.randint(1, rides)
+        # Rotate through the ride's riders so no single sender runs into the rate limit
+        riders = connections[ride_id - 1::rides]
+        publisher = riders[broadcast % len(riders)]
+        await handle_websocket_message(publisher, {
+            "type": "location_update",
+            "ride_id": ride_id,
+            "location": {"latitude": 12.97, "longitude": 77.59, "bench_sent_at": time.perf_counter()}
+        })
+    recorder.stop()
+
+    for connection in connections:
+        manager.disconnect(connection)
+    for ride_id in range(1, rides + 1):
+        ride_tracker.ride_finished(ride_id)
+
+    return recorder.summary({"clients": clients, "rides": rides, "broadcasts": broadcasts, "mode": "inprocess"})
+
+def _start_rides(ride_ids: List[int]):
+    """Mark seeded rides ONGOING in the server's database"""
+    from app.database import SessionLocal
+    from app.models import Ride, RideStatus
+
+    db = SessionLocal()
+    try:
+        db.query(Ride).filter(Ride.id.in_(ride_ids)).update({Ride.status: RideStatus.ONGOING}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+async def websocket_fanout_remote(
+    ws_url: str,
+    city: City,
+    tokens: TokenCache,
+    clients: int = 1000,
+    rides: int = 20,
+    broadcasts: int = 100,
+    seed: int = 4
+) -> Dict:
+    """Fan location updates out to real WebSocket clients of a running server"""
+    import websockets
+
+    rng = random.Random(seed)
+    recorder = LatencyRecorder("websocket_fanout")
+    users = (city.riders + city.hosts)[:clients]
+    connections = []
+
+    async def reader(connection):
+        try:
+            async for raw in connection:
+                message = json.loads(raw)
+                sent_at = (message.get("location") or {}).get("bench_sent_at")
+                if sent_at is not None:
+                    recorder.record(time.time() - sent_at)
+        except websockets.ConnectionClosed:
+            pass
+
+    # Only the host (or a confirmed rider) of an ongoing ride may publish its fixes
+    ride_ids = sorted(city.ride_hosts)[:rides]
+    _start_rides(ride_ids)
+
+    async def connect(supabase_id: str):
+        token = tokens.headers(supabase_id)["Authorization"].split(" ", 1)[1]
+        return await websockets.connect(f"{ws_url}/api/ws/{token}", max_queue=None)
+
+    for i, user in enumerate(users):
+        connection = await connect(user["supabase_id"])
+        await connection.send(json.dumps({"type": "subscribe_ride", "ride_id": ride_ids[i % len(ride_ids)]}))
+        connections.append(connection)
+    publishers = {ride_id: await connect(city.host_supabase_id(ride_id)) for ride_id in ride_ids}
+
+    readers = [asyncio.create_task(reader(connection)) for connection in connections]
+    # Let subscriptions settle before publishing
+    await asyncio.sleep(1.0)
+
+    recorder.start()
+    for _ in range(broadcasts):
+        ride_id = rng.choice(ride_ids)
+        await publishers[ride_id].send(json.dumps({
+            "type": "location_update",
+            "ride_id": ride_id,
+            "location": {"latitude": 12.97, "longitude": 77.59, "bench_sent_at": time.time()}
+        }))
+    await asyncio.sleep(2.0)
+    recorder.stop()
+
+    for connection in [*connections, *publishers.values()]:
+        await connection.close()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    return recorder.summary({"clients": len(connections), "rides": rides, "broadcasts": broadcasts, "mode": "remote"})
+
+class ASGIWebSocket:
+    """In-process WebSocket client that drives the ASGI app directly (no network)"""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.closed = False
+        self.frames = 0
+        self.task = None
+
+    async def _receive(self):
+        return await self.inbox.get()
+
+    async def _send(self, message):
+        if message["type"] == "websocket.accept":
+            self.accepted.set()
+        elif message["type"] == "websocket.send":
+            self.frames += 1
+        elif message["type"] == "websocket.close":
+            self.closed = True
+            self.accepted.set()
+
+    def start(self):
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "http_version": "1.1",
+            "path": self.path, "raw_path": self.path.encode(), "root_path": "", "query_string": b"",
+            "headers": [], "subprotocols": [], "server": ("bench", 80), "client": ("127.0.0.1", 0)
+        }
+        self.inbox.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(scope, self._receive, self._send))
+
+    async def close(self):
+        self.inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.gather(self.task, return_exceptions=True)
+
+def _pool_engines():
+    from app.database import engine, read_router
+    return [engine] + [replica for replica in read_router.replicas if replica is not engine]
+
+async def websocket_soak(
+    app,
+    client,
+    city: City,
+    tokens: TokenCache,
+    sockets: int = 10000,
+    requests: int = 2000,
+    concurrency: int = 10,
+    seed: int = 5
+) -> List[Dict]:
+    """Hold thousands of authenticated sockets open while REST traffic runs
+
+    REST latency is measured before and while the sockets are open, and
+    pooled connections are sampled throughout: open sockets must not hold any.
+    """
+    rng = random.Random(seed)
+    engines = _pool_engines()
+    users = city.riders + city.hosts
+    checked_out = {"max": 0}
+
+    async def sample_pool(stop: asyncio.Event):
+        while not stop.is_set():
+            checked_out["max"] = max(checked_out["max"], sum(e.pool.checkedout() for e in engines))
+            await asyncio.sleep(0.005)
+
+    def make_job(path: str, headers: dict, body: Optional[dict]):
+        async def job():
+            if body is None:
+                response = await client.get(path, headers=headers)
+            else:
+                response = await client.post(path, json=body, headers=headers)
+            return response.status_code == 200
+        return job
+
+    def rest_jobs():
+        # Half DB-backed profile reads, half /nearby searches
+        jobs = []
+        for i in range(requests):
+            headers = tokens.headers(rng.choice(users)["supabase_id"])
+            if i % 2:
+                jobs.append(make_job("/api/users/profile", headers, None))
+            else:
+                _, lat, lng = rng.choice(city.hotspots)
+                jobs.append(make_job("/api/rides/nearby", headers, {"lat": lat, "lng": lng}))
+        return jobs
+
+    baseline = LatencyRecorder("ws_soak_rest_baseline")
+    await _run_pool(rest_jobs(), concurrency, baseline)
+
+    connect = LatencyRecorder("ws_soak_connect")
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_pool(stop))
+    opened: List[ASGIWebSocket] = []
+    connect.start()
+    for i in range(sockets):
+        token = tokens.headers(users[i % len(users)]["supabase_id"])["Authorization"].split(" ", 1)[1]
+        socket = ASGIWebSocket(app, f"/api/ws/{token}")
+        started = time.perf_counter()
+        socket.start()
+        await socket.accepted.wait()
+        connect.record(time.perf_counter() - started, not socket.closed)
+        opened.append(socket)
+    connect.stop()
+
+    under_load = LatencyRecorder("ws_soak_rest")
+    await _run_pool(rest_jobs(), concurrency, under_load)
+    still_open = sum(1 for socket in opened if not socket.closed and not socket.task.done())
+
+    stop.set()
+    await sampler
+    await asyncio.gather(*(socket.close() for socket in opened))
+
+    pool = engines[0].pool
+    capacity = pool.size() + pool._max_overflow if hasattr(pool, "_max_overflow") else None
+    params = {
+        "sockets": sockets, "requests": requests, "concurrency": concurrency,
+        "sockets_open": still_open, "pool_capacity": capacity, "pool_checked_out_max": checked_out["max"]
+    }
+    return [baseline.summary(params), connect.summary(params), under_load.summary(params)]
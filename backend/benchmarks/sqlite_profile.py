@@ -0,0 +1,126 @@
+"""Mixed read/write throughput of the development vs production SQLite profile
+
+    python -m benchmarks.sqlite_profile --seconds 10 --readers 8 --writers 2
+
+Each profile runs in its own subprocess (app.database reads its settings at import)
+against its own freshly seeded database file.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+PROFILES = ["development", "production"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sqlite_profile")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rides", type=int, default=5000)
+    parser.add_argument("--output", help="Append JSON-lines results to this file")
+    parser.add_argument("--worker", choices=PROFILES, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def run_worker(args):
+    """Seed a database and hammer it with concurrent readers and writers"""
+    from app.database import Base, SessionLocal, engine, read_router
+    from app.models import Ride, RideParticipant, RideStatus
+    from benchmarks.datagen import generate_city
+    from benchmarks.stats import LatencyRecorder
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        city = generate_city(db, users=args.users, rides=args.rides)
+    finally:
+        db.close()
+
+    reads = LatencyRecorder(f"sqlite_{args.worker}_reads")
+    writes = LatencyRecorder(f"sqlite_{args.worker}_writes")
+    deadline = time.perf_counter() + args.seconds
+
+    def reader():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            session = read_router.session()
+            try:
+                session.query(Ride).filter(
+                    Ride.status.in_([RideStatus.CREATED, RideStatus.REQUESTED])
+                ).all()
+                ok = True
+            except Exception:
+                ok = False
+            finally:
+                session.close()
+            reads.record(time.perf_counter() - started, ok)
+
+    def writer(offset):
+        i = offset
+        while time.perf_counter() < deadline:
+            ride_id = city.open_ride_ids[i % len(city.open_ride_ids)]
+            rider = city.riders[i % len(city.riders)]
+            i += args.writers
+            started = time.perf_counter()
+            session = SessionLocal()
+            try:
+                session.add(RideParticipant(ride_id=ride_id, rider_id=rider["id"], status="requested"))
+                session.query(Ride).filter(Ride.id == ride_id).update({"status": RideStatus.REQUESTED})
+                session.commit()
+                ok = True
+            except Exception:
+                session.rollback()
+                ok = False
+            finally:
+                session.close()
+            writes.record(time.perf_counter() - started, ok)
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+
+    reads.start()
+    writes.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    reads.stop()
+    writes.stop()
+
+    params = {"profile": args.worker, "readers": args.readers, "writers": args.writers, "seconds": args.seconds}
+    for recorder in (reads, writes):
+        print("RESULT " + json.dumps(recorder.summary(params)))
+
+def run_profiles(args):
+    from benchmarks.stats import write_results
+
+    results = []
+    for profile in PROFILES:
+        env = dict(
+            os.environ,
+            SQLITE_PROFILE=profile,
+            DATABASE_URL=f"sqlite:///./pillion_bench_{profile}.db"
+        )
+        command = [
+            sys.executable, "-m", "benchmarks.sqlite_profile", "--worker", profile,
+            "--seconds", str(args.seconds), "--readers", str(args.readers), "--writers", str(args.writers),
+            "--users", str(args.users), "--rides", str(args.rides)
+        ]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+        for line in completed.stdout.splitlines():
+            if line.startswith("RESULT "):
+                results.append(json.loads(line[len("RESULT "):]))
+
+    write_results(results, args.output)
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.worker:
+        run_worker(arguments)
+    else:
+        run_profiles(arguments)
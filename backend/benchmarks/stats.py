@@ -0,0 +1,97 @@
+from typing import List, Optional, Dict
+import json
+import math
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+RESULT_SCHEMA_VERSION = 1
+
+class LatencyRecorder:
+    """Collect per-operation latencies and error counts for one scenario"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples: List[float] = []
+        self.errors = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+
+    def stop(self):
+        self.finished_at = time.perf_counter()
+
+    def record(self, seconds: float, ok: bool = True):
+        self.samples.append(seconds)
+        if not ok:
+            self.errors += 1
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    def summary(self, params: Optional[Dict] = None) -> Dict:
+        """Stable, machine-readable result record"""
+        ordered = sorted(self.samples)
+        duration = self.duration
+        count = len(ordered)
+        return {
+            "schema": RESULT_SCHEMA_VERSION,
+            "scenario": self.name,
+            "operations": count,
+            "errors": self.errors,
+            "duration_s": round(duration, 6),
+            "throughput_ops": round(count / duration, 3) if duration > 0 else 0.0,
+            "latency_ms": {
+                "mean": _ms(sum(ordered) / count) if count else None,
+                "p50": _ms(percentile(ordered, 50)),
+                "p95": _ms(percentile(ordered, 95)),
+                "p99": _ms(percentile(ordered, 99)),
+                "max": _ms(ordered[-1]) if count else None
+            },
+            "params": params or {}
+        }
+
+def percentile(ordered: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000.0, 4) if seconds is not None else None
+
+def run_metadata() -> Dict:
+    """Identify the build and machine a result was produced on"""
+    try:
+        git_rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        git_rev = None
+
+    return {
+        "git_rev": git_rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+def write_results(results: List[Dict], output: Optional[str] = None):
+    """Emit results as one JSON object per line (to stdout and optionally a file)"""
+    meta = run_metadata()
+    lines = [json.dumps({**meta, **result}, sort_keys=True) for result in results]
+    for line in lines:
+        print(line)
+    if output:
+        with open(output, "a") as f:
+            for line in lines:
+                f.write(line + "\n")
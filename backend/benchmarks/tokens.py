@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+from jose import jwt
+import os
+
+def mint_token(supabase_id: str, email: str = None, ttl_minutes: int = 120, secret: str = None) -> str:
+    """Mint a Supabase-style JWT that app.auth.verify_token accepts"""
+    if secret is None:
+        # Read lazily so the benchmark harness can set JWT_SECRET before the app is imported
+        from app.auth import SUPABASE_JWT_SECRET
+        secret = SUPABASE_JWT_SECRET or os.getenv("JWT_SECRET")
+
+    if not secret:
+        raise RuntimeError("JWT_SECRET is not set; cannot mint benchmark tokens")
+
+    now = datetime.utcnow()
+    payload = {
+        "sub": supabase_id,
+        "email": email or f"{supabase_id}@bench.pillion.local",
+        "aud": "authenticated",
+        "role": "authenticated",
+        "iat": now,
+        "exp": now + timedelta(minutes=ttl_minutes)
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+def auth_headers(token: str) -> dict:
+    """Authorization headers for a minted token"""
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,101 @@
+"""Memory held by the WebSocket connection manager per idle connection and per subscription
+
+    python -m benchmarks.websocket_memory --connections 10000,100000 --subscriptions 3
+
+Sockets are stand-ins created before measuring, so only the manager's own state is
+counted (connection records, per-user and per-ride indexes, heartbeat timers); a
+real Starlette socket and its ASGI buffers come on top. Allocations are measured
+with tracemalloc after a full collection.
+"""
+import argparse
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+
+class NullSocket:
+    """Accepts and discards every frame"""
+    __slots__ = ()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+def traced_bytes() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+async def measure(connections: int, subscriptions: int, devices: int, rides: int) -> dict:
+    from app.websocket import ConnectionManager
+
+    manager = ConnectionManager()
+    sockets = [NullSocket() for _ in range(connections)]
+    # Synthetic user ids well above anything the generator creates
+    user_ids = [10_000_000 + i // devices for i in range(connections)]
+
+    tracemalloc.start()
+    try:
+        baseline = traced_bytes()
+        started = time.perf_counter()
+        opened = [await manager.connect(socket, user_id) for socket, user_id in zip(sockets, user_ids)]
+        connect_seconds = time.perf_counter() - started
+        # The list of records is the benchmark's, not the manager's
+        idle = traced_bytes() - baseline - sys.getsizeof(opened)
+
+        started = time.perf_counter()
+        for i, connection in enumerate(opened):
+            for k in range(subscriptions):
+                await manager.subscribe_to_ride(connection, 1 + (i + k * 7919) % rides)
+        subscribe_seconds = time.perf_counter() - started
+        subscribed = traced_bytes() - baseline - sys.getsizeof(opened)
+    finally:
+        tracemalloc.stop()
+
+    total_subscriptions = manager.subscription_count
+    for connection in opened:
+        manager.disconnect(connection)
+    assert manager.connection_count == 0 and manager.subscription_count == 0 and not manager.ride_subscribers
+
+    return {
+        "schema": 1,
+        "scenario": "websocket_memory",
+        "bytes_per_idle_connection": round(idle / connections, 1),
+        "bytes_per_subscription": round((subscribed - idle) / total_subscriptions, 1) if total_subscriptions else None,
+        "idle_mb": round(idle / 2**20, 2),
+        "subscribed_mb": round(subscribed / 2**20, 2),
+        "connect_s": round(connect_seconds, 3),
+        "subscribe_s": round(subscribe_seconds, 3),
+        "params": {
+            "connections": connections,
+            "users": len(set(user_ids)),
+            "devices_per_user": devices,
+            "subscriptions_per_connection": subscriptions,
+            "rides": rides
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.websocket_memory")
+    parser.add_argument("--connections", default="10000,100000", help="Comma-separated connection counts")
+    parser.add_argument("--subscriptions", type=int, default=3, help="Rides each connection subscribes to")
+    parser.add_argument("--devices", type=int, default=1, help="Connections per user")
+    parser.add_argument("--rides", type=int, default=5000)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from benchmarks.stats import write_results
+
+    results = [
+        asyncio.run(measure(int(count), args.subscriptions, args.devices, args.rides))
+        for count in args.connections.split(",")
+    ]
+    write_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
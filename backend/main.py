@@ -1,8 +1,22 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from app.routes import auth, rides, users, helmet, websocket
-from app.database import engine, Base
+from app.routes import auth, rides, users, helmet, websocket, admin
+from app.database import engine, Base, SessionLocal, add_missing_columns
+from app.read_model import open_rides, reconcile_open_rides, run_reconciliation_loop
+from app.uploads import UploadSizeLimitMiddleware
+from app.storage import ContentAddressedStaticFiles
+from app.images import image_pipeline
+from app.verification import helmet_verifier
+from app.phash import helmet_hashes
+from app.archive import create_archive_tables
+from app.websocket import run_heartbeat_loop, websocket_ride_event, websocket_join_digests
+from app.notifications import push_ride_event, push_join_digests
+from app.events import ride_events
+from app.trails import trail_store
+from app.tracking import ride_tracker, load_ongoing_rides
+from app.matching import ride_matcher
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -11,6 +25,12 @@ load_dotenv()
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# create_all skips columns and indexes added to tables that already exist
+add_missing_columns(engine, Base.metadata.sorted_tables)
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
 app = FastAPI(
     title="PILLION API",
     description="Bike pooling platform for Indian students and professionals",
@@ -26,9 +46,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Serve uploaded files
+# Reject oversized helmet uploads before the multipart body is parsed
+app.add_middleware(UploadSizeLimitMiddleware)
+
+# Serve uploaded files (content-addressed helmet images are cached as immutable)
 if os.path.exists("uploads"):
-    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+    app.mount("/uploads", ContentAddressedStaticFiles(directory="uploads"), name="uploads")
+
+# Background tasks started with the app
+background_tasks = []
+
+@app.on_event("startup")
+async def start_archive():
+    """Create the archive tables finished rides move to (read through on history queries)"""
+    await run_in_threadpool(create_archive_tables)
+
+@app.on_event("startup")
+async def start_read_model():
+    """Load the open-ride read model and keep it reconciled"""
+    await reconcile_open_rides()
+    print(f"🗺️  Open-ride read model loaded: {len(open_rides)} rides")
+    background_tasks.append(asyncio.create_task(run_reconciliation_loop()))
+
+@app.on_event("startup")
+async def start_helmet_verifier():
+    """Load the reused-photo index, start the verification worker and resubmit pending checks"""
+    await run_in_threadpool(helmet_hashes.catch_up, SessionLocal)
+    print(f"🪖 Helmet photo index loaded: {len(helmet_hashes)} hashes")
+    background_tasks.append(helmet_verifier.start())
+    pending = await run_in_threadpool(helmet.pending_verification_jobs)
+    if pending:
+        print(f"🪖 Resubmitting {len(pending)} pending helmet checks")
+        background_tasks.append(asyncio.create_task(helmet_verifier.resubmit(pending)))
+
+@app.on_event("startup")
+async def start_websocket_heartbeats():
+    """Ping idle WebSocket clients and reap the ones that stopped answering"""
+    background_tasks.append(asyncio.create_task(run_heartbeat_loop()))
+
+@app.on_event("startup")
+async def start_event_bus():
+    """Deliver ride events to WebSocket subscribers and push notifications off the request path"""
+    ride_events.subscribe("websocket", websocket_ride_event)
+    ride_events.subscribe("push", push_ride_event)
+    background_tasks.extend(ride_events.start())
+    # Join request bursts are held per host and sent as digests
+    for digests in (websocket_join_digests, push_join_digests):
+        background_tasks.append(asyncio.create_task(digests.run_loop()))
+
+@app.on_event("startup")
+async def start_ride_tracker():
+    """Resume distance/ETA/off-route tracking of rides that were ongoing before a restart"""
+    await load_ongoing_rides()
+    print(f"🧭 Tracking {len(ride_tracker)} ongoing rides")
+
+@app.on_event("startup")
+async def start_ride_matcher():
+    """Assign batched /api/rides/match requests to open rides"""
+    background_tasks.append(ride_matcher.start())
+
+@app.on_event("startup")
+async def start_trail_store():
+    """Write buffered ride location fixes to the database in batches"""
+    background_tasks.append(asyncio.create_task(trail_store.run_flush_loop()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    image_pipeline.shutdown()
+    helmet_verifier.shutdown()
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
@@ -36,6 +124,7 @@ app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(rides.router, prefix="/api/rides", tags=["Rides"])
 app.include_router(helmet.router, prefix="/api/helmet", tags=["Helmet Verification"])
 app.include_router(websocket.router, prefix="/api", tags=["WebSocket"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 
 @app.get("/")
 async def root():
@@ -0,0 +1,125 @@
+"""PILLION maintenance commands
+
+Run from the backend directory:
+
+    python manage.py gc-helmet-images --dry-run
+    python manage.py gc-helmet-images --grace-hours 24
+    python manage.py export-rides --start 2024-06-01 --end 2024-06-02 --format csv --output rides.csv
+    python manage.py archive-rides --older-than-days 90 --batch-size 500
+    python manage.py rebuild-stats
+"""
+import argparse
+import json
+import sys
+from itertools import chain
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def gc_helmet_images(args):
+    """Remove stored helmet images no helmet check refers to"""
+    from app.database import SessionLocal
+    from app.models import HelmetCheck
+    from app.archive import archived_image_urls, create_archive_tables
+    from app.storage import helmet_store
+
+    create_archive_tables()
+    db = SessionLocal()
+    try:
+        # Archived checks still point at their images
+        urls = chain(
+            (url for (url,) in db.query(HelmetCheck.image_url).execution_options(yield_per=5000)),
+            archived_image_urls()
+        )
+        stats = helmet_store.collect_garbage(
+            urls, grace_seconds=args.grace_hours * 3600, dry_run=args.dry_run
+        )
+    finally:
+        db.close()
+
+    stats["dry_run"] = args.dry_run
+    print(json.dumps(stats))
+
+def export_rides(args):
+    """Stream rides created in [start, end) to a file or stdout"""
+    from app.database import read_router
+    from app.archive import create_archive_tables
+    from app.exports import export_rides as export
+
+    create_archive_tables()
+
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = datetime.fromisoformat(args.start) if args.start else today - timedelta(days=1)
+    end = datetime.fromisoformat(args.end) if args.end else start + timedelta(days=1)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in export(read_router.session, start, end, args.format, args.chunk_size):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+def archive_rides(args):
+    """Move finished rides older than the cutoff into the archive database"""
+    from app.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, archive_finished_rides, count_archivable_rides
+
+    older_than_days = ARCHIVE_AFTER_DAYS if args.older_than_days is None else args.older_than_days
+    if args.dry_run:
+        print(json.dumps({"archivable_rides": count_archivable_rides(older_than_days), "dry_run": True}))
+        return
+    stats = archive_finished_rides(
+        older_than_days=older_than_days,
+        batch_size=args.batch_size or ARCHIVE_BATCH_SIZE,
+        max_batches=args.max_batches,
+        pause_seconds=args.pause_ms / 1000
+    )
+    print(json.dumps(stats))
+
+def rebuild_stats(args):
+    """Recompute per-user stats from the hot and archived ride tables"""
+    from app.database import Base, engine
+    from app.models import UserStats
+    from app.archive import create_archive_tables
+    from app.stats import rebuild_user_stats
+
+    Base.metadata.create_all(bind=engine, tables=[UserStats.__table__])
+    create_archive_tables()
+    print(json.dumps(rebuild_user_stats()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python manage.py", description="PILLION maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gc = commands.add_parser("gc-helmet-images", help="Delete unreferenced helmet images")
+    gc.add_argument("--grace-hours", type=float, default=1.0,
+                    help="Keep unreferenced images younger than this (uploads not yet verified)")
+    gc.add_argument("--dry-run", action="store_true", help="Report what would be deleted")
+    gc.set_defaults(handler=gc_helmet_images)
+
+    export = commands.add_parser("export-rides", help="Export rides with participant counts (NDJSON or CSV)")
+    export.add_argument("--start", help="ISO date/time, inclusive (default: start of yesterday, UTC)")
+    export.add_argument("--end", help="ISO date/time, exclusive (default: one day after --start)")
+    export.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    export.add_argument("--output", help="Write to this file instead of stdout")
+    export.add_argument("--chunk-size", type=int, default=5000, help="Rows per read transaction")
+    export.set_defaults(handler=export_rides)
+
+    archive = commands.add_parser("archive-rides", help="Archive completed/cancelled rides (resumable)")
+    archive.add_argument("--older-than-days", type=float, default=None,
+                         help="Archive rides finished before this many days ago (default: ARCHIVE_AFTER_DAYS)")
+    archive.add_argument("--batch-size", type=int, default=None, help="Rides per batch (default: ARCHIVE_BATCH_SIZE)")
+    archive.add_argument("--max-batches", type=int, help="Stop after this many batches (run again to resume)")
+    archive.add_argument("--pause-ms", type=float, default=0, help="Sleep between batches to yield to live writes")
+    archive.add_argument("--dry-run", action="store_true", help="Only count archivable rides")
+    archive.set_defaults(handler=archive_rides)
+
+    stats = commands.add_parser("rebuild-stats", help="Backfill or rebuild the per-user stats table")
+    stats.set_defaults(handler=rebuild_stats)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -83,6 +83,10 @@ export const WebSocketProvider = ({ children }) => {
     WebSocketService.onMessage('new_ride_request', handler);
   };
 
+  const onRideRequestsDigest = (handler) => {
+    WebSocketService.onMessage('ride_requests_digest', handler);
+  };
+
   const onRideConfirmed = (handler) => {
     WebSocketService.onMessage('ride_confirmed', handler);
   };
@@ -104,6 +108,7 @@ export const WebSocketProvider = ({ children }) => {
     sendEmergencyAlert,
     onRideStatusUpdate,
     onNewRideRequest,
+    onRideRequestsDigest,
     onRideConfirmed,
     onLocationUpdate,
     onEmergencyAlert,
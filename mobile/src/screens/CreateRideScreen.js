@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   View,
   Text,
@@ -12,7 +12,7 @@ import {
 import DateTimePicker from '@react-native-community/datetimepicker';
 import { useAuth } from '../context/AuthContext';
 import { useLocation } from '../context/LocationContext';
-import ApiService from '../services/api';
+import ApiService, { newIdempotencyKey } from '../services/api';
 
 export default function CreateRideScreen({ navigation }) {
   const [title, setTitle] = useState('');
@@ -25,6 +25,8 @@ export default function CreateRideScreen({ navigation }) {
   const [showTimePicker, setShowTimePicker] = useState(false);
   const [loading, setLoading] = useState(false);
   const [currentLocation, setCurrentLocation] = useState(null);
+  // Resubmitting the same form reuses its key, so a retry cannot create a second ride
+  const lastSubmission = useRef(null);
 
   const { getAccessToken } = useAuth();
   const { getCurrentLocation, reverseGeocode } = useLocation();
@@ -114,9 +116,14 @@ export default function CreateRideScreen({ navigation }) {
         max_passengers: parseInt(maxPassengers),
       };
 
-      const result = await ApiService.createRide(rideData, token);
+      const payload = JSON.stringify(rideData);
+      if (lastSubmission.current?.payload !== payload) {
+        lastSubmission.current = { payload, key: newIdempotencyKey() };
+      }
+      const result = await ApiService.createRide(rideData, token, lastSubmission.current.key);
       
       if (result.success) {
+        lastSubmission.current = null;
         Alert.alert(
           'Success',
           'Ride created successfully!',
@@ -92,10 +92,11 @@ export default function HelmetCheckScreen({ navigation, route }) {
         );
         
         if (verifyResult.success) {
-          setVerified(true);
+          // The result arrives as a helmet_verified WebSocket notification
+          setVerified(verifyResult.data.is_verified);
           Alert.alert(
-            'Helmet Verified! ✅',
-            'Your helmet has been verified. You can now start your ride safely.',
+            'Helmet Photo Submitted 🪖',
+            'Your helmet photo is being checked. You will be notified as soon as it is verified.',
             [
               {
                 text: 'Continue',
@@ -1,5 +1,10 @@
 const API_BASE_URL = 'http://localhost:8000/api';
 
+// One key per user action, reused for every retry of it, so the server
+// answers a retry with the original response instead of repeating it
+export const newIdempotencyKey = () =>
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+
 class ApiService {
   constructor() {
     this.baseURL = API_BASE_URL;
@@ -49,16 +54,27 @@ class ApiService {
   }
 
   // Ride endpoints
-  async createRide(rideData, token) {
+  async createRide(rideData, token, idempotencyKey) {
     return this.request('/rides/create', {
       method: 'POST',
       headers: {
         Authorization: `Bearer ${token}`,
+        ...(idempotencyKey && { 'Idempotency-Key': idempotencyKey }),
       },
       body: JSON.stringify(rideData),
     });
   }
 
+  async joinRide(rideId, token, idempotencyKey) {
+    return this.request(`/rides/join/${rideId}`, {
+      method: 'POST',
+      headers: {
+        Authorization: `Bearer ${token}`,
+        ...(idempotencyKey && { 'Idempotency-Key': idempotencyKey }),
+      },
+    });
+  }
+
   async getNearbyRides(locationData, token) {
     return this.request('/rides/nearby', {
       method: 'POST',
@@ -100,6 +100,9 @@ class WebSocketService {
       case 'new_ride_request':
         this.handleNewRideRequest(message);
         break;
+      case 'ride_requests_digest':
+        this.handleRideRequestsDigest(message);
+        break;
       case 'ride_confirmed':
         this.handleRideConfirmed(message);
         break;
@@ -109,6 +112,16 @@ class WebSocketService {
       case 'emergency_alert':
         this.handleEmergencyAlert(message);
         break;
+      case 'helmet_verified':
+        this.handleHelmetVerified(message);
+        break;
+      case 'route_deviation':
+        this.handleRouteDeviation(message);
+        break;
+      case 'ping':
+        // Server heartbeat: connections that stop answering are closed
+        this.sendMessage({ type: 'pong' });
+        break;
       default:
         console.log('Unhandled message type:', type);
     }
@@ -136,6 +149,18 @@ class WebSocketService {
     );
   }
 
+  handleRideRequestsDigest(message) {
+    const { ride_id, count, requesters } = message;
+    console.log(`👋 ${count} new ride requests for ride ${ride_id}`);
+    
+    const names = requesters.slice(0, 3).map(requester => requester.full_name);
+    const others = count - names.length;
+    this.showNotification(
+      `${count} New Ride Requests`,
+      `${names.join(', ')}${others > 0 ? ` and ${others} more` : ''} want to join your ride`
+    );
+  }
+
   handleRideConfirmed(message) {
     const { ride_id, confirmed_riders } = message;
     console.log(`✅ Ride ${ride_id} confirmed with ${confirmed_riders.length} riders`);
@@ -167,6 +192,31 @@ class WebSocketService {
     );
   }
 
+  handleRouteDeviation(message) {
+    const { ride_id, off_route, distance_from_route_m } = message;
+    console.log(`🧭 Ride ${ride_id} ${off_route ? `is ${distance_from_route_m} m off route` : 'is back on route'}`);
+    
+    if (off_route) {
+      this.showNotification(
+        '⚠️ Off Route',
+        `Your ride is ${distance_from_route_m} m away from its route. Stay alert!`,
+        true // high priority
+      );
+    }
+  }
+
+  handleHelmetVerified(message) {
+    const { ride_id, is_verified, reason } = message;
+    console.log(`🪖 Helmet check for ride ${ride_id}: ${is_verified ? 'verified' : reason}`);
+    
+    this.showNotification(
+      is_verified ? 'Helmet Verified! ✅' : 'Helmet Check Failed ❌',
+      is_verified
+        ? 'Your helmet has been verified. You can now start your ride safely.'
+        : `Please retake the photo (${reason}).`
+    );
+  }
+
   // Public methods
   subscribeToRide(rideId) {
     if (!this.isConnected) {